@@ -0,0 +1,239 @@
+"""
+Admission control for the expensive auth routes.
+
+Login and register spend a bcrypt job and Mongo lookups per request, and
+the OAuth callback makes two calls to Google. A burst of them (credential
+stuffing, everyone re-logging in after a deploy) must not take the event
+loop and the pools away from the catalog routes, so each of these routes
+passes through a Policy:
+
+  1. token buckets per client IP and per (email, client IP) -> 429 when
+     empty. The account bucket is keyed with the address too, so bad
+     attempts for someone's email from elsewhere never lock them out;
+     guessing one account from many addresses still meets the IP buckets
+  2. a concurrency limit with a short FIFO queue -> 503 when the queue is
+     full, when the expected wait already exceeds the queue deadline, or
+     when the deadline passes while waiting
+
+Both answers carry Retry-After. Rejections happen before any expensive
+work, and are counted on /metrics (admission_shed_total).
+
+Limits are per worker process. Behind a proxy, run uvicorn with
+--proxy-headers/--forwarded-allow-ips so the client IP is the real one.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from metrics import ADMISSION_SHED, CallbackGauge
+
+# Buckets kept per limiter; the least recently seen keys are dropped (and start full again)
+ADMISSION_MAX_KEYS = int(os.environ.get("ADMISSION_MAX_KEYS", "100000"))
+
+_policies: List["Policy"] = []
+
+
+class Shed(HTTPException):
+    """Request refused before doing any work; the client should retry after `retry_after` seconds"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(status_code=status_code, detail=detail,
+                         headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+class RateLimiter:
+    """Token bucket per key: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = ADMISSION_MAX_KEYS):
+        self._rate = rate
+        self._burst = burst
+        self._max_keys = max_keys
+        # key -> (tokens, updated_at)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str) -> float:
+        """0 if a token was taken, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self._burst, now))
+        tokens = min(self._burst, tokens + (now - updated_at) * self._rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self._rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` holders; up to `max_queue` more wait in FIFO order for
+    at most `queue_timeout` seconds. A newcomer whose expected wait (queue
+    position x average hold time / limit) exceeds the deadline is turned
+    away at once instead of timing out later.
+    """
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float):
+        self._limit = limit
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long a slot is held, for the expected-wait estimate
+        self._hold = 0.0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def expected_wait(self) -> float:
+        """Seconds the current queue should take to drain"""
+        return (len(self._waiters) + 1) * self._hold / self._limit
+
+    async def acquire(self) -> Optional[str]:
+        """None once a slot is held, else why the request was shed"""
+        if self._active < self._limit and not self._waiters:
+            self._active += 1
+            return None
+        if len(self._waiters) >= self._max_queue:
+            return "queue_full"
+        if self.expected_wait > self._queue_timeout:
+            return "deadline"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self._queue_timeout)
+            return None
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # Client went away just as a slot was handed to it; pass the slot on
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, held: float):
+        self._hold = held if self._hold == 0 else 0.8 * self._hold + 0.2 * held
+        self._hand_over()
+
+    def _hand_over(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight over, so a newcomer cannot jump the queue
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self._limit,
+            "active": self._active,
+            "queued": len(self._waiters),
+            "max_queue": self._max_queue,
+            "queue_timeout_ms": round(self._queue_timeout * 1000),
+            "avg_hold_ms": round(self._hold * 1000, 3),
+        }
+
+
+class Policy:
+    """Rate limits and a concurrency limit for one route; a rate of 0 turns that bucket off"""
+
+    def __init__(self, route: str, max_concurrent: int, max_queue: int, queue_timeout: float,
+                 ip_rate: float = 0, ip_burst: float = 1, email_rate: float = 0, email_burst: float = 1):
+        self.route = route
+        self.concurrency = ConcurrencyLimiter(max_concurrent, max_queue, queue_timeout)
+        self.per_ip = RateLimiter(ip_rate, ip_burst) if ip_rate > 0 else None
+        # Keyed by email and client IP, see the module docstring
+        self.per_email = RateLimiter(email_rate, email_burst) if email_rate > 0 else None
+        self.admitted = 0
+        self.shed: Dict[str, int] = {}
+        _policies.append(self)
+
+    def _shed(self, reason: str, status_code: int, detail: str, retry_after: float) -> Shed:
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        ADMISSION_SHED.inc(self.route, reason)
+        return Shed(status_code, detail, retry_after)
+
+    @asynccontextmanager
+    async def admit(self, request: Request, email: Optional[str] = None):
+        """Holds a slot for the body of the `async with`; raises Shed instead of admitting"""
+        ip = request.client.host if request.client else "unknown"
+        if self.per_ip is not None:
+            wait = self.per_ip.take(ip)
+            if wait:
+                raise self._shed("rate_ip", 429, "Too many requests from this address", wait)
+        if self.per_email is not None and email:
+            wait = self.per_email.take(f"{email.strip().lower()}|{ip}")
+            if wait:
+                raise self._shed("rate_email", 429, "Too many attempts for this account from this address", wait)
+        reason = await self.concurrency.acquire()
+        if reason is not None:
+            raise self._shed(reason, 503, "Server busy, try again shortly", self.concurrency.expected_wait)
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.concurrency.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "concurrency": self.concurrency.stats(),
+            "tracked_ips": len(self.per_ip) if self.per_ip else 0,
+            "tracked_emails": len(self.per_email) if self.per_email else 0,
+        }
+
+
+def policy_from_env(route: str, prefix: str, max_concurrent: int, max_queue: int, queue_timeout_ms: float,
+                    ip_rate: float = 0, ip_burst: float = 1, email_rate: float = 0, email_burst: float = 1) -> Policy:
+    """
+    Policy whose defaults can be overridden by <PREFIX>_{MAX_CONCURRENT,
+    MAX_QUEUE,QUEUE_TIMEOUT_MS,IP_RATE,IP_BURST,EMAIL_RATE,EMAIL_BURST},
+    e.g. LOGIN_IP_RATE=2 (tokens per second).
+    """
+    def env(name: str, default: float) -> float:
+        return float(os.environ.get(f"{prefix}_{name}", str(default)))
+
+    return Policy(
+        route,
+        max_concurrent=int(env("MAX_CONCURRENT", max_concurrent)),
+        max_queue=int(env("MAX_QUEUE", max_queue)),
+        queue_timeout=env("QUEUE_TIMEOUT_MS", queue_timeout_ms) / 1000,
+        ip_rate=env("IP_RATE", ip_rate),
+        ip_burst=env("IP_BURST", ip_burst),
+        email_rate=env("EMAIL_RATE", email_rate),
+        email_burst=env("EMAIL_BURST", email_burst),
+    )
+
+
+def stats() -> Dict[str, object]:
+    return {policy.route: policy.stats() for policy in _policies}
+
+
+CallbackGauge("admission_active", "Requests holding an admission slot", ("route",),
+              lambda: {(p.route,): p.concurrency.active for p in _policies})
+CallbackGauge("admission_queued", "Requests waiting for an admission slot", ("route",),
+              lambda: {(p.route,): p.concurrency.queued for p in _policies})
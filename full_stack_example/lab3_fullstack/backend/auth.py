@@ -1,20 +1,81 @@
 import os
+import time
 import httpx
 from urllib.parse import urlencode
 
+from metrics import OAUTH_REQUEST_DURATION
+
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # Store OAuth credentials
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 SECRET_KEY = os.getenv("SECRET_KEY")
 
-# Google OAuth endpoints
+# Google OAuth endpoints; token/userinfo can point at a local stub for load tests
 GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/auth"
-GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
-GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+GOOGLE_TOKEN_URL = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+GOOGLE_USERINFO_URL = os.getenv("GOOGLE_USERINFO_URL", "https://www.googleapis.com/oauth2/v2/userinfo")
+
+# Outbound HTTP client tuning
+OAUTH_HTTP_TIMEOUT = float(os.getenv("OAUTH_HTTP_TIMEOUT", "10"))
+OAUTH_HTTP_CONNECT_TIMEOUT = float(os.getenv("OAUTH_HTTP_CONNECT_TIMEOUT", "5"))
+OAUTH_HTTP_MAX_CONNECTIONS = int(os.getenv("OAUTH_HTTP_MAX_CONNECTIONS", "100"))
+OAUTH_HTTP_MAX_KEEPALIVE = int(os.getenv("OAUTH_HTTP_MAX_KEEPALIVE", "20"))
+OAUTH_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OAUTH_HTTP_KEEPALIVE_EXPIRY", "30"))
 
 # OAuth scopes
 GOOGLE_SCOPES = ["openid", "email", "profile"]
 
+# App-lifetime client so OAuth callbacks reuse warm keep-alive connections
+_http_client: httpx.AsyncClient | None = None
+
+def _build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(OAUTH_HTTP_TIMEOUT, connect=OAUTH_HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=OAUTH_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=OAUTH_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=OAUTH_HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+async def open_http_client():
+    """Create the shared OAuth HTTP client (call on app startup)"""
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+
+async def close_http_client():
+    """Close the shared OAuth HTTP client (call on app shutdown)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def _client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        # Not started through the app lifecycle (e.g. scripts); open lazily
+        _http_client = _build_http_client()
+    return _http_client
+
+async def _timed(call: str, request) -> httpx.Response:
+    """Await an outbound request, recording its latency and outcome"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await request
+        outcome = str(response.status_code)
+        return response
+    finally:
+        OAUTH_REQUEST_DURATION.observe(time.perf_counter() - started, call, outcome)
+
 def create_google_auth_url(redirect_uri, state=None):
     """Create Google OAuth authorization URL"""
     
@@ -44,36 +105,34 @@ async def exchange_code_for_token(code, redirect_uri):
     if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
         raise ValueError("Google OAuth credentials not properly configured")
     
-    async with httpx.AsyncClient() as client:
-        data = {
-            'client_id': GOOGLE_CLIENT_ID,
-            'client_secret': GOOGLE_CLIENT_SECRET,
-            'code': code,
-            'grant_type': 'authorization_code',
-            'redirect_uri': redirect_uri
-        }
-        
-        try:
-            response = await client.post(GOOGLE_TOKEN_URL, data=data)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPError as e:
-            print(f"Token exchange error: {e}")
-            if hasattr(e, 'response') and e.response:
-                print(f"Response content: {e.response.text}")
-            raise
+    data = {
+        'client_id': GOOGLE_CLIENT_ID,
+        'client_secret': GOOGLE_CLIENT_SECRET,
+        'code': code,
+        'grant_type': 'authorization_code',
+        'redirect_uri': redirect_uri
+    }
+    
+    try:
+        response = await _timed("token", _client().post(GOOGLE_TOKEN_URL, data=data))
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        print(f"Token exchange error: {e}")
+        if hasattr(e, 'response') and e.response:
+            print(f"Response content: {e.response.text}")
+        raise
 
 async def get_user_info(access_token):
     """Get user information from Google"""
-    async with httpx.AsyncClient() as client:
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
-        try:
-            response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPError as e:
-            print(f"User info error: {e}")
-            if hasattr(e, 'response') and e.response:
-                print(f"Response content: {e.response.text}")
-            raise
\ No newline at end of file
+    headers = {'Authorization': f'Bearer {access_token}'}
+    
+    try:
+        response = await _timed("userinfo", _client().get(GOOGLE_USERINFO_URL, headers=headers))
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        print(f"User info error: {e}")
+        if hasattr(e, 'response') and e.response:
+            print(f"Response content: {e.response.text}")
+        raise
\ No newline at end of file
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Bytes on the wire and CPU per response for the list formats: JSON (stdlib,
+as the default response path renders it), orjson (FAST_JSON) and MessagePack,
+each sent as is, gzip'd and brotli'd with the same compressors and levels the
+CompressionMiddleware uses. Payloads are canned book and profile rows shaped
+like the real list responses. CPU is process time, serialize and compress
+measured separately.
+
+    cd backend && python -m benchmarks.bench_formats [--sizes 100,1000,10000] [--repeat 20]
+"""
+import argparse
+import json
+import time
+
+import msgpack
+import orjson
+from bson import ObjectId
+
+import compression
+
+_GENRES = ["jazz", "rock", "blues", "funk", "metal", "folk", "soul", "pop"]
+
+
+def book_rows(n: int):
+    return [
+        {"id": str(ObjectId()), "title": f"Book {i}", "author": f"Author {i % 500}", "year": 1900 + i % 120,
+         **({"genre": _GENRES[i % 8]} if i % 3 == 0 else {})}
+        for i in range(n)
+    ]
+
+
+def profile_rows(n: int):
+    return [
+        {"user_id": f"user-{i}", "name": f"Player {i}", "instrument": ["guitar", "bass", "drums", "keys"][i % 4],
+         "experience": ["beginner", "intermediate", "advanced"][i % 3], "goal": ["jam", "band", "gig"][i % 3],
+         "genres": _GENRES[i % 5:i % 5 + 3], "gear": [f"amp-{i % 40}", f"pedal-{i % 90}"]}
+        for i in range(n)
+    ]
+
+
+SERIALIZERS = {
+    "json": lambda rows: json.dumps(rows).encode(),
+    "orjson": orjson.dumps,
+    "msgpack": msgpack.packb,
+}
+
+ENCODINGS = ["identity", "gzip"] + (["br"] if compression.BROTLI_AVAILABLE else [])
+
+
+def _cpu(fn, repeat: int):
+    started = time.process_time()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.process_time() - started) / repeat
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    codec = compression.compressor(encoding)
+    return codec.compress(body) + codec.finish()
+
+
+def run(sizes, repeat):
+    results = []
+    for payload, make in (("books", book_rows), ("profiles", profile_rows)):
+        for n in sizes:
+            rows = make(n)
+            for fmt, serialize in SERIALIZERS.items():
+                body, serialize_s = _cpu(lambda: serialize(rows), repeat)
+                for encoding in ENCODINGS:
+                    if encoding == "identity":
+                        wire, compress_s = body, 0.0
+                    else:
+                        wire, compress_s = _cpu(lambda: _compress(encoding, body), repeat)
+                    row = {
+                        "payload": payload, "size": n, "format": fmt, "encoding": encoding,
+                        "bytes": len(wire), "serialize_ms": round(serialize_s * 1000, 3),
+                        "compress_ms": round(compress_s * 1000, 3),
+                    }
+                    results.append(row)
+                    print(f"{payload:>8} {n:>6}  {fmt:>7} {encoding:>8}  {row['bytes']:>10} B  "
+                          f"serialize {row['serialize_ms']:>8.3f} ms  compress {row['compress_ms']:>8.3f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=20, help="runs averaged per measurement")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = run([int(s) for s in args.sizes.split(",")], args.repeat)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for GET /books: default response path (BookOut validation,
+response_model re-validation, stdlib json) vs the FAST_JSON path (trusted
+dicts + orjson). Runs the real app in-process with the repository swapped
+for one that hands back N canned docs, so only the response path is measured.
+
+    cd backend && python -m benchmarks.bench_list_json [--seconds 2] [--sizes 10,100,1000,10000,100000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bson import ObjectId
+
+os.environ.setdefault("BOOKS_PAGE_MAX", "1000000")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from managers.books_manager import BooksManager  # noqa: E402
+
+
+class CannedRepository:
+    def __init__(self, n: int):
+        self._docs = [
+            {"_id": ObjectId(), "title": f"Book {i}", "author": f"Author {i % 500}", "year": 1900 + i % 120,
+             "genre": None if i % 3 else "jazz"}
+            for i in range(n)
+        ]
+
+    async def find_page(self, filters=None, after=None, limit=100):
+        return self._docs[:limit]
+
+
+async def _measure(client: httpx.AsyncClient, n: int, seconds: float) -> float:
+    url = f"/books?limit={n}"
+    await client.get(url)  # warm-up
+    count = 0
+    started = time.perf_counter()
+    while count < 3 or time.perf_counter() - started < seconds:
+        r = await client.get(url)
+        assert r.status_code == 200, r.text
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+async def run(sizes, seconds):
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for n in sizes:
+            books = BooksManager("mongodb://unused", "bench", "books")
+            books._repo = CannedRepository(n)
+            main.books = books
+            row = {"size": n}
+            for mode, fast in (("default", False), ("fast_json", True)):
+                main.FAST_JSON = fast
+                row[mode] = round(await _measure(client, n, seconds), 2)
+            row["speedup"] = round(row["fast_json"] / row["default"], 2)
+            results.append(row)
+            print(f"{n:>7} docs  default {row['default']:>9.2f} req/s  fast_json {row['fast_json']:>9.2f} req/s  x{row['speedup']}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent per size and mode")
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run([int(s) for s in args.sizes.split(",")], args.seconds))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
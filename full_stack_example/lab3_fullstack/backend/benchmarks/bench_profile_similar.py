@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the profile similarity index behind
+GET /profiles/{user_id}/similar: build time and per-query latency for
+synthetic catalogs of N profiles, straight against ProfileMatcher.
+
+    cd backend && python -m benchmarks.bench_profile_similar [--sizes 10000,100000,300000] [--queries 200] [--k 10]
+"""
+import argparse
+import json
+import random
+import time
+
+from managers.profile_matcher import ProfileMatcher
+
+INSTRUMENTS = ["guitar", "bass", "drums", "piano", "vocals", "violin", "sax", "trumpet", "cello", "synth"]
+LEVELS = ["beginner", "intermediate", "advanced", "pro"]
+GOALS = ["fun", "band", "gig", "record", "teach", "compose"]
+GENRES = [f"genre-{i}" for i in range(40)]
+GEAR = [f"gear-{i}" for i in range(60)]
+
+
+def _profile(i: int, rng: random.Random):
+    return {
+        "user_id": f"user-{i}",
+        "name": f"User {i}",
+        "instrument": rng.choice(INSTRUMENTS),
+        "experience": rng.choice(LEVELS),
+        "goal": rng.choice(GOALS),
+        "genres": rng.sample(GENRES, rng.randint(1, 5)),
+        "gear": rng.sample(GEAR, rng.randint(0, 4)),
+    }
+
+
+def run(n: int, queries: int, k: int, metric: str):
+    rng = random.Random(n)
+    profiles = [_profile(i, rng) for i in range(n)]
+    matcher = ProfileMatcher()
+    started = time.perf_counter()
+    matcher.add_many(profiles)
+    build_s = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(queries):
+        user_id = f"user-{rng.randrange(n)}"
+        started = time.perf_counter()
+        matcher.similar(user_id, k, metric)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "profiles": n,
+        "features": matcher.stats()["features"],
+        "matrix_bytes": matcher.stats()["matrix_bytes"],
+        "build_ms": round(build_s * 1000, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,300000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--metric", default="cosine", choices=["cosine", "jaccard"])
+    args = parser.parse_args()
+    results = [run(int(n), args.queries, args.k, args.metric) for n in args.sizes.split(",")]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the API. Drives concurrent scenarios and prints
+machine-readable JSON (p50/p95/p99 latency, RPS, errors per scenario) so
+runs can be diffed between commits.
+
+Targets:
+    # app in-process over ASGI, against the in-memory stand-in (default)
+    python -m benchmarks.loadtest
+    # app in-process against a real mongod
+    python -m benchmarks.loadtest --mongo-uri mongodb://localhost:27017
+    # app under uvicorn with N workers (memory:// needs --workers 1)
+    python -m benchmarks.loadtest --workers 4 --mongo-uri mongodb://localhost:27017
+    # an already running server
+    python -m benchmarks.loadtest --url http://localhost:8000
+
+Common options: --scenarios list,get,create,update,login,register
+--concurrency 32 --duration 10 --seed-books 1000 --out results.json
+
+Requests come from --client-ips distinct addresses (sent as X-Forwarded-For)
+and logins spread over --accounts users, so the per-IP and per-email
+admission buckets see a realistic spread of keys and the 429s in the status
+breakdown are the ones real traffic would get. The booted targets trust
+the header; a --url server only does with uvicorn --proxy-headers
+--forwarded-allow-ips. --client-ips 1 --accounts 1 replays a single abusive
+client.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+SCENARIOS = ["list", "get", "create", "update", "login", "register"]
+LOGIN_PASSWORD = "loadtest-password"
+
+
+# ---------- Scenarios ----------
+# Each takes the client and the seeded state and issues exactly one request.
+
+async def scenario_list(client: httpx.AsyncClient, state: Dict[str, Any]) -> httpx.Response:
+    return await client.get("/books", params={"limit": state["page_size"]})
+
+
+async def scenario_get(client, state):
+    return await client.get(f"/books/{random.choice(state['book_ids'])}")
+
+
+async def scenario_create(client, state):
+    return await client.post("/books", json=_book(random.randrange(1_000_000)))
+
+
+async def scenario_update(client, state):
+    return await client.put(f"/books/{random.choice(state['book_ids'])}", json={"year": random.randint(1900, 2024)})
+
+
+async def scenario_login(client, state):
+    return await client.post("/api/login", json={"email": random.choice(state["emails"]), "password": LOGIN_PASSWORD})
+
+
+async def scenario_register(client, state):
+    email = f"lt-{uuid.uuid4().hex}@example.com"
+    return await client.post("/api/register", json={"email": email, "password": LOGIN_PASSWORD, "name": "Load Test"})
+
+
+RUNNERS: Dict[str, Callable[[httpx.AsyncClient, Dict[str, Any]], Awaitable[httpx.Response]]] = {
+    "list": scenario_list,
+    "get": scenario_get,
+    "create": scenario_create,
+    "update": scenario_update,
+    "login": scenario_login,
+    "register": scenario_register,
+}
+
+
+def _book(i: int) -> Dict[str, Any]:
+    return {"title": f"Load Test Book {i}", "author": f"Author {i % 200}", "year": 1900 + i % 120,
+            "genre": random.choice(["rock", "jazz", "classical", "pop"])}
+
+
+# ---------- Measurement ----------
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, statuses: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    lat = sorted(latencies)
+    ms = lambda s: round(s * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(lat),
+        "errors": errors,
+        "statuses": dict(sorted(statuses.items())),
+        "rps": round(len(lat) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": ms(sum(lat) / len(lat)) if lat else 0.0,
+        "p50_ms": ms(_percentile(lat, 50)),
+        "p95_ms": ms(_percentile(lat, 95)),
+        "p99_ms": ms(_percentile(lat, 99)),
+        "max_ms": ms(lat[-1]) if lat else 0.0,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, state: Dict[str, Any],
+                       concurrency: int, duration: float) -> Dict[str, Any]:
+    runner = RUNNERS[name]
+    latencies: List[float] = []
+    errors = 0
+    statuses: Dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await runner(client, state)
+                status = str(response.status_code)
+                failed = response.status_code >= 400
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+                failed = True
+            statuses[status] = statuses.get(status, 0) + 1
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, statuses, time.perf_counter() - started)
+
+
+async def seed(client: httpx.AsyncClient, n_books: int, page_size: int, n_accounts: int) -> Dict[str, Any]:
+    """Load a catalog through the bulk endpoint and register the login users"""
+    response = await client.post("/books/bulk", json=[_book(i) for i in range(n_books)])
+    response.raise_for_status()
+    ids: List[str] = []
+    after = None
+    while len(ids) < n_books:
+        params = {"limit": 1000, **({"after": after} if after else {})}
+        page = await client.get("/books", params=params)
+        page.raise_for_status()
+        ids.extend(b["id"] for b in page.json())
+        after = page.headers.get("x-next-after")
+        if not after:
+            break
+
+    emails = [f"lt-login-{uuid.uuid4().hex}@example.com" for _ in range(n_accounts)]
+    for email in emails:
+        response = await client.post("/api/register", json={"email": email, "password": LOGIN_PASSWORD, "name": "Load Test"})
+        response.raise_for_status()
+    return {"book_ids": ids, "emails": emails, "page_size": page_size}
+
+
+def _client_ips(n: int) -> Callable[[httpx.Request], Awaitable[None]]:
+    """Request hook sending each request from one of n addresses in 10.0.0.0/8"""
+    pool = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(1, n + 1)]
+
+    async def hook(request: httpx.Request):
+        request.headers["X-Forwarded-For"] = random.choice(pool)
+    return hook
+
+
+# ---------- Targets ----------
+
+def worker_app():
+    """uvicorn --factory entry point: the app, pointed at LOADTEST_MONGO_URI"""
+    import main
+    main.MONGO_URI = os.environ["LOADTEST_MONGO_URI"]
+    return main.app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout: float = 60.0):
+    """Until /ready says the pool, indexes and matcher are warm, so cold-start cost stays out of the numbers"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {client.base_url} did not become ready within {timeout}s")
+
+
+async def main_async(args) -> Dict[str, Any]:
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    server = None
+    app = None
+    if args.url:
+        target = args.url
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    elif args.workers:
+        if args.mongo_uri.startswith("memory://") and args.workers > 1:
+            raise SystemExit("memory:// is per-process; use --workers 1 or a mongod URI")
+        port = _free_port()
+        target = f"uvicorn x{args.workers} on :{port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "benchmarks.loadtest:worker_app", "--factory",
+             "--workers", str(args.workers), "--port", str(port), "--log-level", "warning",
+             "--proxy-headers", "--forwarded-allow-ips", "*"],
+            env={**os.environ, "LOADTEST_MONGO_URI": args.mongo_uri},
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        client = httpx.AsyncClient(base_url=base_url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+        await _wait_ready(client)
+    else:
+        import main
+        main.MONGO_URI = args.mongo_uri
+        app = main.app
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        target = "in-process"
+        # What uvicorn --proxy-headers does, so X-Forwarded-For becomes the client address
+        transport = httpx.ASGITransport(app=ProxyHeadersMiddleware(app, trusted_hosts="*"))
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout)
+        await _wait_ready(client)
+
+    client.event_hooks["request"].append(_client_ips(args.client_ips))
+    try:
+        state = await seed(client, args.seed_books, args.page_size, args.accounts)
+        results = {}
+        for name in scenarios:
+            results[name] = await run_scenario(client, name, state, args.concurrency, args.duration)
+            print(f"{name:>9}: {results[name]['rps']:>9.2f} req/s  p50 {results[name]['p50_ms']:.2f} ms  "
+                  f"p99 {results[name]['p99_ms']:.2f} ms  errors {results[name]['errors']}", file=sys.stderr)
+    finally:
+        await client.aclose()
+        if app is not None:
+            await lifespan.__aexit__(None, None, None)
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "target": target,
+            "mongo_uri": None if args.url else args.mongo_uri,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "seed_books": args.seed_books,
+            "page_size": args.page_size,
+            "client_ips": args.client_ips,
+            "accounts": args.accounts,
+        },
+        "scenarios": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="drive an already running server instead of booting the app")
+    parser.add_argument("--workers", type=int, default=0, help="boot the app under uvicorn with N workers")
+    parser.add_argument("--mongo-uri", default="memory://", help="memory:// for the in-process stand-in")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--seed-books", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100, help="limit used by the list scenario")
+    parser.add_argument("--client-ips", type=int, default=1000, help="distinct client addresses requests come from")
+    parser.add_argument("--accounts", type=int, default=100, help="users the login scenario spreads over")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,177 @@
+"""
+Streaming gzip/brotli compression of response bodies.
+
+The encoding comes from Accept-Encoding (brotli preferred on a tie, when
+the `brotli` package is installed). Bodies are compressed chunk by chunk
+as the app sends them, so streamed NDJSON and large list pages are never
+buffered whole. A streamed body is flushed to the client at least every
+COMPRESS_FLUSH_BYTES of input, so it keeps arriving while it is produced.
+
+Skipped for bodies under COMPRESS_MIN_SIZE (single-chunk responses only;
+a stream's length is not known up front), for media types that do not
+compress and for responses that already carry a Content-Encoding.
+Compressed responses turn a strong ETag weak: the bytes differ from the
+identity body, and the routes compare If-None-Match weakly anyway.
+"""
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+
+from metrics import COMPRESSION_BYTES
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Below this many bytes the headers and CPU cost more than compression saves
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+# zlib level 1-9 and brotli quality 0-11; brotli CPU climbs steeply above ~5 for little gain
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+COMPRESS_FLUSH_BYTES = int(os.environ.get("COMPRESS_FLUSH_BYTES", "65536"))
+
+_COMPRESSIBLE = ("application/json", "application/x-ndjson", "application/msgpack", "text/")
+
+
+class _Gzip:
+    def __init__(self, level: int = GZIP_LEVEL):
+        # wbits=31: gzip container, as Content-Encoding: gzip requires
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int = BROTLI_QUALITY):
+        self._b = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._b.process(data)
+
+    def flush(self) -> bytes:
+        return self._b.flush()
+
+    def finish(self) -> bytes:
+        return self._b.finish()
+
+
+def compressor(encoding: str):
+    """Fresh streaming compressor for "gzip" or "br", at the configured level"""
+    return _Brotli() if encoding == "br" else _Gzip()
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """"br", "gzip" or None (identity) for an Accept-Encoding header"""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        coding, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.strip()] = q
+    wildcard = weights.get("*", 0.0)
+    candidates = [("gzip", weights.get("gzip", wildcard))]
+    if BROTLI_AVAILABLE:
+        candidates.insert(0, ("br", weights.get("br", wildcard)))
+    coding, q = max(candidates, key=lambda c: c[1])
+    return coding if q > 0 else None
+
+
+class CompressionMiddleware:
+    """Plain ASGI, so a streamed body goes out chunk by chunk instead of being collected first"""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE, flush_bytes: int = COMPRESS_FLUSH_BYTES):
+        self.app = app
+        self._minimum_size = minimum_size
+        self._flush_bytes = flush_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+        codec = None
+        unflushed = 0
+        size_in = size_out = 0
+
+        async def send_compressed(message):
+            nonlocal start, passthrough, codec, unflushed, size_in, size_out
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=list(message.get("headers", [])))
+                media_type = headers.get("content-type", "")
+                if (message["status"] in (204, 304) or "content-encoding" in headers
+                        or not media_type.startswith(_COMPRESSIBLE)):
+                    passthrough = True
+                    await send(message)
+                    return
+                # Hold the start until the first chunk decides whether to compress
+                headers.add_vary_header("Accept-Encoding")
+                start = {**message, "headers": headers.raw}
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if codec is None:
+                if not more_body and len(body) < self._minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                del headers["content-length"]
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                codec = compressor(encoding)
+                await send(start)
+
+            out = codec.compress(body)
+            size_in += len(body)
+            unflushed += len(body)
+            if not more_body:
+                out += codec.finish()
+            elif unflushed >= self._flush_bytes:
+                out += codec.flush()
+                unflushed = 0
+            size_out += len(out)
+            if out or not more_body:
+                await send({"type": "http.response.body", "body": out, "more_body": more_body})
+            if not more_body:
+                COMPRESSION_BYTES.inc(encoding, "in", amount=size_in)
+                COMPRESSION_BYTES.inc(encoding, "out", amount=size_out)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,42 @@
+"""Fixtures shared by the test_*.py modules"""
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import databases.registry as registry_module
+import main
+from databases.registry import registry
+
+
+@pytest.fixture
+def app_settings():
+    """main.py settings to override for the app under test; modules override this fixture"""
+    return {}
+
+
+@pytest.fixture
+def client(monkeypatch, app_settings):
+    """The app on a fresh in-memory store, once /ready says it is warm"""
+    monkeypatch.setattr(main, "MONGO_URI", f"memory://{uuid.uuid4().hex}")
+    for name, value in app_settings.items():
+        monkeypatch.setattr(main, name, value)
+    with TestClient(main.app) as client:
+        for _ in range(100):
+            if client.get("/ready").status_code == 200:
+                break
+            time.sleep(0.05)
+        yield client
+
+
+@pytest.fixture
+def sqlite_registry(monkeypatch, tmp_path):
+    """
+    Point the shared registry at a fresh SQLite file, for offline jobs that open
+    their store through it and close it when done. Returns the URI to pass them.
+    """
+    monkeypatch.setattr(registry, "backend", "sqlite")
+    monkeypatch.setattr(registry_module, "SQLITE_PATH", str(tmp_path / "store.db"))
+    yield "mongodb://unused"
+    registry.close()
@@ -0,0 +1,53 @@
+"""
+The storage surface the managers and repositories rely on.
+
+This is the subset of the Motor collection API the app actually calls,
+written down as Protocols so alternative engines (databases/memory.py,
+databases/sqlite.py) can be checked against it. Motor's own
+AsyncIOMotorCollection satisfies it as is.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Protocol
+
+
+class Cursor(Protocol):
+    def sort(self, key_or_list: Any, direction: int = 1) -> "Cursor": ...
+
+    def skip(self, n: int) -> "Cursor": ...
+
+    def limit(self, n: int) -> "Cursor": ...
+
+    def batch_size(self, n: int) -> "Cursor": ...
+
+    def __aiter__(self) -> Any: ...
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]: ...
+
+    async def explain(self) -> Dict[str, Any]: ...
+
+
+class CollectionBackend(Protocol):
+    name: str
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs) -> Cursor: ...
+
+    async def find_one(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs) -> Optional[Dict[str, Any]]: ...
+
+    async def count_documents(self, filter: Dict[str, Any], **kwargs) -> int: ...
+
+    async def insert_one(self, document: Dict[str, Any], **kwargs) -> Any: ...
+
+    async def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> Any: ...
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> Any: ...
+
+    async def find_one_and_update(self, filter: Dict[str, Any], update: Dict[str, Any], **kwargs) -> Optional[Dict[str, Any]]: ...
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs) -> Any: ...
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> Any: ...
+
+    async def create_indexes(self, indexes: List[Any], **kwargs) -> List[str]: ...
+
+    async def drop_index(self, index_or_name: Any, **kwargs) -> None: ...
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs) -> Any: ...
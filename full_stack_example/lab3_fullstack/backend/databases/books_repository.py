@@ -1,11 +1,65 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 from bson import ObjectId
-from databases.mongo import Mongo, to_object_id
+from pymongo.errors import WriteError
+from databases.mongo import Mongo, _serialize, to_object_id
+from databases.single_flight import SingleFlight
+from models.books_model import BookFilter
+
+# Only the fields BookOut needs leave the server
+BOOK_PROJECTION = {"title": 1, "author": 1, "year": 1, "genre": 1}
+
+
+def _copy_doc(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return dict(doc) if doc is not None else None
+
+
+def _copy_docs(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [dict(d) for d in docs]
+
+
+SORT_FIELDS = {"id": "_id", "title": "title", "author": "author", "year": "year", "genre": "genre"}
+
+
+def build_query(f: BookFilter) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    if f.author:
+        query["author"] = f.author
+    if f.genre:
+        query["genre"] = f.genre
+    if f.year_min is not None or f.year_max is not None:
+        query["year"] = {}
+        if f.year_min is not None:
+            query["year"]["$gte"] = f.year_min
+        if f.year_max is not None:
+            query["year"]["$lte"] = f.year_max
+    if f.q:
+        query["$text"] = {"$search": f.q}
+    return query
+
+
+def build_sort(f: BookFilter) -> List[Tuple[str, Any]]:
+    """Raises ValueError for a sort the API doesn't offer"""
+    if f.sort == "relevance":
+        if not f.q:
+            raise ValueError("sort=relevance needs q")
+        return [("score", {"$meta": "textScore"}), ("_id", 1)]
+    direction = -1 if f.sort.startswith("-") else 1
+    field = SORT_FIELDS.get(f.sort.lstrip("-"))
+    if field is None:
+        raise ValueError(f"Cannot sort by '{f.sort}'")
+    # _id breaks ties so pages are stable
+    return [(field, direction)] if field == "_id" else [(field, direction), ("_id", 1)]
 
 
 class BooksRepository:
     def __init__(self, uri: str, db_name: str, collection: str):
         self._mongo = Mongo(uri, db_name, collection)
+        # Identical concurrent reads share one query; every write detaches the in-flight ones
+        self.flights = SingleFlight(collection)
+
+    @property
+    def collection(self):
+        return self._mongo.collection
 
     async def connect(self):
         await self._mongo.connect()
@@ -15,19 +69,80 @@ class BooksRepository:
 
     # --- CRUD (raw DB dicts in/out) ---
     async def find_all(self) -> List[Dict[str, Any]]:
-        return await self._mongo.find_all()
+        return await self.flights.do(("all",), self._mongo.find_all, copy=_copy_docs)
+
+    async def find_page(
+        self,
+        f: Optional[BookFilter] = None,
+        after: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        f = f or BookFilter()
+        oid: Optional[ObjectId] = to_object_id(after) if after else None
+        projection = dict(BOOK_PROJECTION)
+        if f.q:
+            projection["score"] = {"$meta": "textScore"}
+        query, sort = build_query(f), build_sort(f)
+        return await self.flights.do(
+            ("page", f.model_dump_json(), oid, limit),
+            lambda: self._mongo.find_page(query, oid, limit, sort, projection),
+            copy=_copy_docs,
+        )
+
+    def iter_all(self, f: Optional[BookFilter] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Every match of `f`, filtered and sorted like find_page. Query and
+        sort are built here rather than on first iteration, so a bad sort
+        raises ValueError before anything has been streamed.
+        """
+        f = f or BookFilter()
+        projection = dict(BOOK_PROJECTION)
+        if f.q:
+            projection["score"] = {"$meta": "textScore"}
+        query, sort = build_query(f), build_sort(f)
+        return self._mongo.iter_all(query, projection, sort=sort)
 
     async def find_one(self, book_id: str) -> Optional[Dict[str, Any]]:
         oid: ObjectId = to_object_id(book_id)
-        return await self._mongo.find_one(oid)
+        return await self.flights.do(("one", oid), lambda: self._mongo.find_one(oid), copy=_copy_doc)
 
     async def insert_one(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return await self._mongo.insert_one(data)
+        try:
+            return await self._mongo.insert_one(data)
+        finally:
+            self.flights.forget()
+
+    async def insert_many(self, docs: List[Dict[str, Any]]) -> Tuple[int, List[Tuple[int, str]]]:
+        try:
+            return await self._mongo.insert_many(docs)
+        finally:
+            self.flights.forget()
+
+    async def insert_batch(self, rows: List[Dict[str, Any]]) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        One unordered insert_many for rows that each belong to a different
+        caller: the stored doc per row, as insert_one returns it, or the
+        error that row hit.
+        """
+        # Ids are assigned here so each row knows its own, whichever others failed
+        docs = [{**row, "_id": ObjectId()} for row in rows]
+        try:
+            _, errors = await self._mongo.insert_many(docs)
+        finally:
+            self.flights.forget()
+        failed = {index: WriteError(message) for index, message in errors}
+        return [failed.get(i) or _serialize(doc) for i, doc in enumerate(docs)]
 
     async def update_one(self, book_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         oid: ObjectId = to_object_id(book_id)
-        return await self._mongo.update_one(oid, data)
+        try:
+            return await self._mongo.update_one(oid, data)
+        finally:
+            self.flights.forget()
 
     async def delete_one(self, book_id: str) -> bool:
         oid: ObjectId = to_object_id(book_id)
-        return await self._mongo.delete_one(oid)
+        try:
+            return await self._mongo.delete_one(oid)
+        finally:
+            self.flights.forget()
@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Protocol, Tuple
+
+
+class Cache(Protocol):
+    """
+    Interface the managers program against. Swap in another implementation
+    (e.g. a shared one) by passing it to the manager's constructor.
+    """
+
+    def get(self, key: Hashable) -> Optional[Any]: ...
+
+    def set(self, key: Hashable, value: Any): ...
+
+    def delete(self, key: Hashable): ...
+
+    def clear(self): ...
+
+    def stats(self) -> Dict[str, Any]: ...
+
+
+class NullCache(Cache):
+    """Caching switched off: every read goes to the database"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {"enabled": False}
+
+
+class LRUCache(Cache):
+    """
+    In-process LRU with a TTL, bounded both by entry count and by the
+    approximate byte size of the values (as measured by `sizeof`).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 60.0,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+    ):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._sizeof = sizeof
+        # key -> (value, size, expires_at)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, _, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        size = self._sizeof(value)
+        if size > self._max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, time.monotonic() + self._ttl)
+        self._bytes += size
+        while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self._max_entries,
+            "max_bytes": self._max_bytes,
+            "ttl": self._ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def cache_from_env(prefix: str, sizeof: Callable[[Any], int] = sys.getsizeof) -> Cache:
+    """
+    Build a cache from <PREFIX>_CACHE_{ENABLED,MAX_ENTRIES,MAX_BYTES,TTL},
+    e.g. BOOKS_CACHE_TTL=30.
+    """
+    if os.environ.get(f"{prefix}_CACHE_ENABLED", "true").lower() != "true":
+        return NullCache()
+    return LRUCache(
+        max_entries=int(os.environ.get(f"{prefix}_CACHE_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.environ.get(f"{prefix}_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=float(os.environ.get(f"{prefix}_CACHE_TTL", "60")),
+        sizeof=sizeof,
+    )
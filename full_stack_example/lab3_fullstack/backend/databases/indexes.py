@@ -0,0 +1,145 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from databases.backend import CollectionBackend
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+# ---------- Declared indexes ----------
+# Keyed by collection role rather than name, since names/dbs come from env.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # Lookups in register/login/OAuth, and the guard against duplicate accounts
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "profiles": [
+        # One profile per user; saves upsert on it
+        IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique"),
+    ],
+    "revoked_tokens": [
+        # Drops each logged-out token once it would have expired anyway
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "recommendations": [
+        # One materialized document per user, upserted by managers/recommendation_job.py
+        IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique"),
+    ],
+    "books": [
+        IndexModel([("author", ASCENDING)], name="author"),
+        IndexModel([("genre", ASCENDING)], name="genre"),
+        IndexModel([("year", ASCENDING)], name="year"),
+        # Backs the free-text `q` filter on GET /books
+        IndexModel([("title", TEXT), ("author", TEXT)], name="title_author_text"),
+    ],
+}
+
+# Indexes older releases declared; dropped at startup since they clash with their replacements
+RETIRED_INDEXES: Dict[str, List[str]] = {
+    # Non-unique, on the same key as user_id_unique
+    "profiles": ["user_id"],
+}
+
+# ---------- Known queries ----------
+# (role, description, filter, sort) for every query shape the app issues
+# that should be served by an index. Values are probes; only the shape matters.
+KNOWN_QUERIES: List[Tuple[str, str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    ("users", "user by email", {"email": "probe@example.com"}, None),
+    ("profiles", "profile by user_id", {"user_id": "probe"}, None),
+    ("recommendations", "recommendations by user_id", {"user_id": "probe"}, None),
+    ("books", "books by author", {"author": "probe"}, None),
+    ("books", "books by genre", {"genre": "probe"}, None),
+    ("books", "books by year range", {"year": {"$gte": 1900, "$lte": 2000}}, None),
+    ("books", "books text search", {"$text": {"$search": "probe"}}, None),
+    ("books", "books page after id", {"_id": {"$gt": ObjectId("0" * 24)}}, [("_id", ASCENDING)]),
+]
+
+
+async def ensure_indexes(collections: Dict[str, CollectionBackend]) -> Dict[str, Any]:
+    """
+    Create every declared index. createIndexes is a no-op for indexes that
+    already exist with the same spec, so this is safe on every startup.
+    Retired indexes are dropped first. A conflicting or unbuildable index
+    (e.g. duplicate emails or profiles already stored) is reported under
+    "error" and skipped; no data is ever changed here. Duplicate profiles
+    are resolved offline with `python -m managers.dedupe_profiles`.
+    """
+    report: Dict[str, Any] = {}
+    for role, models in INDEXES.items():
+        collection = collections.get(role)
+        if collection is None:
+            continue
+        report[role] = {}
+        try:
+            for name in RETIRED_INDEXES.get(role, []):
+                if await _drop_index(collection, name):
+                    report[role]["dropped"] = report[role].get("dropped", []) + [name]
+            report[role]["created"] = await collection.create_indexes(models)
+        except OperationFailure as e:
+            print(f"Index creation failed on {role}: {e}")
+            report[role]["error"] = str(e)
+    return report
+
+
+async def _drop_index(collection: CollectionBackend, name: str) -> bool:
+    try:
+        await collection.drop_index(name)
+        return True
+    except OperationFailure as e:
+        if e.code == 27:  # IndexNotFound: already gone
+            return False
+        raise
+
+
+async def find_superseded(collection: CollectionBackend, field: str) -> Dict[Any, Dict[str, Any]]:
+    """
+    Values of `field` held by more than one document, each with the newest
+    document (highest _id) to keep and the older ones that block a unique index.
+    """
+    groups: Dict[Any, List[Any]] = {}
+    async for doc in collection.find({}, {field: 1}).sort("_id", ASCENDING):
+        groups.setdefault(doc.get(field), []).append(doc["_id"])
+    return {value: {"keep": ids[-1], "delete": ids[:-1]} for value, ids in groups.items() if len(ids) > 1}
+
+
+async def delete_superseded(collection: CollectionBackend, superseded: Dict[Any, Dict[str, Any]],
+                            batch_size: int = 1000) -> int:
+    """Delete the documents find_superseded marked; returns how many went"""
+    doomed = [_id for group in superseded.values() for _id in group["delete"]]
+    deleted = 0
+    for start in range(0, len(doomed), batch_size):
+        deleted += (await collection.delete_many({"_id": {"$in": doomed[start:start + batch_size]}})).deleted_count
+    return deleted
+
+
+def _stages(plan: Dict[str, Any]):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def explain_known_queries(collections: Dict[str, CollectionBackend]) -> List[Dict[str, Any]]:
+    """Run explain on each known query and flag the ones that fall back to a collection scan"""
+    results = []
+    for role, description, query, sort in KNOWN_QUERIES:
+        collection = collections.get(role)
+        if collection is None:
+            continue
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+        except (OperationFailure, KeyError) as e:
+            results.append({"collection": role, "query": description, "error": str(e)})
+            continue
+        stages = [s for s in _stages(plan) if s]
+        results.append({
+            "collection": role,
+            "query": description,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return results
@@ -0,0 +1,331 @@
+"""
+Cache invalidation across uvicorn/gunicorn workers.
+
+Every worker keeps its own read caches (books, profiles, verified tokens),
+its own token denylist and its own profile matcher. A bus tells all of
+them which documents changed, whichever worker wrote them:
+
+    ChangeStreamBus  one Mongo change stream over the watched collections
+                     (needs a replica set). Every worker, the writer
+                     included, sees each change, usually within
+                     milliseconds. After an outage the stream resumes from
+                     its last token, so missed changes are replayed.
+    VersionPollBus   polls the `versions` counters every
+                     CACHE_BUS_POLL_INTERVAL seconds. Each write logs its
+                     key there, so the poller replays the changed keys
+                     (with their current documents) and only resets a
+                     collection when it fell further behind than the log.
+                     Works on a standalone mongod and on an SQLite file
+                     shared by several workers. ChangeStreamBus falls back
+                     to it when the server has no change streams.
+    InvalidationBus  in-process fan-out of what the write paths publish;
+                     the stand-in for tests (share one between managers to
+                     play several workers) and for the memory backend.
+
+Subscribers are called with (key, doc): the changed _id as a string and
+the document after the change (None once deleted), or with key None,
+meaning anything in that collection may have changed. Until a missed
+change is replayed or reset, staleness is bounded by the cache TTLs.
+
+Every bus also keeps a version per collection that ETags derive from,
+read without a round trip. VersionPollBus and ChangeStreamBus use the
+shared `versions` counter as this worker last saw it (after its own
+writes, and from a poll every CACHE_BUS_POLL_INTERVAL seconds), so all
+workers tag the same data alike and a tag revalidates on any of them; it
+may trail another worker's change by one interval. InvalidationBus is
+single-process: its version counts the changes it delivers, under a
+per-process epoch so a restarted worker never repeats an old tag.
+"""
+import asyncio
+import os
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from databases.registry import registry
+from databases.versions import VERSIONS_COLLECTION, VersionCounter, missed_changes
+from metrics import CACHE_INVALIDATIONS
+
+# auto | changestream | poll | local; auto picks by storage backend
+CACHE_BUS = os.environ.get("CACHE_BUS", "auto")
+CACHE_BUS_POLL_INTERVAL = float(os.environ.get("CACHE_BUS_POLL_INTERVAL", "1"))
+# Seconds between attempts to reopen a failed change stream
+CACHE_BUS_RETRY = float(os.environ.get("CACHE_BUS_RETRY", "2"))
+
+# Server error codes: not a replica set / resume point no longer in the oplog
+_NO_CHANGE_STREAMS = 40573
+_HISTORY_LOST = 286
+
+Namespace = Tuple[str, str]
+Subscriber = Callable[[Optional[str], Optional[dict]], Awaitable[None]]
+
+
+class InvalidationBus:
+    """In-process bus: what a write path publishes is delivered to this process' subscribers"""
+
+    kind = "local"
+
+    def __init__(self):
+        self._subscribers: Dict[Namespace, List[Subscriber]] = defaultdict(list)
+        self.epoch = os.urandom(4).hex()
+        self._versions: Dict[Namespace, int] = defaultdict(int)
+        # Shared counter per collection as last seen: (epoch, v)
+        self._shared: Dict[Namespace, Tuple[str, int]] = {}
+        self.delivered = 0
+        self.resets = 0
+        self.errors = 0
+
+    def subscribe(self, db_name: str, collection: str, subscriber: Subscriber):
+        self._subscribers[(db_name, collection)].append(subscriber)
+
+    def version(self, db_name: str, collection: str) -> str:
+        """Moves after every change to the collection; read it before the documents"""
+        shared = self._shared.get((db_name, collection))
+        if shared is not None:
+            return f"{shared[0]}:{shared[1]}"
+        return f"{self.epoch}.{self._versions.get((db_name, collection), 0)}"
+
+    def _observe(self, ns: Namespace, doc: Optional[dict]):
+        """Record the shared counter; only ever forward, as reads and bumps may land out of order"""
+        if not doc or "v" not in doc:
+            return
+        seen = self._shared.get(ns)
+        epoch = doc.get("epoch", "")
+        if seen is None or seen[0] != epoch or doc["v"] > seen[1]:
+            self._shared[ns] = (epoch, doc["v"])
+
+    async def publish(self, db_name: str, collection: str, key: Optional[str], doc: Optional[dict] = None):
+        """Called by write paths once their write is done; this worker sees it at once"""
+        await self._deliver((db_name, collection), key, doc)
+        await self._share((db_name, collection), key)
+
+    async def touch(self, db_name: str, collection: str):
+        """Called after inserts: nothing cached is stale, but lists and their ETags are"""
+        self._versions[(db_name, collection)] += 1
+        await self._share((db_name, collection), "")
+
+    async def _share(self, ns: Namespace, key: Optional[str]):
+        """Tells other workers, where they cannot see the write themselves"""
+
+    async def _deliver(self, ns: Namespace, key: Optional[str], doc: Optional[dict]):
+        for subscriber in self._subscribers.get(ns, ()):
+            try:
+                await subscriber(key, doc)
+            except Exception as e:
+                self.errors += 1
+                print(f"Cache invalidation for {ns[0]}.{ns[1]} failed: {e}")
+        # After the subscribers, so whoever reads the new version no longer finds the old document cached
+        self._versions[ns] += 1
+        if key is None:
+            self.resets += 1
+        else:
+            self.delivered += 1
+        CACHE_INVALIDATIONS.inc(ns[1], "reset" if key is None else "key")
+
+    async def _reset_all(self):
+        for ns in list(self._subscribers):
+            await self._deliver(ns, None, None)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "kind": self.kind,
+            "namespaces": sorted(f"{db}.{coll}" for db, coll in self._subscribers),
+            "delivered": self.delivered,
+            "resets": self.resets,
+            "errors": self.errors,
+        }
+
+
+class VersionPollBus(InvalidationBus):
+    """Replays the keys other workers logged with the version counters; resets when the log fell short"""
+
+    kind = "poll"
+
+    def __init__(self, uri: str, interval: float = CACHE_BUS_POLL_INTERVAL):
+        super().__init__()
+        self._uri = uri
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _share(self, ns: Namespace, key: Optional[str]):
+        # Stored writes stand even if the counter cannot move; other workers then lag until the next one
+        counter = VersionCounter(registry.collection(self._uri, ns[0], VERSIONS_COLLECTION), ns[1])
+        doc = await counter.bump(key, self.epoch)
+        if doc is None:
+            self.errors += 1
+        self._observe(ns, doc)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        await self._poll()
+
+    async def _poll(self, replay: bool = True):
+        """Follow the shared counters; with replay, also deliver what other workers changed"""
+        by_db: Dict[str, List[str]] = defaultdict(list)
+        for db_name, collection in self._subscribers:
+            by_db[db_name].append(collection)
+        seen: Dict[Namespace, int] = {}
+        while True:
+            for db_name, names in by_db.items():
+                try:
+                    versions = registry.collection(self._uri, db_name, VERSIONS_COLLECTION)
+                    current = {doc["_id"]: doc async for doc in versions.find({"_id": {"$in": names}})}
+                except Exception as e:
+                    # Any backend; the loop must outlive a failed poll
+                    self.errors += 1
+                    print(f"Version poll on {db_name} failed: {e}")
+                    continue
+                for name in names:
+                    ns, doc = (db_name, name), current.get(name, {})
+                    # The first poll only records where we start from
+                    if replay and ns in seen and seen[ns] != doc.get("v", 0):
+                        await self._replay(ns, missed_changes(doc, seen[ns]))
+                    seen[ns] = doc.get("v", 0)
+                    # After the replay, so the version moves only once this worker's caches have
+                    self._observe(ns, doc)
+            await asyncio.sleep(self._interval)
+
+    async def _replay(self, ns: Namespace, changes: Optional[List[list]]):
+        if changes is None:
+            # Fell further behind than the log reaches
+            await self._deliver(ns, None, None)
+            return
+        # This worker already delivered its own changes when it published them
+        changed = [key for key, origin in changes if origin != self.epoch]
+        if None in changed:
+            await self._deliver(ns, None, None)
+            return
+        keys = list(dict.fromkeys(key for key in changed if key))
+        if not keys:
+            if changed:
+                self._versions[ns] += 1  # Inserts only
+            return
+        try:
+            ids = [ObjectId(key) if ObjectId.is_valid(key) else key for key in keys]
+            collection = registry.collection(self._uri, ns[0], ns[1])
+            docs = {str(doc["_id"]): doc async for doc in collection.find({"_id": {"$in": ids}})}
+        except Exception as e:
+            self.errors += 1
+            print(f"Reading changed {ns[0]}.{ns[1]} documents failed, resetting: {e}")
+            await self._deliver(ns, None, None)
+            return
+        # As with updateLookup: the document as it is now, None once deleted
+        for key in keys:
+            await self._deliver(ns, key, docs.get(key))
+
+
+class ChangeStreamBus(VersionPollBus):
+    """One change stream for all subscribed collections; polls versions if the server has none"""
+
+    kind = "changestream"
+
+    def __init__(self, uri: str, retry: float = CACHE_BUS_RETRY, interval: float = CACHE_BUS_POLL_INTERVAL):
+        super().__init__(uri, interval)
+        self._retry = retry
+        self.connected = False
+        self.failures = 0
+        self._versions_task: Optional[asyncio.Task] = None
+
+    # Writes still bump the shared counter, which ETags derive from on every worker;
+    # the log it keeps also lets a worker that falls back to polling catch up.
+
+    async def _run(self):
+        # The stream carries invalidations; the counters still need reading for ETags
+        self._versions_task = asyncio.create_task(self._poll(replay=False))
+        try:
+            await self._watch()
+        finally:
+            self._versions_task.cancel()
+
+    async def _fall_back_to_polling(self):
+        self.kind = "poll"
+        self.connected = False
+        self._versions_task.cancel()
+        await self._poll()
+
+    async def _watch(self):
+        client = registry.client(self._uri)
+        if not hasattr(client, "watch"):
+            print(f"{type(client).__name__} has no change streams; polling versions every {self._interval}s")
+            await self._fall_back_to_polling()
+            return
+        pipeline = [{"$match": {"$or": [{"ns": {"db": db, "coll": coll}} for db, coll in self._subscribers]}}]
+        resume_token = None
+        opened = False
+        while True:
+            try:
+                async with client.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.connected = True
+                    if opened and resume_token is None:
+                        # Fresh stream after the old position was lost: changes in between are unknown
+                        await self._reset_all()
+                    opened = True
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        await self._handle(change)
+            except OperationFailure as e:
+                if e.code == _NO_CHANGE_STREAMS:
+                    print(f"Change streams unavailable ({e}); polling versions every {self._interval}s")
+                    await self._fall_back_to_polling()
+                    return
+                if e.code == _HISTORY_LOST:
+                    resume_token = None
+                self._failed(e)
+            except PyMongoError as e:
+                self._failed(e)
+            await asyncio.sleep(self._retry)
+
+    def _failed(self, e: Exception):
+        self.connected = False
+        self.failures += 1
+        self.errors += 1
+        print(f"Change stream failed, reopening in {self._retry}s: {e}")
+
+    async def _handle(self, change: dict):
+        ns = (change["ns"]["db"], change["ns"]["coll"])
+        op = change["operationType"]
+        if op in ("drop", "rename", "dropDatabase", "invalidate"):
+            await self._deliver(ns, None, None)
+            return
+        key = change.get("documentKey", {}).get("_id")
+        if key is None:
+            return
+        # fullDocument is absent on deletes, and None if the doc was deleted before the lookup
+        await self._deliver(ns, str(key), change.get("fullDocument"))
+
+    def stats(self):
+        return {**super().stats(), "connected": self.connected, "failures": self.failures}
+
+
+def bus_from_env(uri: str, mode: str = CACHE_BUS) -> InvalidationBus:
+    """Bus for the configured CACHE_BUS; `auto` follows the storage backend"""
+    if mode == "auto":
+        if registry.backend == "memory" or uri.startswith("memory://"):
+            mode = "local"
+        else:
+            mode = "poll" if registry.backend == "sqlite" else "changestream"
+    if mode == "changestream":
+        return ChangeStreamBus(uri)
+    if mode == "poll":
+        return VersionPollBus(uri)
+    if mode == "local":
+        return InvalidationBus()
+    raise ValueError(f"Unknown CACHE_BUS {mode!r}")
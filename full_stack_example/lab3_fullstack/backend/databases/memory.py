@@ -0,0 +1,439 @@
+"""
+In-memory async stand-in for the slice of Motor this app uses.
+
+Selected with MONGO_URI=memory:// (see databases/registry.py), so the whole
+app, benchmarks and tests can run without a mongod. It supports the
+filters, updates, projections, sorts, unique/text indexes and bulk
+operations the managers issue. Everything lives in one process, so each
+uvicorn worker gets its own private data set.
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+_MISSING = object()
+
+
+def _copy(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Docs here are flat apart from lists of scalars; a shallow-ish copy is enough
+    return {k: list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v for k, v in doc.items()}
+
+
+def _sort_key(value: Any) -> Tuple:
+    # Mongo's cross-type order, reduced to the types this app stores
+    if value is None or value is _MISSING:
+        return (0,)
+    if isinstance(value, bool):
+        return (4, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, ObjectId):
+        return (3, value)
+    if isinstance(value, datetime):
+        return (5, value)
+    return (6, str(value))
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def sort_and_slice(docs: List[Tuple[Dict[str, Any], float]], sort: List[Tuple[str, Any]],
+                   skip: int = 0, limit: int = 0) -> List[Tuple[Dict[str, Any], float]]:
+    """Apply a Mongo sort spec, skip and limit to (doc, text_score) pairs"""
+    for field, direction in reversed(sort):
+        if isinstance(direction, dict):  # {"$meta": "textScore"}
+            docs.sort(key=lambda pair: pair[1], reverse=True)
+        else:
+            docs.sort(key=lambda pair: _sort_key(pair[0].get(field, _MISSING)), reverse=direction == -1)
+    docs = docs[skip:]
+    return docs[:limit] if limit else docs
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: Dict[str, Any], projection: Optional[Dict[str, Any]]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[Tuple[str, Any]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1) -> "MemoryCursor":
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, n: int) -> "MemoryCursor":
+        self._skip = n
+        return self
+
+    def limit(self, n: int) -> "MemoryCursor":
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int) -> "MemoryCursor":
+        return self
+
+    def _results(self) -> List[Dict[str, Any]]:
+        c = self._collection
+        docs = [(d, c._score(d, self._query)) for d in c._docs.values() if c._matches(d, self._query)]
+        docs = sort_and_slice(docs, self._sort, self._skip, self._limit)
+        return [c._project(d, self._projection, score) for d, score in docs]
+
+    def __aiter__(self):
+        self._iter = iter(self._results())
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        results = self._results()
+        return results[:length] if length else results
+
+    async def explain(self) -> Dict[str, Any]:
+        return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+
+class DocumentOps:
+    """
+    Mongo query, projection and update semantics evaluated in Python.
+    Shared by the in-memory collection and the embedded SQLite engine.
+    """
+
+    _text_fields: Tuple[str, ...] = ()
+
+    # ---------- matching ----------
+    def _matches(self, doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+        for key, cond in query.items():
+            if key == "$text":
+                if not self._text_hits(doc, cond["$search"]):
+                    return False
+            elif key == "$or":
+                if not any(self._matches(doc, q) for q in cond):
+                    return False
+            elif key == "$and":
+                if not all(self._matches(doc, q) for q in cond):
+                    return False
+            elif not self._match_value(doc.get(key, _MISSING), cond):
+                return False
+        return True
+
+    def _match_value(self, value: Any, cond: Any) -> bool:
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$eq" and not self._equal(value, arg):
+                    return False
+                if op == "$ne" and self._equal(value, arg):
+                    return False
+                if op == "$in" and not any(self._equal(value, a) for a in arg):
+                    return False
+                if op == "$nin" and any(self._equal(value, a) for a in arg):
+                    return False
+                if op == "$exists" and (value is not _MISSING) != bool(arg):
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is _MISSING or value is None or _sort_key(value)[0] != _sort_key(arg)[0]:
+                        return False
+                    if op == "$gt" and not value > arg:
+                        return False
+                    if op == "$gte" and not value >= arg:
+                        return False
+                    if op == "$lt" and not value < arg:
+                        return False
+                    if op == "$lte" and not value <= arg:
+                        return False
+            return True
+        return self._equal(value, cond)
+
+    @staticmethod
+    def _equal(value: Any, target: Any) -> bool:
+        if isinstance(value, list) and not isinstance(target, list):
+            return target in value
+        if value is _MISSING:
+            return target is None
+        return value == target
+
+    def _text_hits(self, doc: Dict[str, Any], search: str) -> int:
+        fields = self._text_fields or tuple(k for k, v in doc.items() if isinstance(v, str))
+        words = set()
+        for field in fields:
+            if isinstance(doc.get(field), str):
+                words.update(_words(doc[field]))
+        return sum(1 for term in _words(search) if term in words)
+
+    def _score(self, doc: Dict[str, Any], query: Dict[str, Any]) -> float:
+        return float(self._text_hits(doc, query["$text"]["$search"])) if "$text" in query else 0.0
+
+    def _project(self, doc: Dict[str, Any], projection: Optional[Dict[str, Any]], score: float = 0.0) -> Dict[str, Any]:
+        if not projection:
+            return _copy(doc)
+        metas = {k for k, v in projection.items() if isinstance(v, dict)}
+        include = {k for k, v in projection.items() if k not in metas and v}
+        exclude = {k for k, v in projection.items() if k not in metas and not v}
+        if include - {"_id"}:
+            keep = include | ({"_id"} if "_id" not in exclude else set())
+            out = {k: v for k, v in _copy(doc).items() if k in keep}
+        else:
+            out = {k: v for k, v in _copy(doc).items() if k not in exclude}
+        for k in metas:
+            out[k] = score
+        return out
+
+    # ---------- updates ----------
+    def _apply_update(self, doc: Dict[str, Any], update: Dict[str, Any], inserting: bool) -> Dict[str, Any]:
+        new = _copy(doc)
+        if not any(k.startswith("$") for k in update):
+            # Replacement document
+            new = _copy(update)
+            if "_id" in doc:
+                new["_id"] = doc["_id"]
+        for k, v in update.get("$set", {}).items():
+            new[k] = v
+        if inserting:
+            for k, v in update.get("$setOnInsert", {}).items():
+                new[k] = v
+        for k, v in update.get("$inc", {}).items():
+            new[k] = new.get(k, 0) + v
+        for k in update.get("$unset", {}):
+            new.pop(k, None)
+        for k, v in update.get("$push", {}).items():
+            items = list(new.get(k, []))
+            if isinstance(v, dict) and "$each" in v:
+                items.extend(v["$each"])
+                if "$slice" in v:
+                    items = items[v["$slice"]:] if v["$slice"] < 0 else items[:v["$slice"]]
+            else:
+                items.append(v)
+            new[k] = items
+        return new
+
+    def _upsert_seed(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+
+
+class MemoryCollection(DocumentOps):
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        self._unique: Dict[str, Tuple[str, ...]] = {}
+        self._text_fields: Tuple[str, ...] = ()
+
+    # ---------- writes ----------
+    def _check_unique(self, doc: Dict[str, Any], ignore_id: Any = _MISSING):
+        for name, keys in self._unique.items():
+            values = tuple(doc.get(k) for k in keys)
+            for other in self._docs.values():
+                if other["_id"] != ignore_id and tuple(other.get(k) for k in keys) == values:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", 11000)
+
+    def _insert(self, doc: Dict[str, Any]) -> Any:
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        self._check_unique(doc)
+        self._docs[doc["_id"]] = _copy(doc)
+        return doc["_id"]
+
+    def _find_first(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            return self._docs.get(query["_id"])
+        for doc in self._docs.values():
+            if self._matches(doc, query):
+                return doc
+        return None
+
+    def _update(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]], Any]:
+        """Returns (before, after, upserted_id)"""
+        current = self._find_first(query)
+        if current is None:
+            if not upsert:
+                return None, None, None
+            new = self._apply_update(self._upsert_seed(query), update, inserting=True)
+            new_id = self._insert(new)
+            return None, self._docs[new_id], new_id
+        new = self._apply_update(current, update, inserting=False)
+        new["_id"] = current["_id"]
+        self._check_unique(new, ignore_id=current["_id"])
+        before = current
+        self._docs[current["_id"]] = new
+        return before, new, None
+
+    # ---------- Motor-style API ----------
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, filter or {}, projection)
+
+    async def find_one(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs):
+        doc = self._find_first(filter or {})
+        return self._project(doc, projection) if doc is not None else None
+
+    async def count_documents(self, filter: Dict[str, Any], **kwargs) -> int:
+        return sum(1 for d in self._docs.values() if self._matches(d, filter))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    async def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> InsertManyResult:
+        ids, errors = [], []
+        for index, doc in enumerate(documents):
+            try:
+                ids.append(self._insert(doc))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids), "nUpserted": 0,
+                                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult(ids, True)
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        before, after, upserted_id = self._update(filter, update, upsert)
+        raw = {"n": 1 if after is not None else 0, "nModified": int(before is not None and before != after)}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self.update_one(filter, replacement, upsert=upsert)
+
+    async def find_one_and_update(
+        self,
+        filter: Dict[str, Any],
+        update: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        **kwargs,
+    ):
+        before, after, _ = self._update(filter, update, upsert)
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return self._project(doc, projection) if doc is not None else None
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        doc = self._find_first(filter)
+        if doc is not None:
+            del self._docs[doc["_id"]]
+        return DeleteResult({"n": 1 if doc is not None else 0}, True)
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        doomed = [k for k, d in self._docs.items() if self._matches(d, filter)]
+        for k in doomed:
+            del self._docs[k]
+        return DeleteResult({"n": len(doomed)}, True)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": []}
+        for index, op in enumerate(requests):
+            try:
+                if isinstance(op, InsertOne):
+                    self._insert(op._doc)
+                    result["nInserted"] += 1
+                elif isinstance(op, (UpdateOne, ReplaceOne)):
+                    before, after, upserted_id = self._update(op._filter, op._doc, op._upsert)
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": upserted_id})
+                    elif after is not None:
+                        result["nMatched"] += 1
+                        result["nModified"] += int(before != after)
+                elif isinstance(op, DeleteOne):
+                    doc = self._find_first(op._filter)
+                    if doc is not None:
+                        del self._docs[doc["_id"]]
+                        result["nRemoved"] += 1
+                else:
+                    raise TypeError(f"Unsupported bulk operation {type(op).__name__}")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_indexes(self, indexes: List[Any], **kwargs) -> List[str]:
+        names = []
+        for model in indexes:
+            spec = model.document
+            keys = tuple(spec["key"].keys())
+            if any(v == "text" for v in spec["key"].values()):
+                self._text_fields = keys
+            if spec.get("unique"):
+                seen = set()
+                for doc in self._docs.values():
+                    values = tuple(doc.get(k) for k in keys)
+                    if values in seen:
+                        raise DuplicateKeyError(f"Cannot build unique index {spec['name']}: duplicate {values}", 11000)
+                    seen.add(values)
+                self._unique[spec["name"]] = keys
+            names.append(spec["name"])
+        return names
+
+    async def drop_index(self, index_or_name: Any, **kwargs):
+        self._unique.pop(index_or_name, None)
+
+    async def drop(self):
+        self._docs.clear()
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, command: Any, *args, **kwargs) -> Dict[str, Any]:
+        return {"ok": 1.0}
+
+
+class MemoryClient:
+    """Stands in for AsyncIOMotorClient: client[db][collection]"""
+
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    @property
+    def admin(self) -> MemoryDatabase:
+        return self["admin"]
+
+    def close(self):
+        pass
@@ -1,6 +1,9 @@
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
 from bson import ObjectId
-from typing import Any, Dict
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from databases.backend import CollectionBackend
+from databases.registry import registry
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 # Helpers to convert Mongo docs to JSON-friendly dicts
 def _serialize(doc: Dict[str, Any]) -> Dict[str, Any]:
@@ -22,17 +25,16 @@ class Mongo:
         self._uri = uri
         self._db_name = db_name
         self._collection_name = collection
-        self.client: AsyncIOMotorClient | None = None
-        self.collection: AsyncIOMotorCollection | None = None
+        self.client = None
+        self.collection: CollectionBackend | None = None
 
     async def connect(self):
-        self.client = AsyncIOMotorClient(self._uri)
-        db = self.client[self._db_name]
-        self.collection = db[self._collection_name]
+        self.client = registry.client(self._uri)
+        self.collection = registry.collection(self._uri, self._db_name, self._collection_name)
 
     async def close(self):
-        if self.client:
-            self.client.close()
+        # The shared client belongs to the registry; it is closed once at shutdown
+        self.collection = None
 
     # Generic helpers you can reuse if you add more managers later
     async def find_all(self):
@@ -40,6 +42,39 @@ class Mongo:
         cursor = self.collection.find({})
         return [_serialize(doc) async for doc in cursor]
 
+    async def find_page(
+        self,
+        query: Optional[Dict[str, Any]] = None,
+        after: Optional[ObjectId] = None,
+        limit: int = 100,
+        sort: Optional[List[Tuple[str, Any]]] = None,
+        projection: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Filter, sort, limit and projection all run on the server, so only
+        `limit` trimmed docs ever leave it. With the default _id order,
+        `after` makes this a keyset page.
+        """
+        assert self.collection is not None
+        query = dict(query or {})
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        cursor = self.collection.find(query, projection).sort(sort or [("_id", 1)]).limit(limit)
+        return [_serialize(doc) async for doc in cursor]
+
+    async def iter_all(
+        self,
+        query: Optional[Dict[str, Any]] = None,
+        projection: Optional[Dict[str, Any]] = None,
+        batch_size: int = 500,
+        sort: Optional[List[Tuple[str, Any]]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield docs as the cursor delivers them instead of building a list."""
+        assert self.collection is not None
+        cursor = self.collection.find(query or {}, projection).sort(sort or [("_id", 1)]).batch_size(batch_size)
+        async for doc in cursor:
+            yield _serialize(doc)
+
     async def find_one(self, oid: ObjectId):
         assert self.collection is not None
         doc = await self.collection.find_one({"_id": oid})
@@ -47,14 +82,34 @@ class Mongo:
 
     async def insert_one(self, data: Dict[str, Any]):
         assert self.collection is not None
-        res = await self.collection.insert_one(data)
-        doc = await self.collection.find_one({"_id": res.inserted_id})
+        doc = dict(data)
+        res = await self.collection.insert_one(doc)
+        # The stored doc is exactly what we sent plus its id; no need to read it back
+        doc["_id"] = res.inserted_id
         return _serialize(doc)
 
+    async def insert_many(self, docs: List[Dict[str, Any]]) -> Tuple[int, List[Tuple[int, str]]]:
+        """
+        Unordered batch insert: one bad doc doesn't stop the rest.
+        Returns (inserted_count, [(index_in_batch, error_message), ...]).
+        """
+        assert self.collection is not None
+        if not docs:
+            return 0, []
+        try:
+            res = await self.collection.insert_many(docs, ordered=False)
+            return len(res.inserted_ids), []
+        except BulkWriteError as e:
+            errors = [(err["index"], err.get("errmsg", "Write failed")) for err in e.details.get("writeErrors", [])]
+            return e.details.get("nInserted", 0), errors
+
     async def update_one(self, oid: ObjectId, data: Dict[str, Any]):
         assert self.collection is not None
-        await self.collection.update_one({"_id": oid}, {"$set": data})
-        doc = await self.collection.find_one({"_id": oid})
+        doc = await self.collection.find_one_and_update(
+            {"_id": oid},
+            {"$set": data},
+            return_document=ReturnDocument.AFTER,
+        )
         return _serialize(doc) if doc else None
 
     async def delete_one(self, oid: ObjectId) -> bool:
@@ -1,15 +1,95 @@
-from pymongo import MongoClient
+from typing import Any, Dict, List, Optional, Union
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+from databases.backend import CollectionBackend
+from databases.registry import registry
+
+
+def _upsert(profile: Dict[str, Any]) -> Dict[str, Any]:
+    # user_id is the key; everything else is overwritten with the latest answers
+    return {"$set": {k: v for k, v in profile.items() if k not in ("_id", "user_id")}}
+
 
 class ProfileRepository:
-    def __init__(self):
-        self.client = MongoClient("mongodb://localhost:27017/")  # change if needed
-        self.db = self.client["soundpath"]
-        self.collection = self.db["profiles"]
-
-    def save_profile(self, profile_dict):
-        existing = self.collection.find_one({"user_id": profile_dict["user_id"]})
-        if existing:
-            self.collection.update_one({"user_id": profile_dict["user_id"]}, {"$set": profile_dict})
-        else:
-            self.collection.insert_one(profile_dict)
-        return profile_dict
+    """
+    Profiles keyed by user_id: one document per user, written with a single
+    upsert instead of a read followed by an insert or update. The unique
+    user_id index (databases/indexes.py) makes concurrent first saves for
+    the same user collapse into one document.
+    """
+
+    def __init__(self, uri: str, db_name: str, collection: str):
+        self.collection: CollectionBackend = registry.collection(uri, db_name, collection)
+
+    async def save_profile(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert or replace the profile of profile['user_id']; returns the stored document"""
+        query = {"user_id": profile["user_id"]}
+        try:
+            return await self.collection.find_one_and_update(
+                query, _upsert(profile), upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost an insert race with a concurrent first save; the document exists now
+            return await self.collection.find_one_and_update(
+                query, _upsert(profile), return_document=ReturnDocument.AFTER
+            )
+
+    async def save_profiles(self, profiles: List[Dict[str, Any]], batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        Upsert many profiles with unordered bulk_write batches. A failed
+        entry doesn't stop the rest; failures are reported by input index.
+        """
+        counts = {"received": len(profiles), "inserted": 0, "updated": 0, "unchanged": 0, "errors": []}
+        for start in range(0, len(profiles), batch_size):
+            batch = profiles[start:start + batch_size]
+            ops = [UpdateOne({"user_id": p["user_id"]}, _upsert(p), upsert=True) for p in batch]
+            try:
+                result = (await self.collection.bulk_write(ops, ordered=False)).bulk_api_result
+            except BulkWriteError as e:
+                result = e.details
+                counts["errors"].extend(
+                    {"index": start + err["index"], "error": err.get("errmsg", "Write failed")}
+                    for err in result.get("writeErrors", [])
+                )
+            counts["inserted"] += result.get("nUpserted", 0)
+            counts["updated"] += result.get("nModified", 0)
+            counts["unchanged"] += result.get("nMatched", 0) - result.get("nModified", 0)
+        return counts
+
+    async def save_profile_batch(self, profiles: List[Dict[str, Any]]) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        save_profile for many callers at once: one unordered bulk_write.
+        Returns, per input and in order, the document as that caller wrote
+        it (a later write by someone else never shows up in it) or its
+        error. user_ids must be distinct.
+        """
+        ops = [UpdateOne({"user_id": p["user_id"]}, _upsert(p), upsert=True) for p in profiles]
+        results: List[Union[Dict[str, Any], Exception, None]] = [None] * len(profiles)
+        try:
+            result = (await self.collection.bulk_write(ops, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+            for err in result.get("writeErrors", []):
+                results[err["index"]] = WriteError(err.get("errmsg", "Write failed"), err.get("code"), err)
+        ids = {u["index"]: u["_id"] for u in result.get("upserted", [])}
+        for i, r in enumerate(results):
+            if isinstance(r, WriteError) and r.code == 11000:
+                # Lost an insert race with another worker's first save; redo it on its own
+                try:
+                    results[i] = await self.save_profile(profiles[i])
+                except Exception as e:
+                    results[i] = e
+        # Updated profiles kept their _id; it is fixed per user_id, so reading it back is safe under concurrent writes
+        updated = {p["user_id"]: i for i, p in enumerate(profiles) if results[i] is None and i not in ids}
+        if updated:
+            async for doc in self.collection.find({"user_id": {"$in": list(updated)}}, {"user_id": 1}):
+                ids[updated[doc["user_id"]]] = doc["_id"]
+        for i, p in enumerate(profiles):
+            if results[i] is None:
+                results[i] = {**p, "_id": ids[i]} if i in ids else WriteError(f"Profile {p['user_id']} missing after save")
+        return results
+
+    async def find_by_user_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"user_id": user_id})
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from databases.backend import CollectionBackend
+from databases.memory import MemoryClient
+from databases.sqlite import SQLiteClient
+from metrics import MONGO_COMMAND_DURATION, CallbackGauge
+
+# Docker-friendly defaults, shared by the app and the offline jobs; override via env
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://mongo:27017")
+# Profiles, users and recommendations live in their own database
+PROFILES_DB_NAME = os.environ.get("PROFILES_DB_NAME", "musicdb")
+
+# Pool tuning; override via env
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# Storage engine: mongo (default), memory (per-process, for tests/benchmarks)
+# or sqlite (embedded, single node). memory:// URIs always get the stand-in.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "soundpath.db")
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Connection pool occupancy, fed by pymongo's CMAP events.
+    Events arrive on pymongo's own threads, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.created_total = 0
+        self.closed_total = 0
+        self.checkout_failed_total = 0
+        self.pool_cleared_total = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "open": self.open,
+                "in_use": self.checked_out,
+                "idle": self.open - self.checked_out,
+                "waiting": self.waiting,
+                "created_total": self.created_total,
+                "closed_total": self.closed_total,
+                "checkout_failed_total": self.checkout_failed_total,
+                "pool_cleared_total": self.pool_cleared_total,
+            }
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+            self.created_total += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+            self.closed_total += 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checked_out += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failed_total += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_cleared_total += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Feeds mongo_command_duration_seconds. The driver measures the round
+    trip itself; `started` only remembers which collection the command
+    targets, since the completion events don't carry it.
+    """
+
+    def __init__(self):
+        self._collections: Dict[Tuple[Any, int], str] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        # Single dict operations are atomic under the GIL; events arrive on driver threads
+        self._collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6, collection, event.command_name, outcome)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+class ClientRegistry:
+    """
+    One client per URI for the whole process. Managers and repositories
+    ask the registry for collections instead of building their own
+    clients, so every caller shares a single pool. Which engine backs the
+    client is decided here (STORAGE_BACKEND), never by the callers.
+    """
+
+    def __init__(self, backend: str = STORAGE_BACKEND):
+        if backend not in ("mongo", "memory", "sqlite"):
+            raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
+        self.backend = backend
+        self._clients: Dict[str, Any] = {}
+        self.pool_stats = PoolStats()
+        self.command_metrics = CommandMetrics()
+
+    def client(self, uri: str):
+        client = self._clients.get(uri)
+        if client is None and (self.backend == "memory" or uri.startswith("memory://")):
+            # In-process stand-in for benchmarks and tests; no mongod needed
+            client = self._clients[uri] = MemoryClient()
+        if client is None and self.backend == "sqlite":
+            client = self._clients[uri] = SQLiteClient(SQLITE_PATH)
+        if client is None:
+            client = AsyncIOMotorClient(
+                uri,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[self.pool_stats, self.command_metrics],
+            )
+            self._clients[uri] = client
+        return client
+
+    def collection(self, uri: str, db_name: str, collection: str) -> CollectionBackend:
+        return self.client(uri)[db_name][collection]
+
+    async def warm_up(self):
+        """Open minPoolSize connections up front so the first requests don't pay for them."""
+        n = max(1, MONGO_MIN_POOL_SIZE)
+        await asyncio.gather(*(
+            client.admin.command("ping")
+            for client in self._clients.values()
+            for _ in range(n)
+        ))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "clients": len(self._clients),
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            **self.pool_stats.snapshot(),
+        }
+
+    def close(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+
+registry = ClientRegistry()
+
+
+def _pool_connections():
+    snapshot = registry.pool_stats.snapshot()
+    return {(state,): snapshot[state] for state in ("open", "in_use", "idle", "waiting")}
+
+
+CallbackGauge("mongo_pool_connections", "Connections in the shared Mongo pool by state", ("state",), _pool_connections)
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from metrics import SINGLE_FLIGHT_CALLS
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-flight query instead
+    of each sending their own; only the first caller (the leader) hits the
+    database. Results are shared, so pass `copy` for anything a caller may
+    mutate; every caller, the leader included, then gets its own copy.
+
+    forget() detaches in-flight queries from their keys: callers that
+    already joined still get the result, later callers start afresh.
+    Call it after each write so no one joins a read that began before it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.deduplicated = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], copy: Optional[Callable[[T], T]] = None) -> T:
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.leaders += 1
+            SINGLE_FLIGHT_CALLS.inc(self.name, "leader")
+            flight = self._inflight[key] = asyncio.ensure_future(fn())
+            flight.add_done_callback(lambda done: self._landed(key, done))
+        else:
+            self.deduplicated += 1
+            SINGLE_FLIGHT_CALLS.inc(self.name, "shared")
+        # shield: a caller that gives up (client disconnect) must not cancel the query for the others
+        result = await asyncio.shield(flight)
+        return copy(result) if copy else result
+
+    def _landed(self, key: Hashable, flight: asyncio.Future):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight.cancelled():
+            # Retrieved here so an error nobody is left waiting for is not logged as unhandled
+            flight.exception()
+
+    def forget(self):
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.deduplicated
+        return {
+            "in_flight": len(self._inflight),
+            "queries": self.leaders,
+            "deduplicated": self.deduplicated,
+            "dedup_ratio": round(self.deduplicated / calls, 4) if calls else 0.0,
+        }
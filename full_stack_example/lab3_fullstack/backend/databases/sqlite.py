@@ -0,0 +1,498 @@
+"""
+Embedded storage engine: the Motor collection API on top of SQLite in WAL mode.
+
+Selected with STORAGE_BACKEND=sqlite (see databases/registry.py) for
+single-node deployments that should not run a mongod. Each collection is a
+table of (id, doc) rows, with the document stored as relaxed Extended JSON
+so SQLite's JSON1 functions can filter, sort and index its fields.
+
+Filters, sorts and limits are pushed into SQL when they can be expressed
+exactly; anything else (text search, $ne, array membership, ...) is
+finished in Python with the same semantics as the in-memory stand-in.
+Fields with a declared index are treated as scalars so that equality on
+them can use the index.
+
+All SQLite work runs on one dedicated thread, so the event loop never
+blocks on disk and writes are naturally serialized.
+"""
+import asyncio
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId, json_util
+from pymongo import DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+from databases.memory import DocumentOps, sort_and_slice
+
+_FIELD = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+_SCALARS = (str, int, float)
+_RANGE_OPS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_FETCH_BATCH = 500
+
+
+def _id_key(value: Any) -> str:
+    return json_util.dumps(value)
+
+
+def _encode(doc: Dict[str, Any]) -> str:
+    return json_util.dumps({k: v for k, v in doc.items() if k != "_id"})
+
+
+def _decode(id_text: str, doc_text: str) -> Dict[str, Any]:
+    doc = json_util.loads(doc_text)
+    doc["_id"] = json_util.loads(id_text)
+    return doc
+
+
+def _field_sql(field: str) -> str:
+    # Must be spelled identically in queries and CREATE INDEX for SQLite to use the index
+    return f"json_extract(doc, '$.{field}')"
+
+
+def _is_scalar(value: Any) -> bool:
+    return isinstance(value, _SCALARS) and not isinstance(value, bool)
+
+
+class SQLiteCursor:
+    def __init__(self, collection: "SQLiteCollection", query: Dict[str, Any], projection: Optional[Dict[str, Any]]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[Tuple[str, Any]] = []
+        self._skip = 0
+        self._limit = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._sql_cursor: Optional[sqlite3.Cursor] = None
+        self._exhausted = False
+
+    def sort(self, key_or_list, direction: int = 1) -> "SQLiteCursor":
+        self._sort = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, n: int) -> "SQLiteCursor":
+        self._skip = n
+        return self
+
+    def limit(self, n: int) -> "SQLiteCursor":
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int) -> "SQLiteCursor":
+        return self
+
+    def _plan(self) -> Tuple[str, List[Any], bool]:
+        """(sql, params, streamable): streamable when SQL alone yields the exact final rows"""
+        c = self._collection
+        where, params, exact = c._compile(self._query)
+        order = c._compile_sort(self._sort)
+        sql = f"SELECT id, doc FROM {c._table} WHERE {where}"
+        if exact and order is not None:
+            if order:
+                sql += f" ORDER BY {order}"
+            if self._limit or self._skip:
+                sql += " LIMIT ? OFFSET ?"
+                params = params + [self._limit or -1, self._skip]
+            return sql, params, True
+        return sql, params, False
+
+    def _start(self) -> List[Dict[str, Any]]:
+        """Runs on the SQLite thread. Returns fully post-processed rows when streaming isn't possible."""
+        c = self._collection
+        c._ensure_table()
+        sql, params, streamable = self._plan()
+        cursor = c._client._conn.execute(sql, params)
+        if streamable:
+            self._sql_cursor = cursor
+            return []
+        docs = [_decode(i, d) for i, d in cursor.fetchall()]
+        pairs = [(doc, c._score(doc, self._query)) for doc in docs if c._matches(doc, self._query)]
+        pairs = sort_and_slice(pairs, self._sort, self._skip, self._limit)
+        self._exhausted = True
+        return [c._project(doc, self._projection, score) for doc, score in pairs]
+
+    def _fetch(self) -> List[Dict[str, Any]]:
+        assert self._sql_cursor is not None
+        rows = self._sql_cursor.fetchmany(_FETCH_BATCH)
+        if len(rows) < _FETCH_BATCH:
+            self._exhausted = True
+        return [self._collection._project(_decode(i, d), self._projection) for i, d in rows]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        c = self._collection
+        if self._sql_cursor is None and not self._exhausted:
+            self._pending = await c._client._run(self._start)
+        while not self._pending and not self._exhausted:
+            self._pending = await c._client._run(self._fetch)
+        if not self._pending:
+            raise StopAsyncIteration
+        return self._pending.pop(0)
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        out = []
+        async for doc in self:
+            out.append(doc)
+            if length and len(out) >= length:
+                break
+        return out
+
+    async def explain(self) -> Dict[str, Any]:
+        sql, params, _ = self._plan()
+
+        def run():
+            return [row[3] for row in self._collection._client._conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+        details = await self._collection._client._run(run)
+        scans = [d for d in details if d.startswith("SCAN") and "INDEX" not in d]
+        return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN" if scans else "IXSCAN", "sqlite": details}}}
+
+
+class SQLiteCollection(DocumentOps):
+    def __init__(self, client: "SQLiteClient", db_name: str, name: str):
+        self._client = client
+        self.name = name
+        self._table = '"' + f"{db_name}.{name}".replace('"', '""') + '"'
+        self._indexed: Set[str] = set()
+        self._text_fields: Tuple[str, ...] = ()
+        self._created = False
+
+    # ---------- SQL translation ----------
+    def _compile(self, query: Dict[str, Any]) -> Tuple[str, List[Any], bool]:
+        """Translate what we can into a WHERE clause. `exact` is False when Python must re-check."""
+        clauses: List[str] = []
+        params: List[Any] = []
+        exact = True
+        for key, cond in query.items():
+            sql, p = self._compile_condition(key, cond)
+            if sql is None:
+                exact = False
+                continue
+            clauses.append(sql)
+            params.extend(p)
+        return (" AND ".join(clauses) or "1"), params, exact
+
+    def _compile_condition(self, key: str, cond: Any) -> Tuple[Optional[str], List[Any]]:
+        if key.startswith("$") or not _FIELD.match(key):
+            return None, []
+        ops = cond if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond) else {"$eq": cond}
+        parts: List[str] = []
+        params: List[Any] = []
+        for op, arg in ops.items():
+            if key == "_id":
+                sql, p = self._compile_id(op, arg)
+            else:
+                sql, p = self._compile_field(key, op, arg)
+            if sql is None:
+                return None, []
+            parts.append(sql)
+            params.extend(p)
+        return " AND ".join(parts), params
+
+    def _compile_id(self, op: str, arg: Any) -> Tuple[Optional[str], List[Any]]:
+        if op == "$eq":
+            return "id = ?", [_id_key(arg)]
+        if op == "$in":
+            return f"id IN ({','.join('?' * len(arg))})", [_id_key(a) for a in arg]
+        # Extended JSON of ObjectIds sorts like the ObjectIds themselves
+        if op in _RANGE_OPS and isinstance(arg, ObjectId):
+            return f"id {_RANGE_OPS[op]} ? AND id LIKE '{{\"$oid\"%'", [_id_key(arg)]
+        return None, []
+
+    def _compile_field(self, field: str, op: str, arg: Any) -> Tuple[Optional[str], List[Any]]:
+        expr = _field_sql(field)
+        if op == "$eq":
+            if arg is None:
+                return f"{expr} IS NULL", []
+            if not _is_scalar(arg):
+                return None, []
+            if field in self._indexed:
+                return f"{expr} = ?", [arg]
+            # Unindexed fields may hold arrays; json_each covers scalars and array members alike
+            return f"EXISTS (SELECT 1 FROM json_each(doc, '$.{field}') WHERE json_each.value = ?)", [arg]
+        if op == "$in" and field in self._indexed and all(_is_scalar(a) for a in arg):
+            return f"{expr} IN ({','.join('?' * len(arg))})", list(arg)
+        if op in _RANGE_OPS and _is_scalar(arg):
+            # Mongo only compares within a type bracket
+            types = "'text'" if isinstance(arg, str) else "'integer','real'"
+            return f"{expr} {_RANGE_OPS[op]} ? AND json_type(doc, '$.{field}') IN ({types})", [arg]
+        return None, []
+
+    def _compile_sort(self, sort: List[Tuple[str, Any]]) -> Optional[str]:
+        """ORDER BY clause, or None if the sort can only be done in Python"""
+        terms = []
+        for field, direction in sort:
+            if isinstance(direction, dict) or not _FIELD.match(field):
+                return None
+            column = "id" if field == "_id" else _field_sql(field)
+            terms.append(f"{column} {'DESC' if direction == -1 else 'ASC'}")
+        return ", ".join(terms)
+
+    # ---------- helpers (SQLite thread only) ----------
+    def _ensure_table(self):
+        if not self._created:
+            self._client._conn.execute(f"CREATE TABLE IF NOT EXISTS {self._table} (id TEXT PRIMARY KEY, doc TEXT NOT NULL) WITHOUT ROWID")
+            self._created = True
+
+    def _select(self, query: Dict[str, Any], limit: int = 0) -> List[Dict[str, Any]]:
+        self._ensure_table()
+        where, params, exact = self._compile(query)
+        sql = f"SELECT id, doc FROM {self._table} WHERE {where}"
+        if exact and limit:
+            sql += f" LIMIT {int(limit)}"
+        docs = []
+        for id_text, doc_text in self._client._conn.execute(sql, params):
+            doc = _decode(id_text, doc_text)
+            if exact or self._matches(doc, query):
+                docs.append(doc)
+                if limit and len(docs) >= limit:
+                    break
+        return docs
+
+    def _insert(self, doc: Dict[str, Any]) -> Any:
+        self._ensure_table()
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        try:
+            self._client._conn.execute(f"INSERT INTO {self._table} (id, doc) VALUES (?, ?)", (_id_key(doc["_id"]), _encode(doc)))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}: {e}", 11000)
+        return doc["_id"]
+
+    def _write(self, doc: Dict[str, Any]):
+        try:
+            self._client._conn.execute(f"UPDATE {self._table} SET doc = ? WHERE id = ?", (_encode(doc), _id_key(doc["_id"])))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}: {e}", 11000)
+
+    def _delete(self, doc: Dict[str, Any]):
+        self._client._conn.execute(f"DELETE FROM {self._table} WHERE id = ?", (_id_key(doc["_id"]),))
+
+    def _update(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool):
+        """Returns (before, after, upserted_id)"""
+        found = self._select(query, limit=1)
+        if not found:
+            if not upsert:
+                return None, None, None
+            new = self._apply_update(self._upsert_seed(query), update, inserting=True)
+            return None, new, self._insert(new)
+        before = found[0]
+        after = self._apply_update(before, update, inserting=False)
+        after["_id"] = before["_id"]
+        self._write(after)
+        return before, after, None
+
+    def _transaction(self, fn: Callable[[], Any]) -> Callable[[], Any]:
+        def run():
+            with self._client._conn:
+                return fn()
+        return run
+
+    # ---------- Motor-style API ----------
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs) -> SQLiteCursor:
+        return SQLiteCursor(self, filter or {}, projection)
+
+    async def find_one(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs):
+        docs = await self._client._run(lambda: self._select(filter or {}, limit=1))
+        return self._project(docs[0], projection) if docs else None
+
+    async def count_documents(self, filter: Dict[str, Any], **kwargs) -> int:
+        return len(await self._client._run(lambda: self._select(filter)))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        def run():
+            self._ensure_table()
+            return self._client._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+        return await self._client._run(run)
+
+    async def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        return InsertOneResult(await self._client._run(self._transaction(lambda: self._insert(document))), True)
+
+    async def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+
+        def run():
+            ids, errors = [], []
+            for index, doc in enumerate(documents):
+                try:
+                    ids.append(self._insert(doc))
+                except DuplicateKeyError as e:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+            return ids, errors
+
+        ids, errors = await self._client._run(self._transaction(run))
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids), "nUpserted": 0,
+                                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult(ids, True)
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        before, after, upserted_id = await self._client._run(self._transaction(lambda: self._update(filter, update, upsert)))
+        raw = {"n": 1 if after is not None else 0, "nModified": int(before is not None and before != after)}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self.update_one(filter, replacement, upsert=upsert)
+
+    async def find_one_and_update(
+        self,
+        filter: Dict[str, Any],
+        update: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        **kwargs,
+    ):
+        before, after, _ = await self._client._run(self._transaction(lambda: self._update(filter, update, upsert)))
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return self._project(doc, projection) if doc is not None else None
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        def run():
+            found = self._select(filter, limit=1)
+            for doc in found:
+                self._delete(doc)
+            return len(found)
+        return DeleteResult({"n": await self._client._run(self._transaction(run))}, True)
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        def run():
+            found = self._select(filter)
+            for doc in found:
+                self._delete(doc)
+            return len(found)
+        return DeleteResult({"n": await self._client._run(self._transaction(run))}, True)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        def run():
+            result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                      "upserted": [], "writeErrors": []}
+            for index, op in enumerate(requests):
+                try:
+                    if isinstance(op, InsertOne):
+                        self._insert(op._doc)
+                        result["nInserted"] += 1
+                    elif isinstance(op, (UpdateOne, ReplaceOne)):
+                        before, after, upserted_id = self._update(op._filter, op._doc, op._upsert)
+                        if upserted_id is not None:
+                            result["nUpserted"] += 1
+                            result["upserted"].append({"index": index, "_id": upserted_id})
+                        elif after is not None:
+                            result["nMatched"] += 1
+                            result["nModified"] += int(before != after)
+                    elif isinstance(op, DeleteOne):
+                        found = self._select(op._filter, limit=1)
+                        for doc in found:
+                            self._delete(doc)
+                        result["nRemoved"] += len(found)
+                    else:
+                        raise TypeError(f"Unsupported bulk operation {type(op).__name__}")
+                except DuplicateKeyError as e:
+                    result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+            return result
+
+        result = await self._client._run(self._transaction(run))
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_indexes(self, indexes: List[Any], **kwargs) -> List[str]:
+        def run():
+            self._ensure_table()
+            names = []
+            for model in indexes:
+                spec = model.document
+                keys = list(spec["key"].items())
+                if any(v == "text" for _, v in keys):
+                    # No FTS here; text search is evaluated in Python over these fields
+                    self._text_fields = tuple(k for k, _ in keys)
+                else:
+                    columns = ", ".join(f"{_field_sql(k)} {'DESC' if v == -1 else 'ASC'}" for k, v in keys)
+                    unique = "UNIQUE " if spec.get("unique") else ""
+                    index_name = '"' + f"{self._table.strip(chr(34))}.{spec['name']}" + '"'
+                    try:
+                        self._client._conn.execute(f"CREATE {unique}INDEX IF NOT EXISTS {index_name} ON {self._table} ({columns})")
+                    except sqlite3.IntegrityError as e:
+                        raise DuplicateKeyError(f"Cannot build unique index {spec['name']}: {e}", 11000)
+                    self._indexed.update(k for k, _ in keys)
+                names.append(spec["name"])
+            return names
+        return await self._client._run(self._transaction(run))
+
+    async def drop_index(self, index_or_name: Any, **kwargs):
+        def run():
+            self._ensure_table()
+            index_name = '"' + f"{self._table.strip(chr(34))}.{index_or_name}" + '"'
+            self._client._conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+        await self._client._run(self._transaction(run))
+
+    async def drop(self):
+        def run():
+            self._client._conn.execute(f"DROP TABLE IF EXISTS {self._table}")
+            self._created = False
+        await self._client._run(self._transaction(run))
+
+
+class SQLiteDatabase:
+    def __init__(self, client: "SQLiteClient", name: str):
+        self._client = client
+        self.name = name
+        self._collections: Dict[str, SQLiteCollection] = {}
+
+    def __getitem__(self, name: str) -> SQLiteCollection:
+        if name not in self._collections:
+            self._collections[name] = SQLiteCollection(self._client, self.name, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> SQLiteCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, command: Any, *args, **kwargs) -> Dict[str, Any]:
+        await self._client._run(lambda: self._client._conn.execute("SELECT 1").fetchone())
+        return {"ok": 1.0}
+
+
+class SQLiteClient:
+    """Stands in for AsyncIOMotorClient: client[db][collection], one database file for all of them"""
+
+    def __init__(self, path: str):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._databases: Dict[str, SQLiteDatabase] = {}
+
+    async def _run(self, fn: Callable[[], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn)
+
+    def __getitem__(self, name: str) -> SQLiteDatabase:
+        if name not in self._databases:
+            self._databases[name] = SQLiteDatabase(self, name)
+        return self._databases[name]
+
+    @property
+    def admin(self) -> SQLiteDatabase:
+        return self["admin"]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
@@ -0,0 +1,60 @@
+import os
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from databases.backend import CollectionBackend
+
+# One small document per tracked collection:
+# {_id: <collection name>, epoch: <set on creation>, v: <int>, log: [[key, origin], ...]}
+VERSIONS_COLLECTION = os.environ.get("VERSIONS_COLLECTION", "versions")
+# Changes kept in the log; a poller that missed more than this resets instead of replaying
+VERSIONS_LOG_SIZE = int(os.environ.get("VERSIONS_LOG_SIZE", "1000"))
+
+
+class VersionCounter:
+    """
+    Change counter for one collection, kept in Mongo so every worker sees
+    the same value. Workers without change streams poll it to learn that
+    another worker wrote, and every worker derives ETags from the value it
+    last saw, so a tag issued by one worker revalidates on the others.
+    """
+
+    def __init__(self, collection: CollectionBackend, name: str):
+        self.collection = collection
+        self.name = name
+
+    async def bump(self, key: Optional[str] = None, origin: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Count one change and log its key: a document id, "" for inserts
+        only, None for anything. The log entry for version v is the last
+        one when v is read, so pollers can tell exactly which they missed.
+        Returns the counter's {epoch, v} after the change.
+
+        Called once the write itself is stored, so a failure here must not
+        fail the write: the caller would retry it and store it twice. It is
+        logged and None returned instead; other workers lag until the next bump.
+        """
+        update = {
+            "$inc": {"v": 1},
+            "$push": {"log": {"$each": [[key, origin]], "$slice": -VERSIONS_LOG_SIZE}},
+            # Tells a recreated counter apart, so its versions never repeat an old tag
+            "$setOnInsert": {"epoch": os.urandom(4).hex()},
+        }
+        try:
+            return await self.collection.find_one_and_update(
+                {"_id": self.name}, update, {"_id": 0, "epoch": 1, "v": 1},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            print(f"Version bump for {self.name} failed after its write was stored: {e}")
+            return None
+
+
+def missed_changes(doc: dict, seen: int) -> Optional[List[list]]:
+    """Log entries after version `seen`, or None if the log no longer reaches back that far"""
+    log = doc.get("log", [])
+    missed = doc.get("v", 0) - seen
+    if missed < 0 or missed > len(log):
+        return None
+    return log[len(log) - missed:]
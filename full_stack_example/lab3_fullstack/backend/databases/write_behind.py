@@ -0,0 +1,125 @@
+"""
+Group commit for single-document writes.
+
+Each POST /books or POST /profiles used to cost its own round trip. A
+GroupCommit holds writes arriving within `window` seconds (or until
+`max_batch` are waiting) and hands them to one batch write. Every caller
+still gets its own result or exception, and only once the batch has been
+written: an acknowledged write is as durable as with one write per request.
+The latency cost is at most `window` per write.
+
+Batches are written one at a time and in arrival order, so while one is
+being written the next one fills up. Items with the same `key` never share
+a batch: a second write for a key that is already waiting closes the batch
+first, so the writes land in the order they came in.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from metrics import WRITE_BEHIND_BATCH_SIZE
+
+# Writes one batch; returns a result or an exception per item, in order
+BatchWriter = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class GroupCommit:
+    def __init__(self, name: str, write: BatchWriter, window: float, max_batch: int,
+                 key: Optional[Callable[[Any], Hashable]] = None):
+        self.name = name
+        self._write = write
+        self._window = window
+        self._max_batch = max_batch
+        self._key = key
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._pending_keys: Set[Hashable] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+        self._commits: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.failed = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Result of writing `item`, once its batch is written; raises that item's error"""
+        if self._key is not None:
+            key = self._key(item)
+            if key in self._pending_keys:
+                self._flush()
+            self._pending_keys.add(key)
+        done = asyncio.get_running_loop().create_future()
+        self._pending.append((item, done))
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._window, self._flush)
+        # shield: a caller that goes away does not take its write out of the batch
+        return await asyncio.shield(done)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._pending_keys = set()
+        task = asyncio.create_task(self._commit(batch))
+        self._commits.add(task)
+        task.add_done_callback(self._commits.discard)
+
+    async def _commit(self, batch: List[Tuple[Any, asyncio.Future]]):
+        async with self._lock:
+            WRITE_BEHIND_BATCH_SIZE.observe(len(batch), self.name)
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = await self._write([item for item, _ in batch])
+            except Exception as e:
+                # The whole batch failed; every caller gets the error
+                results = [e] * len(batch)
+            if len(results) != len(batch):
+                # A writer bug; callers without a result must not wait forever
+                print(f"Group commit {self.name}: writer returned {len(results)} results for {len(batch)} items")
+                missing = RuntimeError(f"{self.name} batch writer returned no result for this item")
+                results = list(results[:len(batch)]) + [missing] * (len(batch) - len(results))
+            for (_, done), result in zip(batch, results):
+                if done.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    self.failed += 1
+                    done.set_exception(result)
+                    # Retrieved here so an error whose caller went away is not logged as unhandled
+                    done.exception()
+                else:
+                    done.set_result(result)
+
+    async def close(self):
+        """Write what is still waiting and wait for every batch to finish"""
+        self._flush()
+        if self._commits:
+            await asyncio.gather(*self._commits, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": round(self._window * 1000, 3),
+            "max_batch": self._max_batch,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "failed": self.failed,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+def group_commit_from_env(prefix: str, name: str, write: BatchWriter,
+                          key: Optional[Callable[[Any], Hashable]] = None) -> Optional[GroupCommit]:
+    """
+    GroupCommit from <PREFIX>_WRITE_BEHIND_{MS,MAX_BATCH}, e.g.
+    PROFILES_WRITE_BEHIND_MS=5; None (one write per request) while MS is 0.
+    """
+    window_ms = float(os.environ.get(f"{prefix}_WRITE_BEHIND_MS", "0"))
+    if window_ms <= 0:
+        return None
+    max_batch = int(os.environ.get(f"{prefix}_WRITE_BEHIND_MAX_BATCH", "500"))
+    return GroupCommit(name, write, window_ms / 1000, max_batch, key)
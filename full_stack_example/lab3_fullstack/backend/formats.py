@@ -0,0 +1,88 @@
+"""
+Response formats for the list endpoints, picked from the Accept header.
+
+    application/json      default
+    application/msgpack   same rows, MessagePack-encoded (also x-msgpack, vnd.msgpack)
+    application/x-ndjson  streamed one item per line (GET /books only)
+
+q-values are honoured; on a tie an explicitly named type beats one matched
+through a wildcard, then the order above. A header that accepts none of
+them still gets JSON, as before negotiation existed.
+"""
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+
+import msgpack
+from bson import ObjectId
+from fastapi.responses import Response
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+NDJSON = "application/x-ndjson"
+
+# Media type -> format it selects
+_ALIASES: Dict[str, str] = {
+    JSON: JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    NDJSON: NDJSON,
+}
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float]]:
+    ranges = []
+    for part in accept.split(","):
+        media, *params = part.split(";")
+        media = media.strip().lower()
+        if not media:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((media, q))
+    return ranges
+
+
+def negotiate(accept: str, offered: Sequence[str] = (JSON, MSGPACK, NDJSON)) -> str:
+    """Best of `offered` for this Accept header; JSON when nothing matches"""
+    if not accept:
+        return JSON
+    # format -> (q, specificity); specificity 2 = exact, 1 = type/*, 0 = */*
+    best: Dict[str, Tuple[float, int]] = {}
+    for media, q in _parse_accept(accept):
+        if media == "*/*":
+            matches, specificity = offered, 0
+        elif media.endswith("/*"):
+            matches, specificity = [f for f in offered if f.startswith(media[:-1])], 1
+        elif _ALIASES.get(media) in offered:
+            matches, specificity = [_ALIASES[media]], 2
+        else:
+            continue
+        for fmt in matches:
+            # The most specific range decides a format's q
+            if fmt not in best or specificity > best[fmt][1]:
+                best[fmt] = (q, specificity)
+    ranked = [(q, specificity, -offered.index(fmt), fmt) for fmt, (q, specificity) in best.items() if q > 0]
+    return max(ranked)[3] if ranked else JSON
+
+
+def _default(value):
+    # Same fallbacks the JSON paths use
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK
+
+    def render(self, content) -> bytes:
+        return msgpack.packb(content, default=_default)
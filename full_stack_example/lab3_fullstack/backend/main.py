@@ -1,22 +1,58 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Request
+import time
+
+# Import time of this module and everything it pulls in, reported by /ready
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from starlette.middleware.sessions import SessionMiddleware
-from auth import create_google_auth_url, exchange_code_for_token, get_user_info
+from auth import (
+    close_http_client,
+    create_google_auth_url,
+    exchange_code_for_token,
+    get_user_info,
+    open_http_client,
+)
 
-from typing import List
+from typing import Dict, List, Literal, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import hmac
 import os
 from datetime import datetime
+from bson.errors import InvalidId
 
+from databases.indexes import ensure_indexes, explain_known_queries
+from databases.invalidation import InvalidationBus, bus_from_env
+from databases.registry import MONGO_URI, PROFILES_DB_NAME, registry
 from managers.books_manager import BooksManager
-from models.books_model import BookCreate, BookUpdate, BookOut
+from models.books_model import BookCreate, BookFilter, BookUpdate, BookOut
 from managers.profile_manager import ProfilesManager
-from models.profile_model import ProfileCreate, ProfileOut
+from models.profile_model import ProfileCreate, ProfileMatch, ProfileOut, RecommendationsOut
 from managers.user_manager import UserManager
+from managers.password_hasher import PASSWORD_MAX_PENDING, PasswordPoolSaturated
+from managers.bulk_import import iter_json_array, iter_ndjson
 from models.user_model import UserCreate, UserLogin, UserOut
+import admission
+import compression
+import formats
+import metrics
+import profiling
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """The one startup and shutdown path; steps are under ---------- Lifespan ----------"""
+    await _startup()
+    try:
+        yield
+    finally:
+        await _shutdown()
 
-app = FastAPI(title="Books API")
+app = FastAPI(title="Books API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,19 +60,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After", "X-Profile-Id", "ETag"],
 )
 
-# Docker-friendly defaults; override via env
-MONGO_URI = os.environ.get("MONGO_URI", "mongodb://mongo:27017")
+# Docker-friendly defaults; override via env. MONGO_URI and PROFILES_DB_NAME come from databases/registry.py
 DB_NAME = os.environ.get("MONGO_DB_NAME", "booksdb")
 COLLECTION = os.environ.get("MONGO_COLLECTION", "books")
 
+# Attempts per background warm-up step before /ready reports it failed
+STARTUP_ATTEMPTS = int(os.environ.get("STARTUP_ATTEMPTS", "3"))
+STARTUP_RETRY_DELAY = float(os.environ.get("STARTUP_RETRY_DELAY", "1"))
+
+# Page size bounds for GET /books
+BOOKS_PAGE_DEFAULT = int(os.environ.get("BOOKS_PAGE_DEFAULT", "100"))
+BOOKS_PAGE_MAX = int(os.environ.get("BOOKS_PAGE_MAX", "1000"))
+
+# Opt-in fast path for list endpoints: build plain dicts from trusted DB docs
+# and serialize them with orjson, skipping response_model validation
+FAST_JSON = os.environ.get("FAST_JSON", "false").lower() == "true"
+
+# Batch size bounds for POST /books/bulk
+BULK_BATCH_DEFAULT = int(os.environ.get("BULK_BATCH_DEFAULT", "1000"))
+BULK_BATCH_MAX = int(os.environ.get("BULK_BATCH_MAX", "10000"))
+
+# Upper bound on profiles per POST /profiles/bulk request
+PROFILES_BULK_MAX = int(os.environ.get("PROFILES_BULK_MAX", "10000"))
+
+# Upper bound for k on GET /profiles/{user_id}/similar
+PROFILES_SIMILAR_MAX = int(os.environ.get("PROFILES_SIMILAR_MAX", "100"))
+
+# max-age for single-book responses; 0 means clients must revalidate (cheap with ETags)
+BOOKS_CACHE_MAX_AGE = int(os.environ.get("BOOKS_CACHE_MAX_AGE", "0"))
+
+# Set AUTH_REQUIRED=true to demand a bearer token on /books and /profiles
+AUTH_REQUIRED = os.environ.get("AUTH_REQUIRED", "false").lower() == "true"
+
+# Token for the /admin stats routes, sent as X-Admin-Token; unset leaves them unmounted (404)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Admission control for the auth routes; each limit is overridable via env, see admission.policy_from_env.
+# Login/register concurrency matches the bcrypt pool's capacity, so a burst waits here, not in the pool
+LOGIN_ADMISSION = admission.policy_from_env(
+    "/api/login", "LOGIN", max_concurrent=PASSWORD_MAX_PENDING, max_queue=PASSWORD_MAX_PENDING * 2,
+    queue_timeout_ms=1000, ip_rate=5, ip_burst=20, email_rate=0.2, email_burst=5,
+)
+REGISTER_ADMISSION = admission.policy_from_env(
+    "/api/register", "REGISTER", max_concurrent=PASSWORD_MAX_PENDING, max_queue=PASSWORD_MAX_PENDING * 2,
+    queue_timeout_ms=1000, ip_rate=1, ip_burst=5, email_rate=0.1, email_burst=3,
+)
+# OAuth callbacks mostly wait on Google, so more of them may be in flight
+OAUTH_ADMISSION = admission.policy_from_env(
+    "/auth", "OAUTH", max_concurrent=32, max_queue=64, queue_timeout_ms=2000, ip_rate=1, ip_burst=10,
+)
+
 # Frontend URL for redirects
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:5173")
 
 # Sessions needed for OAuth
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY", "supersecret"))
 
+# gzip/brotli per Accept-Encoding, streamed chunk by chunk
+app.add_middleware(compression.CompressionMiddleware)
+
+# Per-request profiling on X-Profile: <PROFILE_TOKEN> or PROFILE_SAMPLE_RATE; absent unless configured
+if profiling.enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+# Added last, so it is outermost and its timings cover the other middleware, profiling included
+app.add_middleware(metrics.MetricsMiddleware)
+
 # ---------- OAuth Routes ----------
 @app.get("/login")
 async def login(request: Request):
@@ -46,6 +138,14 @@ async def login(request: Request):
 
 @app.get("/auth")
 async def auth(request: Request):
+    # The browser lands here from Google, so a shed request is sent back to the app like any other error
+    try:
+        async with OAUTH_ADMISSION.admit(request):
+            return await _auth(request)
+    except admission.Shed as e:
+        return RedirectResponse(url=f"{FRONTEND_URL}/?error=busy&description={e.detail}")
+
+async def _auth(request: Request):
     try:
         # Check for error parameter first
         error = request.query_params.get("error")
@@ -118,37 +218,15 @@ async def auth(request: Request):
         print(f"OAuth error: {e}")
         return RedirectResponse(url=f"{FRONTEND_URL}/?error=unexpected&description=Unexpected error")
 
-
-      #user_profiling
-from managers.profile_manager import ProfilesManager
-from models.profile_model import ProfileCreate, ProfileOut
-
-MONGO_URI = "mongodb://127.0.0.1:27017"  # local MongoDB
-DB_NAME = "musicdb"                       # name of your database
-
-@app.get("/ping")
-async def ping():
-    return {"message": "pong"}
-
-profiles: ProfilesManager | None = None
-
-@app.on_event("startup")
-async def startup_profiles():
-    global profiles
-    profiles = ProfilesManager(MONGO_URI, DB_NAME, "profiles")
-    await profiles.connect()
-
-@app.on_event("shutdown")
-async def shutdown_profiles():
-    if profiles:
-        await profiles.close()
-
-      
-      # ---------- User Routes ----------
-@app.post("/api/register", response_model=UserOut, status_code=201)
-async def register_user(data: UserCreate):
+# ---------- User Routes ----------
+@app.post("/api/register", status_code=201)
+async def register_user(request: Request, data: UserCreate):
     """Register a new user"""
     assert users is not None
+    async with REGISTER_ADMISSION.admit(request, data.email):
+        return await _register_user(data)
+
+async def _register_user(data: UserCreate):
     try:
         user = await users.register_user(data)
         # Create token for the new user
@@ -165,13 +243,19 @@ async def register_user(data: UserCreate):
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except PasswordPoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.post("/api/login")
-async def login_user(data: UserLogin):
+async def login_user(request: Request, data: UserLogin):
     """Login a user"""
     assert users is not None
+    async with LOGIN_ADMISSION.admit(request, data.email):
+        return await _login_user(data)
+
+async def _login_user(data: UserLogin):
     try:
         user, token = await users.authenticate_user(data)
         return {
@@ -186,60 +270,352 @@ async def login_user(data: UserLogin):
         }
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
+    except PasswordPoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
       
       
+# ---------- Auth Dependency ----------
+bearer = HTTPBearer(auto_error=False)
+
+async def current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> UserOut:
+    """Resolve the bearer token to a user; cached tokens skip JWT verification and Mongo"""
+    assert users is not None
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return await users.user_from_token(credentials.credentials)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+async def require_auth(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> Optional[UserOut]:
+    """current_user, enforced only when AUTH_REQUIRED is set; None when it is not"""
+    if AUTH_REQUIRED:
+        return await current_user(credentials)
+    return None
+
+def _check_owner(user: Optional[UserOut], user_ids):
+    """With auth on, profiles can only be written by the user they belong to"""
+    if user is not None and any(user_id != user.id for user_id in user_ids):
+        raise HTTPException(status_code=403, detail="Profiles can only be saved for the signed-in user")
+
+async def require_admin(request: Request):
+    """Gate for the /admin stats routes: 404 unless ADMIN_TOKEN is set, 403 without it"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/api/me", response_model=UserOut)
+async def me(user: UserOut = Depends(current_user)):
+    return user
+
+@app.post("/api/logout", status_code=204)
+async def logout(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)):
+    """Revoke the caller's token"""
+    assert users is not None
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        await users.revoke_token(credentials.credentials)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
 # ---------- Managers ----------
 books: BooksManager | None = None
 profiles: ProfilesManager | None = None
 users: UserManager | None = None
-
-@app.on_event("startup")
-async def startup_event():
-    global books, profiles, users
-    
-    # Books manager
-    books = BooksManager(MONGO_URI, DB_NAME, COLLECTION)
-    await books.connect()
-    
-    # Profiles manager
-    profiles = ProfilesManager(MONGO_URI, "musicdb", "profiles")
-    await profiles.connect()
-    
-    # Users manager
-    users = UserManager(MONGO_URI, "musicdb", "users")
-    await users.connect()
-
-@app.on_event("shutdown")
-async def shutdown_event():
+bus: InvalidationBus | None = None
+
+def _collections():
+    """Collections by role, for index management and diagnostics"""
+    assert books is not None and profiles is not None and users is not None
+    return {"books": books.collection, "profiles": profiles.collection, "users": users.collection,
+            "recommendations": profiles.recommendations, "revoked_tokens": users.revoked}
+
+# ---------- Lifespan ----------
+# Seconds spent per phase: import, startup (before the port opens), warm_up and each warm-up step
+startup_timings: Dict[str, float] = {}
+warm_up_failed: List[str] = []
+warm_up_task: Optional[asyncio.Task] = None
+
+async def _startup():
+    global books, profiles, users, bus, warm_up_task
+    started = time.perf_counter()
+    # A restarted lifespan (tests, reloads) reports only its own warm-up
+    warm_up_failed.clear()
+    for phase in [phase for phase in startup_timings if phase != "import"]:
+        del startup_timings[phase]
+
+    # Carries changes between workers so each one's caches stay coherent
+    bus = bus_from_env(MONGO_URI)
+
+    # Built exactly once; all of them share the registry's client
+    books = BooksManager(MONGO_URI, DB_NAME, COLLECTION, bus=bus)
+    profiles = ProfilesManager(MONGO_URI, PROFILES_DB_NAME, "profiles", bus=bus)
+    users = UserManager(MONGO_URI, PROFILES_DB_NAME, "users", bus=bus)
+    await asyncio.gather(books.connect(), profiles.connect(), users.connect())
+
+    # Keep-alive client for the Google OAuth exchange
+    await open_http_client()
+
+    # Before the matcher loads, so profiles written meanwhile are not missed
+    await bus.start()
+
+    startup_timings["startup"] = time.perf_counter() - started
+    # The port opens now; /ready says when the worker is warm
+    warm_up_task = asyncio.create_task(_warm_up())
+
+async def _warm_up_step(name: str, step):
+    started = time.perf_counter()
+    for attempt in range(1, STARTUP_ATTEMPTS + 1):
+        try:
+            await step()
+            break
+        except Exception as e:
+            print(f"Warm-up step {name} failed (attempt {attempt}/{STARTUP_ATTEMPTS}): {e}")
+            if attempt == STARTUP_ATTEMPTS:
+                warm_up_failed.append(name)
+            else:
+                await asyncio.sleep(STARTUP_RETRY_DELAY)
+    startup_timings[name] = time.perf_counter() - started
+
+async def _ensure_indexes():
+    """Fails the step when an index could not be built; the data that blocks it is left alone"""
+    report = await ensure_indexes(_collections())
+    failed = sorted(role for role, result in report.items() if "error" in result)
+    if failed:
+        raise RuntimeError(f"indexes not built on {', '.join(failed)}; "
+                           "duplicate profiles are resolved with python -m managers.dedupe_profiles")
+
+async def _warm_up():
+    """Independent steps, so they run concurrently; the slowest one sets time-to-ready"""
+    started = time.perf_counter()
+    await asyncio.gather(
+        # Open minPoolSize connections before traffic arrives
+        _warm_up_step("mongo_pool", registry.warm_up),
+        # Declared indexes; idempotent, so safe on every boot
+        _warm_up_step("indexes", _ensure_indexes),
+        # Encode existing profiles for similarity queries
+        _warm_up_step("profile_matcher", profiles.load_matcher),
+        # Tokens logged out on any worker before this one started
+        _warm_up_step("token_denylist", users.load_denylist),
+    )
+    startup_timings["warm_up"] = time.perf_counter() - started
+    steps = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in startup_timings.items())
+    failed = f"; FAILED: {', '.join(warm_up_failed)}" if warm_up_failed else ""
+    print(f"Worker warm: {steps}{failed}")
+
+async def _shutdown():
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+        try:
+            await warm_up_task
+        except asyncio.CancelledError:
+            pass
+    if bus:
+        await bus.stop()
     if books:
         await books.close()
     if profiles:
         await profiles.close()
     if users:
         await users.close()
+    registry.close()
+    await close_http_client()
 
 # ---------- Health Check ----------
 @app.get("/ping")
 async def ping():
     return {"message": "pong"}
 
+@app.get("/ready")
+async def ready():
+    """
+    503 until the pool, indexes and profile matcher are warm, so a rolling
+    deploy only routes traffic here once that is done; /ping is liveness.
+    """
+    done = warm_up_task is not None and warm_up_task.done()
+    body = {
+        "ready": done and not warm_up_failed,
+        "failed": warm_up_failed,
+        "timings_ms": {name: round(seconds * 1000, 1) for name, seconds in startup_timings.items()},
+    }
+    return ORJSONResponse(body, status_code=200 if body["ready"] else 503)
+
+metrics.CallbackGauge(
+    "startup_phase_seconds", "Import, startup and warm-up durations of this worker", ("phase",),
+    lambda: {(phase,): seconds for phase, seconds in startup_timings.items()},
+)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text format: request, Mongo command, bcrypt and OAuth timings"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+metrics.CallbackGauge(
+    "password_pool_pending", "bcrypt jobs queued or running", (),
+    lambda: {(): users.passwords.stats()["pending"]} if users else {},
+)
+metrics.CallbackGauge(
+    "password_pool_rejected", "bcrypt jobs turned away because the pool was saturated", (),
+    lambda: {(): users.passwords.stats()["rejected"]} if users else {},
+)
+
+@app.get("/admin/profiles/{dump_id}", response_class=PlainTextResponse)
+async def get_profile_dump(dump_id: str, request: Request):
+    """Collapsed-stack dump named by an X-Profile-Id header; needs the same X-Profile token"""
+    token = request.headers.get("x-profile", "")
+    if not profiling.PROFILE_TOKEN or not hmac.compare_digest(token.encode(), profiling.PROFILE_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Profiling token required")
+    path = profiling.dump_path(dump_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    with open(path) as f:
+        return PlainTextResponse(f.read())
+
+@app.get("/admin/pool", dependencies=[Depends(require_admin)])
+async def pool_stats():
+    """Occupancy of the shared Mongo connection pool"""
+    return registry.stats()
+
+@app.get("/admin/passwords", dependencies=[Depends(require_admin)])
+async def password_stats():
+    """Queue depth and wait/hash timings of the bcrypt pool"""
+    assert users is not None
+    return users.passwords.stats()
+
+@app.get("/admin/admission", dependencies=[Depends(require_admin)])
+async def admission_stats():
+    """Admitted and shed counts, slots and queues of the auth routes' admission control"""
+    return admission.stats()
+
+@app.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def cache_stats():
+    """Hit/miss/eviction counters of the book and profile read caches, request coalescing, group commit, and the invalidation bus"""
+    assert books is not None and profiles is not None and bus is not None
+    return {
+        "books": books.cache.stats(),
+        "profiles": profiles.cache.stats(),
+        "single_flight": {"books": books.flights.stats(), "profiles": profiles.flights.stats()},
+        "write_behind": {
+            "books": books.writes.stats() if books.writes else None,
+            "profiles": profiles.writes.stats() if profiles.writes else None,
+        },
+        "bus": bus.stats(),
+    }
+
+@app.get("/admin/matcher", dependencies=[Depends(require_admin)])
+async def matcher_stats():
+    """Size of the in-memory profile similarity index"""
+    assert profiles is not None
+    return profiles.matcher.stats()
+
+@app.get("/admin/explain", dependencies=[Depends(require_admin)])
+async def explain_queries():
+    """Query plans of the app's known queries; any COLLSCAN is listed under `collscans`"""
+    plans = await explain_known_queries(_collections())
+    return {
+        "collscans": [f"{p['collection']}: {p['query']}" for p in plans if p.get("collscan")],
+        "plans": plans,
+    }
+
+# ---------- Conditional GET ----------
+def _etag(version: str, request: Request) -> str:
+    """Strong ETag for this exact representation: collection version plus everything that shapes the body"""
+    key = f"{version}|{request.url.path}|{request.url.query}|{request.headers.get('accept', '')}|{FAST_JSON}"
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def _book_cache_control() -> str:
+    scope = "private" if AUTH_REQUIRED else "public"
+    return f"{scope}, max-age={BOOKS_CACHE_MAX_AGE}" if BOOKS_CACHE_MAX_AGE > 0 else f"{scope}, no-cache"
+
 # ---------- Books Routes ----------
-@app.get("/books", response_model=List[BookOut], response_model_exclude_none=True)
-async def list_books():
+@app.get("/books", response_model=List[BookOut], response_model_exclude_none=True, dependencies=[Depends(require_auth)])
+async def list_books(
+    request: Request,
+    response: Response,
+    filters: BookFilter = Depends(),
+    after: Optional[str] = Query(None, description="Return books with an id greater than this one"),
+    limit: int = Query(BOOKS_PAGE_DEFAULT, ge=1, le=BOOKS_PAGE_MAX),
+):
+    """
+    Filter by author, genre and year range, search title/author with `q`,
+    and sort by any book field; all of it runs inside Mongo.
+    With the default id order the list is keyset-paginated: the id to pass
+    as `after` for the next page comes back in the `X-Next-After` header
+    (absent on the last page). Send `Accept: application/x-ndjson` to stream
+    every match instead, or `Accept: application/msgpack` for a MessagePack page.
+    """
     assert books is not None
-    return await books.list_books()
-
-@app.get("/books/{book_id}", response_model=BookOut, response_model_exclude_none=True)
-async def get_book(book_id: str):
+    if after and filters.sort != "id":
+        raise HTTPException(status_code=400, detail="'after' only works with sort=id")
+    # Read before the documents, so the tag never claims newer data than the body holds
+    etag = _etag(books.version(), request)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    fmt = formats.negotiate(request.headers.get("accept", ""))
+    if fmt == formats.NDJSON:
+        try:
+            stream = books.stream_books(filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return StreamingResponse(_ndjson(stream), media_type=formats.NDJSON,
+                                 headers={"ETag": etag, "Vary": "Accept"})
+    # MessagePack always takes the row path; the rows carry exactly the BookOut fields
+    rows_path = FAST_JSON or fmt == formats.MSGPACK
+    try:
+        if rows_path:
+            rows = await books.list_book_rows(after, limit, filters)
+        else:
+            page = await books.list_books(after, limit, filters)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid 'after' cursor")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if rows_path:
+        headers = {"ETag": etag, "Vary": "Accept"}
+        if len(rows) == limit and filters.sort == "id":
+            headers["X-Next-After"] = rows[-1]["id"]
+        if fmt == formats.MSGPACK:
+            return formats.MsgPackResponse(rows, headers=headers)
+        return ORJSONResponse(rows, headers=headers)
+    response.headers["ETag"] = etag
+    response.headers["Vary"] = "Accept"
+    if len(page) == limit and filters.sort == "id":
+        response.headers["X-Next-After"] = page[-1].id
+    return page
+
+async def _ndjson(items):
+    async for item in items:
+        yield item.model_dump_json(exclude_none=True) + "\n"
+
+@app.get("/books/{book_id}", response_model=BookOut, response_model_exclude_none=True, dependencies=[Depends(require_auth)])
+async def get_book(book_id: str, request: Request, response: Response):
     assert books is not None
+    etag = _etag(books.version(), request)
+    cache_control = _book_cache_control()
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
     found = await books.get_book(book_id)
     if not found:
         raise HTTPException(status_code=404, detail="Book not found")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
     return found
 
-@app.post("/books", response_model=BookOut, status_code=201, response_model_exclude_none=True)
+@app.post("/books", response_model=BookOut, status_code=201, response_model_exclude_none=True, dependencies=[Depends(require_auth)])
 async def create_book(data: BookCreate):
     """
     Pass the Pydantic model through; manager can call model_dump()/dict().
@@ -247,18 +623,36 @@ async def create_book(data: BookCreate):
     assert books is not None
     return await books.create_book(data)
 
-@app.put("/books/{book_id}", response_model=BookOut, response_model_exclude_none=True)
+@app.post("/books/bulk", dependencies=[Depends(require_auth)])
+async def bulk_create_books(
+    request: Request,
+    batch_size: int = Query(BULK_BATCH_DEFAULT, ge=1, le=BULK_BATCH_MAX),
+):
+    """
+    Import many books at once. The body is either a JSON array of books or,
+    with Content-Type: application/x-ndjson, one book per line. The body is
+    read as a stream and written in unordered insert_many batches; rows that
+    fail validation or insertion are reported by row number.
+    """
+    assert books is not None
+    if "application/x-ndjson" in request.headers.get("content-type", ""):
+        rows = iter_ndjson(request.stream())
+    else:
+        rows = iter_json_array(request.stream())
+    return await books.bulk_create(rows, batch_size=batch_size)
+
+@app.put("/books/{book_id}", response_model=BookOut, response_model_exclude_none=True, dependencies=[Depends(require_auth)])
 async def update_book(book_id: str, data: BookUpdate):
     assert books is not None
     payload = data.model_dump(exclude_none=True)
     if not payload:
         raise HTTPException(status_code=400, detail="No fields to update")
-    updated = await books.update_book(book_id, payload)
+    updated = await books.update_book(book_id, data)
     if not updated:
         raise HTTPException(status_code=404, detail="Book not found")
     return updated
 
-@app.delete("/books/{book_id}", status_code=204)
+@app.delete("/books/{book_id}", status_code=204, dependencies=[Depends(require_auth)])
 async def delete_book(book_id: str):
     assert books is not None
     ok = await books.delete_book(book_id)
@@ -267,14 +661,64 @@ async def delete_book(book_id: str):
 
 
 @app.post("/profiles", response_model=ProfileOut, status_code=201)
-async def create_profile(data: ProfileCreate):
+async def create_profile(data: ProfileCreate, user: Optional[UserOut] = Depends(require_auth)):
     assert profiles is not None
+    _check_owner(user, [data.user_id])
     return await profiles.create_profile(data)
 
 
-@app.get("/profiles", response_model=List[ProfileOut])
-async def list_profiles():
+@app.post("/profiles/bulk")
+async def bulk_save_profiles(items: List[ProfileCreate], user: Optional[UserOut] = Depends(require_auth)):
+    """
+    Upsert many profiles by user_id in batched bulk writes. Returns
+    inserted/updated/unchanged counts and per-index errors.
+    """
+    assert profiles is not None
+    if len(items) > PROFILES_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {PROFILES_BULK_MAX} profiles per request")
+    _check_owner(user, {item.user_id for item in items})
+    return await profiles.save_profiles(items, batch_size=BULK_BATCH_DEFAULT)
+
+
+@app.get("/profiles", response_model=List[ProfileOut], dependencies=[Depends(require_auth)])
+async def list_profiles(request: Request, response: Response):
+    """JSON by default; send `Accept: application/msgpack` for MessagePack"""
     assert profiles is not None
+    etag = _etag(profiles.version(), request)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    fmt = formats.negotiate(request.headers.get("accept", ""), (formats.JSON, formats.MSGPACK))
+    if fmt == formats.MSGPACK:
+        return formats.MsgPackResponse(await profiles.list_profile_rows(), headers={"ETag": etag, "Vary": "Accept"})
+    if FAST_JSON:
+        return ORJSONResponse(await profiles.list_profile_rows(), headers={"ETag": etag, "Vary": "Accept"})
+    response.headers["ETag"] = etag
+    response.headers["Vary"] = "Accept"
     return await profiles.list_profiles()
 
 
+@app.get("/profiles/{user_id}/similar", response_model=List[ProfileMatch], dependencies=[Depends(require_auth)])
+async def similar_profiles(
+    user_id: str,
+    k: int = Query(10, ge=1, le=PROFILES_SIMILAR_MAX),
+    metric: Literal["cosine", "jaccard"] = "cosine",
+):
+    """Profiles sharing the most instrument/experience/goal/genre/gear features with user_id's"""
+    assert profiles is not None
+    matches = await profiles.similar_profiles(user_id, k, metric)
+    if matches is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return matches
+
+
+@app.get("/profiles/{user_id}/recommendations", response_model=RecommendationsOut, dependencies=[Depends(require_auth)])
+async def get_recommendations(user_id: str):
+    """Top-k list materialized by the offline recommendation job"""
+    assert profiles is not None
+    recommendations = await profiles.get_recommendations(user_id)
+    if recommendations is None:
+        raise HTTPException(status_code=404, detail="No recommendations computed for this user")
+    return recommendations
+
+# Last line, so it covers the whole module
+startup_timings["import"] = time.perf_counter() - _IMPORT_STARTED
@@ -1,7 +1,12 @@
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from pydantic import ValidationError
 from bson import ObjectId
-from models.books_model import BookCreate, BookUpdate, BookOut
+from models.books_model import BookCreate, BookFilter, BookUpdate, BookOut
 from databases.books_repository import BooksRepository
+from databases.cache import Cache, cache_from_env
+from databases.invalidation import InvalidationBus
+from databases.write_behind import group_commit_from_env
+from managers.bulk_import import RowError
 
 def _normalize_id(doc: dict) -> dict:
     """
@@ -36,18 +41,70 @@ def _to_out(doc: dict) -> BookOut:
     d = _normalize_id(doc)
     return BookOut.model_validate(d)
 
+# Keys a BookOut carries; the trusted row path emits exactly these
+_BOOK_FIELDS = frozenset(BookOut.model_fields)
+
+def _to_row(doc: dict) -> dict:
+    """
+    Trusted fast path: docs come from our own collection and were validated
+    on the way in, so build the response dict directly instead of a BookOut.
+    None values are dropped to match response_model_exclude_none.
+    """
+    d = _normalize_id(doc)
+    return {k: v for k, v in d.items() if k in _BOOK_FIELDS and v is not None}
+
+def _format_errors(e: ValidationError) -> str:
+    parts = []
+    for err in e.errors():
+        loc = ".".join(map(str, err["loc"]))
+        parts.append(f"{loc}: {err['msg']}" if loc else err["msg"])
+    return "; ".join(parts)
+
+def _model_size(model) -> int:
+    return len(model.model_dump_json())
+
 class BooksManager:
-    def __init__(self, uri: str, db_name: str, collection: str):
+    def __init__(self, uri: str, db_name: str, collection: str, cache: Optional[Cache] = None,
+                 bus: Optional[InvalidationBus] = None):
         self._repo = BooksRepository(uri, db_name, collection)
+        self._db_name = db_name
+        self._collection_name = collection
+        # Read-through cache for single-book lookups, kept current by the write paths
+        self.cache = cache if cache is not None else cache_from_env("BOOKS", sizeof=_model_size)
+        # Writes made here and by other workers evict from this worker's cache and move version()
+        self.bus = bus or InvalidationBus()
+        self.bus.subscribe(db_name, collection, self._on_change)
+        self._invalidations = 0
+        # Opt-in group commit for create_book (BOOKS_WRITE_BEHIND_MS); None writes each book on its own
+        self.writes = group_commit_from_env("BOOKS", collection, self._commit_inserts)
+
+    @property
+    def collection(self):
+        return self._repo.collection
+
+    @property
+    def flights(self):
+        return self._repo.flights
+
+    def version(self) -> str:
+        """In-process validator ETags on GET /books* derive from; no round trip"""
+        return self.bus.version(self._db_name, self._collection_name)
 
     async def connect(self):
         await self._repo.connect()
 
     async def close(self):
+        if self.writes is not None:
+            await self.writes.close()
         await self._repo.close()
 
-    async def list_books(self) -> List[BookOut]:
-        docs = await self._repo.find_all()
+    async def list_books(
+        self,
+        after: Optional[str] = None,
+        limit: int = 100,
+        filters: Optional[BookFilter] = None,
+    ) -> List[BookOut]:
+        docs = await self._repo.find_page(filters, after, limit)
         out: List[BookOut] = []
         for d in docs:
             # Be forgiving: skip docs that truly lack an id, instead of 500ing the whole list
@@ -58,24 +115,148 @@ class BooksManager:
                 continue
         return out
 
+    async def list_book_rows(
+        self,
+        after: Optional[str] = None,
+        limit: int = 100,
+        filters: Optional[BookFilter] = None,
+    ) -> List[dict]:
+        """Same page as list_books, as plain dicts that skip model validation"""
+        docs = await self._repo.find_page(filters, after, limit)
+        out: List[dict] = []
+        for d in docs:
+            try:
+                out.append(_to_row(d))
+            except KeyError:
+                continue
+        return out
+
+    def stream_books(self, filters: Optional[BookFilter] = None) -> AsyncIterator[BookOut]:
+        """
+        Every matching book in the filter's sort order, without holding the
+        collection in memory. Raises ValueError for a bad sort up front.
+        """
+        docs = self._repo.iter_all(filters)
+
+        async def books():
+            async for d in docs:
+                try:
+                    yield _to_out(d)
+                except KeyError:
+                    continue
+        return books()
+
+    async def _on_change(self, book_id: Optional[str], doc: Optional[dict]):
+        self._invalidations += 1
+        self.flights.forget()
+        if book_id is None:
+            self.cache.clear()
+        else:
+            self.cache.delete(book_id)
+
     async def get_book(self, book_id: str) -> Optional[BookOut]:
+        cached = self.cache.get(book_id)
+        if cached is not None:
+            return cached
+        seen = self._invalidations
         doc = await self._repo.find_one(book_id)
-        return _to_out(doc) if doc else None
+        if not doc:
+            return None
+        out = _to_out(doc)
+        # An invalidation that landed during the read may be newer than what we read
+        if seen == self._invalidations:
+            self.cache.set(book_id, out)
+        return out
+
+    async def _commit_inserts(self, rows: List[dict]) -> List[Union[dict, Exception]]:
+        results = await self._repo.insert_batch(rows)
+        # Once per batch, before any of its callers is answered
+        if any(not isinstance(r, Exception) for r in results):
+            await self.bus.touch(self._db_name, self._collection_name)
+        return results
 
     async def create_book(self, data: BookCreate) -> BookOut:
-        inserted = await self._repo.insert_one(data.dict())
-        # If the repo returned only an inserted_id, refetch the full doc
-        if "inserted_id" in inserted and "_id" not in inserted and "id" not in inserted:
-            created_id = str(inserted["inserted_id"])
-            doc = await self._repo.find_one(created_id)
+        # The repo returns the stored doc with its id, so no refetch is needed
+        if self.writes is not None:
+            inserted = await self.writes.submit(data.dict())
         else:
-            doc = inserted
-        return _to_out(doc)
+            inserted = await self._repo.insert_one(data.dict())
+            await self.bus.touch(self._db_name, self._collection_name)
+        out = _to_out(inserted)
+        self.cache.set(out.id, out)
+        return out
+
+    async def bulk_create(
+        self,
+        rows: AsyncIterator[Tuple[int, Any]],
+        batch_size: int = 1000,
+        max_errors: int = 1000,
+    ) -> Dict[str, Any]:
+        """
+        Validate rows one at a time and write them in unordered insert_many
+        batches. Only one batch is held in memory; bad rows are reported by
+        row number and never abort the import. At most `max_errors` are
+        listed, the rest are only counted.
+        """
+        result: Dict[str, Any] = {"received": 0, "inserted": 0, "failed": 0, "errors": []}
+
+        def fail(row: int, message: str):
+            result["failed"] += 1
+            if len(result["errors"]) < max_errors:
+                result["errors"].append({"row": row, "error": message})
+
+        batch: List[Tuple[int, dict]] = []
+
+        async def flush():
+            inserted, errors = await self._repo.insert_many([doc for _, doc in batch])
+            if inserted:
+                await self.bus.touch(self._db_name, self._collection_name)
+            result["inserted"] += inserted
+            for index, message in errors:
+                fail(batch[index][0], message)
+            batch.clear()
+
+        try:
+            async for row, value in rows:
+                result["received"] += 1
+                if isinstance(value, RowError):
+                    fail(row, value.message)
+                    continue
+                try:
+                    batch.append((row, BookCreate.model_validate(value).model_dump()))
+                except ValidationError as e:
+                    fail(row, _format_errors(e))
+                    continue
+                if len(batch) >= batch_size:
+                    await flush()
+        except ValueError as e:
+            # The body itself is malformed; keep what was already imported and say where it stopped
+            result["aborted"] = str(e)
+        if batch:
+            await flush()
+        result["errors_truncated"] = result["failed"] > len(result["errors"])
+        return result
 
     async def update_book(self, book_id: str, data: BookUpdate) -> Optional[BookOut]:
         payload = {k: v for k, v in data.dict(exclude_unset=True).items() if v is not None}
+        seen = self._invalidations
         doc = await self._repo.update_one(book_id, payload)
-        return _to_out(doc) if doc else None
+        if not doc:
+            self.cache.delete(book_id)
+            return None
+        # Evicts here and in the other workers
+        await self.bus.publish(self._db_name, self._collection_name, book_id, doc)
+        out = _to_out(doc)
+        # Only our own publish landed meanwhile; otherwise an overlapping write may be newer than ours
+        if self._invalidations == seen + 1:
+            self.cache.set(book_id, out)
+        return out
 
     async def delete_book(self, book_id: str) -> bool:
-        return await self._repo.delete_one(book_id)
+        deleted = await self._repo.delete_one(book_id)
+        # After the delete, so a read racing it cannot cache the book again
+        if deleted:
+            await self.bus.publish(self._db_name, self._collection_name, book_id)
+        else:
+            self.cache.delete(book_id)
+        return deleted
@@ -0,0 +1,151 @@
+import codecs
+import json
+import os
+from typing import Any, AsyncIterator, Tuple
+
+# Rows come out as (row_number, value). A row that could not be parsed
+# carries a RowError instead of a value so the importer can report it
+# and move on.
+
+# Largest single row (NDJSON line or array element) in characters. A row still
+# incomplete past this aborts the import instead of buffering the rest of the upload.
+BULK_MAX_ROW_CHARS = int(os.environ.get("BULK_MAX_ROW_CHARS", str(1024 * 1024)))
+# Longest tail a truncated but valid row can fail to decode at: a cut-off \uXXXX escape
+_TRUNCATION_SLACK = 6
+
+
+class RowError:
+    def __init__(self, message: str):
+        self.message = message
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes], max_row: int = BULK_MAX_ROW_CHARS) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    One JSON document per line; a bad line is a per-row error, not a failed
+    import. Raises ValueError once a line runs past max_row characters.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    row = 0
+
+    def parse(line: str):
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError as e:
+            return RowError(f"Invalid JSON: {e}")
+        except RecursionError:
+            return RowError("Invalid JSON: nested too deeply")
+
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            if line.strip():
+                yield row, parse(line)
+                row += 1
+        if len(buf) > max_row:
+            raise ValueError(f"Row {row} is longer than {max_row} characters")
+    buf += decoder.decode(b"", final=True)
+    if buf.strip():
+        yield row, parse(buf)
+
+
+def _cannot_be_cut_short(error: json.JSONDecodeError, buf: str) -> bool:
+    """
+    Whether a decode error stands however the row continues. A truncated but
+    valid row only fails at its very end (a cut-off literal, number or escape),
+    or as an unterminated string, which is reported where the string starts.
+    """
+    return not error.msg.startswith("Unterminated string") and error.pos < len(buf) - _TRUNCATION_SLACK
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes], max_row: int = BULK_MAX_ROW_CHARS) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Decode a top-level JSON array element by element as the body arrives,
+    so only the current, not yet complete element is ever buffered.
+    Raises ValueError, with the row and character offset, if the body is
+    not a well-formed array: elements must be separated by exactly one
+    comma, nothing but whitespace may follow the closing bracket, and no
+    element may run past max_row characters. A malformed element fails as
+    soon as enough of it has arrived to tell.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    # Characters dropped from the front of buf, so errors can say where in the body they are
+    offset = 0
+    row = 0
+    # What may come next: "[" at the start, then a value or "]",
+    # after each value a "," or "]", after each "," a value, after "]" nothing
+    expect = "start"
+    # An incomplete element is decoded again only once it has doubled, so a
+    # large one costs O(n) decoding in total rather than one pass per chunk
+    retry_at = 0
+    eof = False
+    chunk_iter = chunks.__aiter__()
+
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+
+        if pos < len(buf):
+            char = buf[pos]
+            if expect == "start":
+                if char != "[":
+                    raise ValueError("Expected a JSON array or NDJSON body")
+                expect = "first"
+                pos += 1
+                continue
+            if expect == "done":
+                raise ValueError(f"Unexpected content after the JSON array at character {offset + pos}")
+            if char == "]" and expect in ("first", "separator"):
+                expect = "done"
+                pos += 1
+                continue
+            if expect == "separator":
+                if char != ",":
+                    raise ValueError(f"Expected ',' or ']' after row {row - 1} at character {offset + pos}")
+                expect = "value"
+                pos += 1
+                continue
+            if char in ",]":
+                raise ValueError(f"Expected a value at row {row}, character {offset + pos}")
+            pending = len(buf) - pos
+            if eof or pending >= retry_at or pending > max_row:
+                try:
+                    value, end = json_decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    if eof or _cannot_be_cut_short(e, buf):
+                        raise ValueError(f"Malformed JSON at row {row}, character {offset + e.pos}: {e.msg}")
+                    retry_at = 2 * pending
+                except RecursionError:
+                    raise ValueError(f"Row {row} at character {offset + pos} is nested too deeply")
+                else:
+                    if end - pos > max_row:
+                        raise ValueError(f"Row {row} at character {offset + pos} is longer than {max_row} characters")
+                    # A value that runs to the end of the buffer may still be cut short (e.g. a number)
+                    if end < len(buf) or eof:
+                        yield row, value
+                        row += 1
+                        pos = end
+                        expect = "separator"
+                        retry_at = 0
+                        continue
+            # Still incomplete, so all of what is pending belongs to this row
+            if pending > max_row:
+                raise ValueError(f"Row {row} at character {offset + pos} is longer than {max_row} characters")
+        elif eof:
+            if expect != "done":
+                raise ValueError("Unexpected end of JSON array")
+            return
+
+        # Need more input; drop what has been consumed
+        buf = buf[pos:]
+        offset += pos
+        pos = 0
+        try:
+            buf += decoder.decode(await chunk_iter.__anext__())
+        except StopAsyncIteration:
+            buf += decoder.decode(b"", final=True)
+            eof = True
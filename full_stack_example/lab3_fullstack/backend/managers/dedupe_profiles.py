@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+One-off migration for stores written before profiles.user_id became unique.
+
+Older releases inserted a new profile on every submission, so a user can
+own several; the newest (highest _id) is the one the app has been serving.
+Startup only reports that the user_id_unique index could not be built and
+keeps /ready at 503. Run this once to see what is in the way:
+
+    cd backend && python -m managers.dedupe_profiles --dry-run
+
+then again without --dry-run to delete the superseded profiles and build
+the index. Prints the report as JSON.
+"""
+import argparse
+import asyncio
+import json
+from typing import Any, Dict
+
+from databases.indexes import delete_superseded, ensure_indexes, find_superseded
+from databases.registry import MONGO_URI, PROFILES_DB_NAME, registry
+
+
+async def run(uri: str, db_name: str, dry_run: bool, batch_size: int = 1000) -> Dict[str, Any]:
+    profiles = registry.collection(uri, db_name, "profiles")
+    try:
+        superseded = await find_superseded(profiles, "user_id")
+        report: Dict[str, Any] = {
+            "dry_run": dry_run,
+            "users": len(superseded),
+            "superseded": sum(len(group["delete"]) for group in superseded.values()),
+            "profiles": {
+                str(user_id): {"keep": str(group["keep"]), "delete": [str(_id) for _id in group["delete"]]}
+                for user_id, group in superseded.items()
+            },
+        }
+        if not dry_run:
+            report["deleted"] = await delete_superseded(profiles, superseded, batch_size)
+            report["indexes"] = (await ensure_indexes({"profiles": profiles}))["profiles"]
+    finally:
+        registry.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    parser.add_argument("--db", default=PROFILES_DB_NAME)
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted, change nothing")
+    parser.add_argument("--batch-size", type=int, default=1000, help="ids per delete_many")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.mongo_uri, args.db, args.dry_run, args.batch_size)), indent=2))
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import bcrypt
+
+from metrics import PASSWORD_HASH_DURATION
+
+# bcrypt releases the GIL, so threads scale with cores; override via env
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_MAX_PENDING = int(os.environ.get("PASSWORD_MAX_PENDING", str(PASSWORD_WORKERS * 4)))
+
+
+class PasswordPoolSaturated(Exception):
+    """Raised when the password pool already has max_pending jobs queued or running"""
+
+
+def _hash(password: str) -> str:
+    salt = bcrypt.gensalt()
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+class _Timing:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            avg = self.total / self.count if self.count else 0.0
+            return {
+                "count": self.count,
+                "avg_ms": round(avg * 1000, 3),
+                "max_ms": round(self.max * 1000, 3),
+            }
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, size-limited thread pool so hashing never
+    blocks the event loop. At most `max_pending` jobs may be queued or
+    running; beyond that callers get PasswordPoolSaturated immediately.
+    """
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, max_pending: int = PASSWORD_MAX_PENDING):
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self.rejected = 0
+        self.wait = _Timing()
+        self.work = _Timing()
+
+    async def hash(self, password: str) -> str:
+        return await self._submit("hash", _hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._submit("verify", _verify, password, hashed)
+
+    async def _submit(self, op: str, fn: Callable[..., Any], *args: Any) -> Any:
+        # _pending is only touched on the event loop thread, so no lock needed
+        if self._pending >= self._max_pending:
+            self.rejected += 1
+            raise PasswordPoolSaturated("Password hashing pool is saturated")
+        self._pending += 1
+        queued_at = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            self.wait.observe(started - queued_at)
+            PASSWORD_HASH_DURATION.observe(started - queued_at, op, "wait")
+            try:
+                return fn(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.work.observe(elapsed)
+                PASSWORD_HASH_DURATION.observe(elapsed, op, "work")
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, job)
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self._workers,
+            "max_pending": self._max_pending,
+            "pending": self._pending,
+            "rejected": self.rejected,
+            "wait": self.wait.snapshot(),
+            "work": self.work.snapshot(),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,25 +1,159 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from models.profile_model import ProfileCreate, ProfileOut
+import asyncio
+import os
+import time
+
+from databases.cache import Cache, cache_from_env
+from databases.backend import CollectionBackend
+from databases.invalidation import InvalidationBus
+from databases.profile_repository import ProfileRepository
+from databases.registry import registry
+from databases.single_flight import SingleFlight
+from databases.write_behind import group_commit_from_env
+from managers.profile_matcher import ProfileMatcher
+from models.profile_model import ProfileCreate, ProfileMatch, ProfileOut, RecommendationsOut
 from bson import ObjectId
+from typing import Any, Dict, List, Optional, Union
+
+# Keys a ProfileOut carries; the trusted row path emits exactly these
+_PROFILE_FIELDS = frozenset(ProfileOut.model_fields)
+
+# Minimum seconds between full matcher reloads forced by collection-wide invalidations
+MATCHER_RELOAD_INTERVAL = float(os.environ.get("MATCHER_RELOAD_INTERVAL", "30"))
+
+def _model_size(model) -> int:
+    return len(model.model_dump_json())
 
 class ProfilesManager:
-    def __init__(self, uri: str, db_name: str, collection: str):
-        self.client = AsyncIOMotorClient(uri)
-        self.db = self.client[db_name]
-        self.collection = self.db[collection]
+    def __init__(self, uri: str, db_name: str, collection: str, cache: Optional[Cache] = None,
+                 recommendations: str = "recommendations", bus: Optional[InvalidationBus] = None):
+        self.repo = ProfileRepository(uri, db_name, collection)
+        self._db_name = db_name
+        self._collection_name = collection
+        self.collection: CollectionBackend = self.repo.collection
+        # Materialized by managers/recommendation_job.py; read-only here
+        self.recommendations: CollectionBackend = registry.collection(uri, db_name, recommendations)
+        # Read-through cache for get_profile, populated on create
+        self.cache = cache if cache is not None else cache_from_env("PROFILES", sizeof=_model_size)
+        # Similarity index for /profiles/{user_id}/similar, loaded at startup and fed by create_profile
+        self.matcher = ProfileMatcher()
+        # Profile _id -> user_id of what the matcher holds, so a deletion finds its row
+        self._owners: Dict[str, str] = {}
+        # user_ids encoded while load_matcher scans; None outside a load
+        self._encoded_during_load: Optional[set] = None
+        # Profiles written here or by other workers evict from the cache and re-encode into the matcher
+        self.bus = bus or InvalidationBus()
+        self.bus.subscribe(db_name, collection, self._on_change)
+        self._invalidations = 0
+        # Concurrent full listings share one collection scan; writes and invalidations detach it
+        self.flights = SingleFlight(collection)
+        # Opt-in group commit for create_profile (PROFILES_WRITE_BEHIND_MS); None saves each profile on its own
+        self.writes = group_commit_from_env("PROFILES", collection, self._commit_saves, key=lambda p: p["user_id"])
+        self._matcher_loaded_at = 0.0
+        self._matcher_stale = False
+        self._matcher_reload: Optional[asyncio.Task] = None
+
+    def version(self) -> str:
+        """In-process validator the ETag on GET /profiles derives from; no round trip"""
+        return self.bus.version(self._db_name, self._collection_name)
 
     async def connect(self):
         pass  # MongoDB client connects lazily
 
     async def close(self):
-        self.client.close()
+        # Shared client is closed by the registry
+        if self.writes is not None:
+            await self.writes.close()
+        if self._matcher_reload:
+            self._matcher_reload.cancel()
+
+    async def _on_change(self, profile_id: Optional[str], doc: Optional[dict]):
+        self._invalidations += 1
+        self.flights.forget()
+        if profile_id is None:
+            self.cache.clear()
+            self._schedule_matcher_reload()
+            return
+        self.cache.delete(profile_id)
+        if doc:
+            self._encode([doc])
+        elif profile_id in self._owners:
+            self.matcher.remove(self._owners.pop(profile_id))
+        else:
+            # Deleted before this worker learned its owner (e.g. saved in a batch); rescan
+            self._schedule_matcher_reload()
+
+    def _encode(self, docs: List[Dict[str, Any]]):
+        """Add or replace profiles in the matcher, remembering each stored _id's owner"""
+        rows = []
+        for doc in docs:
+            row = {k: v for k, v in doc.items() if k in _PROFILE_FIELDS}
+            if "_id" in doc:
+                self._owners[str(doc["_id"])] = str(row["user_id"])
+            if self._encoded_during_load is not None:
+                self._encoded_during_load.add(str(row["user_id"]))
+            rows.append(row)
+        self.matcher.add_many(rows)
+
+    def _schedule_matcher_reload(self):
+        """Bursts of resets coalesce into one reload, at most every MATCHER_RELOAD_INTERVAL"""
+        self._matcher_stale = True
+        if self._matcher_reload is None or self._matcher_reload.done():
+            self._matcher_reload = asyncio.create_task(self._reload_matcher())
+
+    async def _reload_matcher(self):
+        while self._matcher_stale:
+            delay = self._matcher_loaded_at + MATCHER_RELOAD_INTERVAL - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._matcher_stale = False
+            try:
+                await self.load_matcher()
+            except Exception as e:
+                print(f"Profile matcher reload failed: {e}")
+
+    async def _commit_saves(self, rows: List[Dict[str, Any]]) -> List[Union[Dict[str, Any], Exception]]:
+        results = await self.repo.save_profile_batch(rows)
+        # Each caller then publishes its own profile, before it is answered
+        if any(not isinstance(r, Exception) for r in results):
+            self.flights.forget()
+        return results
 
     async def create_profile(self, data: ProfileCreate) -> ProfileOut:
-        doc = data.dict()
-        result = await self.collection.insert_one(doc)
-        return ProfileOut(id=str(result.inserted_id), **doc)
+        """Create or replace the caller's profile; one document per user_id"""
+        seen = self._invalidations
+        if self.writes is not None:
+            doc = await self.writes.submit(data.model_dump())
+        else:
+            doc = await self.repo.save_profile(data.model_dump())
+            self.flights.forget()
+        await self.bus.publish(self._db_name, self._collection_name, str(doc["_id"]), doc)
+        profile_id = str(doc.pop("_id"))
+        out = ProfileOut(**doc)
+        # Only our own publish landed meanwhile; otherwise an overlapping save may be newer than ours
+        if self._invalidations == seen + 1:
+            self.cache.set(profile_id, out)
+        self._encode([{"_id": profile_id, **out.model_dump()}])
+        return out
+
+    async def save_profiles(self, items: List[ProfileCreate], batch_size: int = 1000) -> Dict[str, Any]:
+        """Batch upsert for questionnaire submissions and backfills"""
+        rows = [item.model_dump() for item in items]
+        report = await self.repo.save_profiles(rows, batch_size)
+        if report["inserted"] or report["updated"]:
+            self.flights.forget()
+            # Which ids changed is not known here; other workers drop all of it
+            await self.bus.publish(self._db_name, self._collection_name, None)
+        failed = {e["index"] for e in report["errors"]}
+        self._encode([row for i, row in enumerate(rows) if i not in failed])
+        if report["updated"]:
+            # Replaced profiles are cached under ids this path never sees
+            self.cache.clear()
+        return report
 
     async def list_profiles(self):
+        return await self.flights.do(("list",), self._list_profiles, copy=list)
+
+    async def _list_profiles(self):
         cursor = self.collection.find()
         profiles = []
         async for doc in cursor:
@@ -28,10 +162,71 @@ class ProfilesManager:
             profiles.append(ProfileOut(**doc))
         return profiles
 
+    async def list_profile_rows(self) -> list:
+        """Same data as list_profiles, as plain dicts that skip model validation"""
+        return await self.flights.do(("rows",), self._list_profile_rows, copy=lambda rows: [dict(r) for r in rows])
+
+    async def _list_profile_rows(self) -> list:
+        projection = {field: 1 for field in _PROFILE_FIELDS}
+        cursor = self.collection.find({}, projection)
+        return [{k: v for k, v in doc.items() if k in _PROFILE_FIELDS} async for doc in cursor]
+
     async def get_profile(self, profile_id: str):
+        cached = self.cache.get(profile_id)
+        if cached is not None:
+            return cached
+        seen = self._invalidations
         doc = await self.collection.find_one({"_id": ObjectId(profile_id)})
         if not doc:
             return None
         doc["id"] = str(doc["_id"])
         del doc["_id"]
-        return ProfileOut(**doc)
+        out = ProfileOut(**doc)
+        # An invalidation that landed during the read may be newer than what we read
+        if seen == self._invalidations:
+            self.cache.set(profile_id, out)
+        return out
+
+    async def load_matcher(self, batch_size: int = 5000) -> int:
+        """
+        Encode every stored profile into the similarity index, then drop the
+        rows of profiles that are gone, unless they were written meanwhile.
+        """
+        self._matcher_loaded_at = time.monotonic()
+        self._encoded_during_load = set()
+        projection = {field: 1 for field in _PROFILE_FIELDS}
+        scanned = set()
+        batch = []
+        try:
+            async for doc in self.collection.find({}, projection).batch_size(batch_size):
+                scanned.add(str(doc["user_id"]))
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    self._encode(batch)
+                    batch = []
+            self._encode(batch)
+            gone = set(self.matcher.user_ids()) - scanned - self._encoded_during_load
+        finally:
+            self._encoded_during_load = None
+        for user_id in gone:
+            self.matcher.remove(user_id)
+        self._owners = {pid: uid for pid, uid in self._owners.items() if uid not in gone}
+        return len(self.matcher)
+
+    async def similar_profiles(self, user_id: str, k: int, metric: str = "cosine") -> Optional[List[ProfileMatch]]:
+        """Top-k profiles most similar to user_id's, or None if that user has no profile"""
+        if user_id not in self.matcher:
+            # Created by another worker since startup
+            doc = await self.collection.find_one({"user_id": user_id})
+            if not doc:
+                return None
+            self._encode([doc])
+        matches = self.matcher.similar(user_id, k, metric)
+        if matches is None:
+            return None
+        return [ProfileMatch(score=round(score, 6), **profile) for profile, score in matches]
+
+    async def get_recommendations(self, user_id: str) -> Optional[RecommendationsOut]:
+        """Precomputed recommendations for user_id, or None if the job hasn't covered them yet"""
+        doc = await self.recommendations.find_one({"user_id": user_id}, {"_id": 0, "fingerprint": 0})
+        return RecommendationsOut(**doc) if doc else None
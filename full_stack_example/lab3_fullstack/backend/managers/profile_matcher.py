@@ -0,0 +1,216 @@
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Single-valued fields are one-hot encoded, list fields multi-hot, and free-text fields
+# by their words, so two goals only need to share a word to count as overlapping
+_ONE_HOT = ("instrument", "experience")
+_MULTI_HOT = ("genres", "gear")
+_TOKENIZED = ("goal",)
+METRICS = ("cosine", "jaccard")
+
+# Words too common in goals to say anything about the person
+_STOPWORDS = frozenset("a an and at be for get i in into is it me my of on or the to with".split())
+
+# Columns each field may claim; values first seen after that are left out of the encoding
+# and counted. Caps are per field, so a flood of free-text goals can't crowd out genres.
+MATCHER_MAX_FEATURES: Dict[str, int] = {
+    field: int(os.environ.get(f"MATCHER_MAX_{field.upper()}", default))
+    for field, default in (("instrument", "128"), ("experience", "32"), ("goal", "512"),
+                           ("genres", "256"), ("gear", "256"))
+}
+# Longer values are cut to this many characters before they become a feature
+MATCHER_MAX_VALUE_LENGTH = 64
+
+# Set bits per byte value
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _normalize(value: Any) -> str:
+    # Case, punctuation and spacing don't make a different answer: "Rock 'n' Roll " == "rock n roll"
+    return " ".join(re.findall(r"\w+", str(value).lower()))[:MATCHER_MAX_VALUE_LENGTH]
+
+
+def profile_features(doc: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(field, value) features of a profile, normalized so 'Rock ' and 'rock' match"""
+    features = []
+    for field in _ONE_HOT:
+        value = _normalize(doc.get(field) or "")
+        if value:
+            features.append((field, value))
+    for field in _MULTI_HOT:
+        for value in doc.get(field) or ():
+            value = _normalize(value or "")
+            if value:
+                features.append((field, value))
+    for field in _TOKENIZED:
+        for word in _normalize(doc.get(field) or "").split():
+            if word not in _STOPWORDS:
+                features.append((field, word))
+    return list(dict.fromkeys(features))
+
+
+class ProfileMatcher:
+    """
+    In-memory similarity index over profiles. Each profile is a bit-packed
+    binary row, one bit per (field, value) seen so far, so 500k profiles at
+    the default caps take about 75 MB. The matrix is column-major, so a
+    query's overlap with every profile is a popcount over the few
+    contiguous byte columns the query profile has bits in, then
+    argpartition picks the top k. There is no Python loop over profiles
+    on the request path.
+
+    Rows are keyed by user_id; adding a profile for a known user replaces
+    its row and removing one moves the last row into its place. Storage
+    grows by doubling; each field claims columns up to its cap in
+    `max_features`, and features first seen beyond that are not encoded
+    and only counted.
+    """
+
+    def __init__(self, initial_rows: int = 1024, initial_columns: int = 64,
+                 max_features: Optional[Dict[str, int]] = None):
+        self._max_features = dict(max_features or MATCHER_MAX_FEATURES)
+        self._max_bytes = max(1, -(-sum(self._max_features.values()) // 8))
+        self._bits = np.zeros((initial_rows, min(-(-initial_columns // 8), self._max_bytes)), dtype=np.uint8, order="F")
+        self._sizes = np.zeros(initial_rows, dtype=np.float32)
+        self._columns: Dict[Tuple[str, str], int] = {}
+        self._field_columns: Dict[str, int] = dict.fromkeys(self._max_features, 0)
+        self.dropped_features: Dict[str, int] = dict.fromkeys(self._max_features, 0)
+        self._rows: Dict[str, int] = {}
+        self._profiles: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._rows
+
+    def _column(self, feature: Tuple[str, str]) -> Optional[int]:
+        """Column of `feature`, added if its field has room; None once the field is full"""
+        column = self._columns.get(feature)
+        if column is None:
+            field = feature[0]
+            if self._field_columns.get(field, 0) >= self._max_features.get(field, 0):
+                self.dropped_features[field] = self.dropped_features.get(field, 0) + 1
+                return None
+            self._field_columns[field] += 1
+            column = self._columns[feature] = len(self._columns)
+            if column // 8 >= self._bits.shape[1]:
+                width = min(self._bits.shape[1] * 2, self._max_bytes)
+                grown = np.zeros((self._bits.shape[0], width), dtype=np.uint8, order="F")
+                grown[:, : self._bits.shape[1]] = self._bits
+                self._bits = grown
+        return column
+
+    def _reserve(self, n_rows: int):
+        capacity = self._bits.shape[0]
+        if n_rows <= capacity:
+            return
+        while capacity < n_rows:
+            capacity *= 2
+        grown = np.zeros((capacity, self._bits.shape[1]), dtype=np.uint8, order="F")
+        grown[: self._bits.shape[0]] = self._bits
+        self._bits = grown
+        sizes = np.zeros(capacity, dtype=np.float32)
+        sizes[: self._sizes.shape[0]] = self._sizes
+        self._sizes = sizes
+
+    def add(self, profile: Dict[str, Any]):
+        self.add_many([profile])
+
+    def add_many(self, profiles: Iterable[Dict[str, Any]]):
+        """Insert or replace profiles; the encoding is written in one vectorized update"""
+        encoded: Dict[int, List[int]] = {}
+        for profile in profiles:
+            user_id = str(profile["user_id"])
+            row = self._rows.get(user_id)
+            if row is None:
+                row = self._rows[user_id] = len(self._profiles)
+                self._profiles.append(profile)
+                self._reserve(len(self._profiles))
+            else:
+                self._profiles[row] = profile
+            # A later version of the same profile in this batch replaces the earlier one
+            encoded[row] = [c for c in map(self._column, profile_features(profile)) if c is not None]
+        if not encoded:
+            return
+        rows = np.fromiter(encoded, dtype=np.intp, count=len(encoded))
+        self._bits[rows] = 0
+        self._sizes[rows] = [len(columns) for columns in encoded.values()]
+        row_index = np.repeat(rows, [len(columns) for columns in encoded.values()])
+        columns = np.fromiter((c for cs in encoded.values() for c in cs), dtype=np.intp, count=len(row_index))
+        # Features of one row can share a byte, hence the unbuffered ufunc
+        np.bitwise_or.at(self._bits, (row_index, columns >> 3), (0x80 >> (columns & 7)).astype(np.uint8))
+
+    def remove(self, user_id: str) -> bool:
+        """Drop user_id's row; the last row moves into its place. False if user_id is unknown."""
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return False
+        last = len(self._profiles) - 1
+        if row != last:
+            moved = self._profiles[last]
+            self._profiles[row] = moved
+            self._rows[str(moved["user_id"])] = row
+            self._bits[row] = self._bits[last]
+            self._sizes[row] = self._sizes[last]
+        self._profiles.pop()
+        self._bits[last] = 0
+        self._sizes[last] = 0
+        return True
+
+    def row(self, user_id: str) -> Optional[int]:
+        return self._rows.get(user_id)
+
+    def user_ids(self) -> List[str]:
+        """user_ids in row order, i.e. aligned with scores()"""
+        return [str(p["user_id"]) for p in self._profiles]
+
+    def scores(self, user_id: str, metric: str = "cosine") -> Optional[np.ndarray]:
+        """Similarity of user_id's profile to every row, itself included. None if user_id is unknown."""
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}; expected one of {', '.join(METRICS)}")
+        row = self._rows.get(user_id)
+        if row is None:
+            return None
+        n = len(self._profiles)
+        bits = self._bits[:n]
+        sizes = self._sizes[:n]
+        query = bits[row].copy()
+        counts = np.zeros(n, dtype=np.uint16)
+        shared = np.empty(n, dtype=np.uint8)
+        for byte in np.flatnonzero(query):
+            np.bitwise_and(bits[:, byte], query[byte], out=shared)
+            np.take(_POPCOUNT, shared, out=shared)
+            counts += shared
+        overlap = counts.astype(np.float32)
+        if metric == "cosine":
+            denominator = np.sqrt(sizes * sizes[row])
+        else:
+            denominator = sizes + sizes[row] - overlap
+        return np.divide(overlap, denominator, out=np.zeros_like(overlap), where=denominator > 0)
+
+    def similar(self, user_id: str, k: int = 10, metric: str = "cosine") -> Optional[List[Tuple[Dict[str, Any], float]]]:
+        """Top-k other profiles by similarity to user_id's, best first. None if user_id is unknown."""
+        scores = self.scores(user_id, metric)
+        if scores is None:
+            return None
+        scores[self._rows[user_id]] = -np.inf
+
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self._profiles[i], float(scores[i])) for i in top]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"profiles": len(self._profiles), "features": len(self._columns),
+                "max_features": sum(self._max_features.values()),
+                "dropped_features": sum(self.dropped_features.values()),
+                "fields": {field: {"features": self._field_columns[field], "max_features": cap,
+                                   "dropped_features": self.dropped_features[field]}
+                           for field, cap in self._max_features.items()},
+                "matrix_bytes": int(self._bits.nbytes)}
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Offline job that materializes top-k profile recommendations.
+
+Streams every profile into a ProfileMatcher, scores users across a process
+pool and bulk-upserts one document per user into the `recommendations`
+collection, which GET /profiles/{user_id}/recommendations serves as is.
+
+Reruns are incremental. Each stored document carries a fingerprint of the
+profile features it was computed from, and a user is recomputed when
+  - their own fingerprint changed (or they have no document yet),
+  - a profile in their stored list changed or was deleted, or
+  - a changed profile now scores above the last entry of their list
+    (similarity is symmetric, so this falls out of scoring the changed
+    profiles themselves).
+Documents of deleted profiles are removed. --full recomputes everyone.
+
+    cd backend && python -m managers.recommendation_job [--k 10] [--metric cosine] [--workers 4] [--full]
+
+Prints per-stage timings and counts as JSON; run it from cron or a
+scheduler as often as profiles change.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from pymongo import DeleteOne, UpdateOne
+
+from databases.backend import CollectionBackend
+from databases.indexes import ensure_indexes
+from databases.registry import MONGO_URI, PROFILES_DB_NAME, registry
+from managers.profile_matcher import METRICS, ProfileMatcher, profile_features
+
+RECOMMENDATIONS_COLLECTION = os.environ.get("RECOMMENDATIONS_COLLECTION", "recommendations")
+_PROFILE_PROJECTION = {"_id": 0, "user_id": 1, "instrument": 1, "experience": 1, "goal": 1, "genres": 1, "gear": 1}
+
+Item = Tuple[str, float]
+
+
+def fingerprint(profile: Dict[str, Any]) -> str:
+    """Stable digest of the features a recommendation depends on"""
+    features = sorted(f"{field}={value}" for field, value in profile_features(profile))
+    return hashlib.sha1("\n".join(features).encode()).hexdigest()
+
+
+# ---------- Worker side ----------
+# Set once per worker process by the pool initializer; inherited without a copy under fork
+_matcher: Optional[ProfileMatcher] = None
+_user_ids: List[str] = []
+_thresholds: Optional[np.ndarray] = None
+
+
+def _init_worker(matcher: ProfileMatcher, thresholds: np.ndarray):
+    global _matcher, _user_ids, _thresholds
+    _matcher = matcher
+    _user_ids = matcher.user_ids()
+    _thresholds = thresholds
+
+
+def _score_chunk(user_ids: List[str], k: int, metric: str) -> Tuple[Dict[str, List[Item]], Set[str]]:
+    """
+    Top-k for each user in the chunk, plus the other users for whom one of
+    these profiles now beats the last entry of their stored list.
+    """
+    assert _matcher is not None and _thresholds is not None
+    results: Dict[str, List[Item]] = {}
+    displaced: Set[str] = set()
+    for user_id in user_ids:
+        scores = _matcher.scores(user_id, metric)
+        if scores is None:
+            continue
+        row = _matcher.row(user_id)
+        beats = np.flatnonzero(scores > _thresholds)
+        displaced.update(_user_ids[i] for i in beats if i != row)
+
+        scores[row] = -np.inf
+        n = min(k, len(scores) - 1)
+        if n <= 0:
+            results[user_id] = []
+            continue
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results[user_id] = [(_user_ids[i], round(float(scores[i]), 6)) for i in top]
+    return results, displaced
+
+
+# ---------- Stages ----------
+
+async def load_profiles(profiles: CollectionBackend, batch_size: int = 5000) -> Tuple[ProfileMatcher, Dict[str, str]]:
+    matcher = ProfileMatcher()
+    fingerprints: Dict[str, str] = {}
+    batch: List[Dict[str, Any]] = []
+    async for doc in profiles.find({}, _PROFILE_PROJECTION).batch_size(batch_size):
+        user_id = str(doc["user_id"])
+        fingerprints[user_id] = fingerprint(doc)
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            matcher.add_many(batch)
+            batch = []
+    matcher.add_many(batch)
+    return matcher, fingerprints
+
+
+async def load_previous(recommendations: CollectionBackend, k: int, metric: str) -> Dict[str, Dict[str, Any]]:
+    """Stored documents computed with the same k and metric; anything else counts as missing"""
+    previous = {}
+    async for doc in recommendations.find({"k": k, "metric": metric}, {"_id": 0, "user_id": 1, "fingerprint": 1, "items": 1}):
+        previous[doc["user_id"]] = doc
+    return previous
+
+
+def plan(fingerprints: Dict[str, str], previous: Dict[str, Dict[str, Any]], full: bool) -> Tuple[Set[str], Set[str], Set[str]]:
+    """(changed users, users whose list references a changed/removed profile, removed users)"""
+    removed = set(previous) - set(fingerprints)
+    if full:
+        return set(fingerprints), set(), removed
+    changed = {u for u, fp in fingerprints.items() if previous.get(u, {}).get("fingerprint") != fp}
+    dirty = changed | removed
+    stale = {
+        u for u, doc in previous.items()
+        if u in fingerprints and u not in changed and any(item["user_id"] in dirty for item in doc.get("items", ()))
+    }
+    return changed, stale, removed
+
+
+def thresholds(matcher: ProfileMatcher, previous: Dict[str, Dict[str, Any]], k: int, full: bool) -> np.ndarray:
+    """Per row, the score a changed profile must beat to enter that user's stored list"""
+    out = np.full(len(matcher), np.inf, dtype=np.float32)
+    if full:
+        return out
+    for row, user_id in enumerate(matcher.user_ids()):
+        items = previous.get(user_id, {}).get("items")
+        if items is None:
+            continue  # No list yet; recomputed anyway
+        out[row] = items[-1]["score"] if len(items) >= k else -np.inf
+    return out
+
+
+def compute(matcher: ProfileMatcher, limits: np.ndarray, user_ids: List[str], k: int, metric: str,
+            workers: int) -> Tuple[Dict[str, List[Item]], Set[str]]:
+    if not user_ids:
+        return {}, set()
+    if workers <= 1:
+        _init_worker(matcher, limits)
+        return _score_chunk(user_ids, k, metric)
+    chunk = max(1, math.ceil(len(user_ids) / (workers * 4)))
+    chunks = [user_ids[i:i + chunk] for i in range(0, len(user_ids), chunk)]
+    results: Dict[str, List[Item]] = {}
+    displaced: Set[str] = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matcher, limits)) as pool:
+        for part, more in pool.map(_score_chunk, chunks, [k] * len(chunks), [metric] * len(chunks)):
+            results.update(part)
+            displaced |= more
+    return results, displaced
+
+
+async def write(recommendations: CollectionBackend, results: Dict[str, List[Item]], fingerprints: Dict[str, str],
+                removed: Set[str], k: int, metric: str, batch_size: int) -> int:
+    computed_at = datetime.now(timezone.utc)
+    ops: List[Any] = [
+        UpdateOne(
+            {"user_id": user_id},
+            {"$set": {
+                "fingerprint": fingerprints[user_id],
+                "k": k,
+                "metric": metric,
+                "items": [{"user_id": other, "score": score} for other, score in items],
+                "computed_at": computed_at,
+            }},
+            upsert=True,
+        )
+        for user_id, items in results.items()
+    ]
+    ops.extend(DeleteOne({"user_id": user_id}) for user_id in removed)
+    for start in range(0, len(ops), batch_size):
+        await recommendations.bulk_write(ops[start:start + batch_size], ordered=False)
+    return len(ops)
+
+
+async def run(uri: str, db_name: str, k: int, metric: str, workers: int, full: bool,
+              batch_size: int = 1000) -> Dict[str, Any]:
+    timings: Dict[str, float] = {}
+
+    def lap(stage: str, started: float):
+        timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+    profiles = registry.collection(uri, db_name, "profiles")
+    recommendations = registry.collection(uri, db_name, RECOMMENDATIONS_COLLECTION)
+    try:
+        started = time.perf_counter()
+        await ensure_indexes({"recommendations": recommendations})
+        matcher, fingerprints = await load_profiles(profiles)
+        lap("load_profiles_ms", started)
+
+        started = time.perf_counter()
+        previous = await load_previous(recommendations, k, metric)
+        changed, stale, removed = plan(fingerprints, previous, full)
+        limits = thresholds(matcher, previous, k, full)
+        lap("plan_ms", started)
+
+        # Pass 1 scores the changed profiles, which also reveals whose lists they displace
+        started = time.perf_counter()
+        results, displaced = compute(matcher, limits, sorted(changed), k, metric, workers)
+        second = sorted((stale | displaced) - set(results))
+        more, _ = compute(matcher, limits, second, k, metric, workers)
+        results.update(more)
+        lap("compute_ms", started)
+
+        started = time.perf_counter()
+        written = await write(recommendations, results, fingerprints, removed, k, metric, batch_size)
+        lap("write_ms", started)
+    finally:
+        registry.close()
+
+    return {
+        "profiles": len(fingerprints),
+        "changed": len(changed),
+        "stale": len(stale),
+        "displaced": len(displaced - changed),
+        "recomputed": len(results),
+        "removed": len(removed),
+        "writes": written,
+        "full": full,
+        "workers": workers,
+        "timings": {**timings, "total_ms": round(sum(timings.values()), 1)},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # Same settings the app reads, so the job writes where GET /profiles/{user_id}/recommendations reads
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    parser.add_argument("--db", default=PROFILES_DB_NAME)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--metric", default="cosine", choices=METRICS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=1000, help="operations per bulk_write")
+    parser.add_argument("--full", action="store_true", help="recompute every user, not just the affected ones")
+    args = parser.parse_args()
+    report = asyncio.run(run(args.mongo_uri, args.db, args.k, args.metric, args.workers, args.full, args.batch_size))
+    print(json.dumps(report, indent=2))
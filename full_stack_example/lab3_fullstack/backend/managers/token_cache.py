@@ -0,0 +1,92 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from models.user_model import UserOut
+
+# Verified-token cache bounds; override via env
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens whose signature has already been checked, mapped
+    to the user they resolved to. An entry never outlives the token's own
+    `exp`, and is also capped at `ttl` seconds so user changes show up.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[UserOut, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[UserOut]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user: UserOut, exp: float):
+        self._entries[token] = (user, min(exp, time.time() + self._ttl))
+        self._entries.move_to_end(token)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, token: str):
+        self._entries.pop(token, None)
+
+    def discard_user(self, user_id: str):
+        for token in [t for t, (u, _) in self._entries.items() if u.id == user_id]:
+            del self._entries[token]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def token_id(token: str) -> str:
+    """Digest a revoked token is stored and shared under, so the token itself never leaves the worker"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenDenylist:
+    """
+    In-memory set of revoked token ids, each kept only until the token
+    would have expired anyway. UserManager fills it from the
+    revoked_tokens collection and the bus, so every worker denies a
+    token revoked on any of them.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[str, float] = {}
+
+    def revoke(self, token_id: str, exp: float):
+        self._revoked[token_id] = exp
+        self._prune()
+
+    def is_revoked(self, token: str) -> bool:
+        # Nothing revoked is the common case; skip the digest then
+        return bool(self._revoked) and token_id(token) in self._revoked
+
+    def _prune(self):
+        now = time.time()
+        for token in [t for t, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[token]
+
+    def __len__(self) -> int:
+        return len(self._revoked)
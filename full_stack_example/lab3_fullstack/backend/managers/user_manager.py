@@ -1,43 +1,113 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from databases.backend import CollectionBackend
+from databases.invalidation import InvalidationBus
+from databases.registry import registry
+from managers.password_hasher import PasswordHasher
+from managers.token_cache import TokenDenylist, VerifiedTokenCache, token_id
 from models.user_model import UserCreate, UserLogin, UserOut, UserInDB
 from bson import ObjectId
-from datetime import datetime
-import bcrypt
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
 import jwt
 import os
 from typing import Optional
 
 class UserManager:
-    def __init__(self, uri: str, db_name: str, collection: str):
-        self.client = AsyncIOMotorClient(uri)
-        self.db = self.client[db_name]
-        self.collection = self.db[collection]
+    def __init__(self, uri: str, db_name: str, collection: str, bus: Optional[InvalidationBus] = None,
+                 revoked: str = "revoked_tokens"):
+        self.collection: CollectionBackend = registry.collection(uri, db_name, collection)
+        # Logged-out tokens until they expire; a TTL index (databases/indexes.py) removes them after that
+        self.revoked: CollectionBackend = registry.collection(uri, db_name, revoked)
+        self._db_name = db_name
+        self._revoked_name = revoked
         self.secret_key = os.getenv("SECRET_KEY", "supersecret")
+        self.passwords = PasswordHasher()
+        self.token_cache = VerifiedTokenCache()
+        self.denylist = TokenDenylist()
+        # A user changed or deleted anywhere drops the tokens cached for them here
+        self.bus = bus or InvalidationBus()
+        self.bus.subscribe(db_name, collection, self._on_change)
+        # A token revoked anywhere is denied here too
+        self.bus.subscribe(db_name, revoked, self._on_revoked)
 
     async def connect(self):
         pass  # MongoDB client connects lazily
 
     async def close(self):
-        self.client.close()
+        # Shared client is closed by the registry; only the password pool is ours
+        self.passwords.shutdown()
 
-    def hash_password(self, password: str) -> str:
-        """Hash a password using bcrypt"""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    async def _on_change(self, user_id: Optional[str], doc: Optional[dict]):
+        if user_id is None:
+            self.token_cache.clear()
+        else:
+            self.token_cache.discard_user(user_id)
 
-    def verify_password(self, password: str, hashed: str) -> bool:
-        """Verify a password against its hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    async def _on_revoked(self, key: Optional[str], doc: Optional[dict]):
+        if key is None:
+            await self.load_denylist()
+        elif doc:
+            # Deletes are the TTL index expiring the entry; the denylist prunes it on its own
+            self.denylist.revoke(key, doc["exp"])
+
+    async def load_denylist(self) -> int:
+        """Read the revocations made before this worker started"""
+        async for doc in self.revoked.find({}, {"exp": 1}):
+            self.denylist.revoke(doc["_id"], doc["exp"])
+        return len(self.denylist)
+
+    async def hash_password(self, password: str) -> str:
+        """Hash a password using bcrypt on the password pool"""
+        return await self.passwords.hash(password)
+
+    async def verify_password(self, password: str, hashed: str) -> bool:
+        """Verify a password against its hash on the password pool"""
+        return await self.passwords.verify(password, hashed)
 
     def create_token(self, user_id: str, email: str) -> str:
         """Create a JWT token for the user"""
         payload = {
             "user_id": user_id,
             "email": email,
-            "exp": datetime.utcnow() + datetime.timedelta(days=7)  # 7 days expiry
+            "exp": datetime.utcnow() + timedelta(days=7)  # 7 days expiry
         }
         return jwt.encode(payload, self.secret_key, algorithm="HS256")
 
+    def decode_token(self, token: str) -> dict:
+        """Verify signature and expiry; raises ValueError if the token is not valid"""
+        try:
+            return jwt.decode(token, self.secret_key, algorithms=["HS256"])
+        except jwt.InvalidTokenError as e:
+            raise ValueError(f"Invalid token: {e}")
+
+    async def user_from_token(self, token: str) -> UserOut:
+        """
+        Resolve a bearer token to its user. Tokens seen before are answered
+        from the verified-token cache, so the steady state costs neither a
+        signature check nor a Mongo round trip.
+        """
+        if self.denylist.is_revoked(token):
+            raise ValueError("Token has been revoked")
+        user = self.token_cache.get(token)
+        if user is not None:
+            return user
+
+        claims = self.decode_token(token)
+        user = await self.get_user_by_id(claims["user_id"])
+        if not user:
+            raise ValueError("User no longer exists")
+        self.token_cache.put(token, user, claims["exp"])
+        return user
+
+    async def revoke_token(self, token: str):
+        """Deny a token for the rest of its lifetime, on every worker"""
+        claims = self.decode_token(token)
+        key = token_id(token)
+        # expires_at drives the TTL index; exp is what the denylist compares against
+        doc = {"exp": claims["exp"], "expires_at": datetime.utcfromtimestamp(claims["exp"])}
+        await self.revoked.update_one({"_id": key}, {"$set": doc}, upsert=True)
+        self.token_cache.discard(token)
+        await self.bus.publish(self._db_name, self._revoked_name, key, {"_id": key, **doc})
+
     async def register_user(self, user_data: UserCreate) -> UserOut:
         """Register a new user"""
         # Check if user already exists
@@ -46,7 +116,7 @@ class UserManager:
             raise ValueError("User with this email already exists")
         
         # Hash the password
-        password_hash = self.hash_password(user_data.password)
+        password_hash = await self.hash_password(user_data.password)
         
         # Create user document
         now = datetime.utcnow()
@@ -58,7 +128,11 @@ class UserManager:
             "updated_at": now
         }
         
-        result = await self.collection.insert_one(user_doc)
+        try:
+            result = await self.collection.insert_one(user_doc)
+        except DuplicateKeyError:
+            # Lost the race against a concurrent registration; the unique index caught it
+            raise ValueError("User with this email already exists")
         user_doc["id"] = str(result.inserted_id)
         
         return UserOut(**user_doc)
@@ -71,7 +145,7 @@ class UserManager:
             raise ValueError("Invalid email or password")
         
         # Verify password
-        if not self.verify_password(login_data.password, user_doc["password_hash"]):
+        if not await self.verify_password(login_data.password, user_doc["password_hash"]):
             raise ValueError("Invalid email or password")
         
         # Create token
@@ -0,0 +1,247 @@
+"""
+Process-local metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain Python objects keyed by label
+values, cheap enough to update on every request (a lock and a bisect).
+Values that already live elsewhere (pool occupancy, queue depth) are
+exposed as callback gauges read at scrape time. Everything registered
+here is rendered by GET /metrics.
+
+With several uvicorn workers each process has its own numbers; scrape
+each worker, or aggregate at the collector.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+
+# Seconds; covers sub-millisecond cache hits up to slow bcrypt/OAuth calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    @abstractmethod
+    def _samples(self) -> List[str]: ...
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose values are read from `fn` at scrape time: {label values: value}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], fn: Callable[[], Dict[Labels, float]]):
+        super().__init__(name, help, labelnames)
+        self._fn = fn
+
+    def _samples(self) -> List[str]:
+        try:
+            items = self._fn().items()
+        except Exception as e:
+            # Source not ready (e.g. before startup); skip rather than fail the scrape
+            print(f"Metric {self.name} unavailable: {e}")
+            return []
+        return [f"{self.name}{_label_text(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self._buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._series.items()]
+        lines = []
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Metrics shared across modules ----------
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time from request start to last response byte",
+    ("method", "route", "status"),
+)
+# Only changed on the event loop, so a plain int read at scrape time instead of a locked Gauge
+_http_in_flight = 0
+CallbackGauge("http_requests_in_flight", "Requests currently being served", (), lambda: {(): _http_in_flight})
+
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "Server round trip of each Mongo command, as reported by the driver",
+    ("collection", "command", "outcome"),
+)
+
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "bcrypt jobs: time queued for a worker (wait) and hashing (work)",
+    ("op", "phase"), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.5, 5.0),
+)
+
+OAUTH_REQUEST_DURATION = Histogram(
+    "oauth_request_duration_seconds", "Outbound calls to the OAuth provider",
+    ("call", "outcome"),
+)
+
+CACHE_INVALIDATIONS = Counter(
+    "cache_invalidations_total", "Changes delivered to this worker's caches: single documents (key) or whole collections (reset)",
+    ("collection", "kind"),
+)
+
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total", "Coalesced reads: queries sent (leader) and callers that shared one (shared)",
+    ("name", "outcome"),
+)
+
+WRITE_BEHIND_BATCH_SIZE = Histogram(
+    "write_behind_batch_size", "Writes committed together by one group commit",
+    ("name",), buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+ADMISSION_SHED = Counter(
+    "admission_shed_total", "Requests refused by admission control before doing any work",
+    ("route", "reason"),
+)
+
+COMPRESSION_BYTES = Counter(
+    "http_compression_bytes_total", "Response body bytes before (in) and after (out) compression",
+    ("encoding", "direction"),
+)
+
+
+# ---------- ASGI middleware ----------
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request, labelled by route template (not raw path, to
+    keep label cardinality bounded). Plain ASGI rather than
+    BaseHTTPMiddleware, so the only per-request cost is the bookkeeping.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _http_in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _http_in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route on the (shared) scope
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], template, str(status))
+            _http_in_flight -= 1
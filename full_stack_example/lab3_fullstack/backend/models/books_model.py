@@ -19,3 +19,11 @@ class BookUpdate(BaseModel):
 class BookOut(BookBase):
     id: str = Field(..., description="Stringified ObjectId")
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class BookFilter(BaseModel):
+    author: Optional[str] = None
+    genre: Optional[str] = None
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    q: Optional[str] = Field(None, description="Free-text search over title and author")
+    sort: str = Field("id", description="id, title, author, year or genre; '-' prefix for descending; 'relevance' with q")
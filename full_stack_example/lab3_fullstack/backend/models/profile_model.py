@@ -1,5 +1,6 @@
 
 from pydantic import BaseModel
+from datetime import datetime
 from typing import List
 
 class ProfileCreate(BaseModel):
@@ -12,4 +13,18 @@ class ProfileCreate(BaseModel):
     gear: List[str]  
 
 class ProfileOut(ProfileCreate):
-    pass  
\ No newline at end of file
+    pass
+
+class ProfileMatch(ProfileOut):
+    score: float
+
+class RecommendationItem(BaseModel):
+    user_id: str
+    score: float
+
+class RecommendationsOut(BaseModel):
+    user_id: str
+    k: int
+    metric: str
+    computed_at: datetime
+    items: List[RecommendationItem]
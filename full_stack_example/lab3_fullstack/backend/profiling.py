@@ -0,0 +1,160 @@
+"""
+On-demand profiling of single requests.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` or is
+picked by PROFILE_SAMPLE_RATE. While it runs, a sampler thread records the
+Python stacks of the event loop thread and of any busy worker thread
+(bcrypt pool, Motor/pymongo I/O, SQLite). When the response is done the
+samples are written to PROFILE_DIR/<id>.folded in collapsed-stack format,
+which flamegraph.pl, speedscope and most flamegraph viewers load as is.
+The id is returned in the X-Profile-Id response header.
+
+Caveat: the event loop interleaves requests, so samples taken during a
+profiled request can include work done for other requests in flight.
+
+With neither PROFILE_TOKEN nor PROFILE_SAMPLE_RATE set the middleware is
+not installed at all.
+"""
+import asyncio
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional
+
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "1"))
+# Sampling is not free; cap how many requests are profiled at once
+PROFILE_MAX_CONCURRENT = int(os.environ.get("PROFILE_MAX_CONCURRENT", "1"))
+
+_PROFILE_HEADER = b"x-profile"
+# Fetching a dump with the token must not write another one
+_DUMP_ROUTE = "/admin/profiles/"
+# A worker whose innermost Python frame is here is parked, not working for anyone
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", os.path.join("concurrent", "futures", "thread.py"))
+
+
+def enabled() -> bool:
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stacks of `loop_thread` and of busy threads every `interval` seconds"""
+
+    def __init__(self, loop_thread: int, interval: float):
+        self._loop_thread = loop_thread
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Signals the thread without waiting for it, so it is safe to call on the event loop"""
+        self._stop.set()
+
+    def join(self):
+        """Waits for the last sample after stop(); blocks, so call it off the event loop"""
+        self._thread.join()
+
+    def _run(self):
+        names: Dict[int, str] = {}
+        own = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident != self._loop_thread and frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                root = "event-loop" if ident == self._loop_thread else names.get(ident, str(ident))
+                self.stacks[";".join([root, *reversed(stack)])] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _write_dump(path: str, sampler: StackSampler):
+    """Runs in a worker thread: waits out the stopped sampler, then writes its stacks"""
+    sampler.join()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        f.write(sampler.collapsed())
+
+
+class ProfilingMiddleware:
+    """Plain ASGI; an untriggered request costs one header scan (and a random() with sampling on)"""
+
+    def __init__(self, app, token: str = PROFILE_TOKEN, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 directory: str = PROFILE_DIR, interval_ms: float = PROFILE_INTERVAL_MS,
+                 max_concurrent: int = PROFILE_MAX_CONCURRENT):
+        self.app = app
+        self._token = token.encode()
+        self._sample_rate = sample_rate
+        self._directory = directory
+        self._interval = interval_ms / 1000
+        self._max_concurrent = max_concurrent
+        self._active = 0
+
+    def _triggered(self, scope) -> bool:
+        if self._token:
+            for name, value in scope["headers"]:
+                if name == _PROFILE_HEADER:
+                    return hmac.compare_digest(value, self._token)
+        return self._sample_rate > 0 and random.random() < self._sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not self._triggered(scope) or self._active >= self._max_concurrent
+                or scope["path"].startswith(_DUMP_ROUTE)):
+            await self.app(scope, receive, send)
+            return
+
+        dump_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", dump_id.encode())]}
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), self._interval)
+        self._active += 1
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            self._active -= 1
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            path = os.path.join(self._directory, f"{dump_id}.folded")
+            try:
+                await asyncio.to_thread(_write_dump, path, sampler)
+                print(f"Profiled {scope['method']} {scope['path']}: {elapsed_ms:.1f} ms, "
+                      f"{sampler.samples} samples -> {path}")
+            except OSError as e:
+                print(f"Profile dump {path} failed: {e}")
+
+
+def dump_path(dump_id: str, directory: str = PROFILE_DIR) -> Optional[str]:
+    """Path of a written dump, or None; ids are reduced to a bare file name"""
+    path = os.path.join(directory, f"{os.path.basename(dump_id)}.folded")
+    return path if os.path.isfile(path) else None
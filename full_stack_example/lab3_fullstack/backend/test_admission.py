@@ -0,0 +1,162 @@
+"""
+Admission control: token buckets and the concurrency limit in front of the auth routes.
+    python -m pytest -q test_admission.py
+"""
+import asyncio
+
+import pytest
+
+import admission
+from admission import ConcurrencyLimiter, Policy, RateLimiter, Shed
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces time.monotonic in admission; advance it by assigning clock.now"""
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(admission.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_rate_limiter_allows_the_burst_then_says_how_long_to_wait(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.take("ip") for _ in range(3)] == [0, 0, 0]
+    assert limiter.take("ip") == pytest.approx(0.5)
+
+
+def test_rate_limiter_refills_at_its_rate(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    for _ in range(3):
+        limiter.take("ip")
+    clock.now += 0.5
+    assert limiter.take("ip") == 0
+    assert limiter.take("ip") > 0
+    clock.now += 60
+    # Never more than the burst
+    assert [limiter.take("ip") for _ in range(4)][-1] > 0
+
+
+def test_rate_limiter_keys_are_independent_and_bounded(clock):
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    assert limiter.take("a") == 0
+    assert limiter.take("b") == 0
+    assert limiter.take("a") > 0
+    limiter.take("c")
+    assert len(limiter) == 2
+    # "b" was the least recently seen, so it was dropped and starts full again
+    assert limiter.take("b") == 0
+
+
+def test_concurrency_limiter_admits_up_to_the_limit_at_once():
+    async def scenario():
+        limiter = ConcurrencyLimiter(limit=2, max_queue=0, queue_timeout=1)
+        return limiter, [await limiter.acquire() for _ in range(3)]
+
+    limiter, reasons = asyncio.run(scenario())
+    assert reasons == [None, None, "queue_full"]
+    assert limiter.active == 2
+
+
+def test_release_hands_the_slot_to_the_first_waiter():
+    async def scenario():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=2, queue_timeout=1)
+        await limiter.acquire()
+        first = asyncio.create_task(limiter.acquire())
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release(0.01)
+        assert await first is None
+        # Handed over, not freed: a newcomer still has to queue behind `second`
+        assert limiter.active == 1 and limiter.queued == 1
+        limiter.release(0.01)
+        assert await second is None
+        limiter.release(0.01)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.active == 0 and limiter.queued == 0
+
+
+def test_waiter_times_out_after_the_queue_deadline():
+    async def scenario():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=1, queue_timeout=0.01)
+        await limiter.acquire()
+        return limiter, await limiter.acquire()
+
+    limiter, reason = asyncio.run(scenario())
+    assert reason == "queue_timeout"
+    assert limiter.queued == 0 and limiter.active == 1
+
+
+def test_newcomer_is_shed_when_the_expected_wait_exceeds_the_deadline():
+    async def scenario():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=10, queue_timeout=0.5)
+        await limiter.acquire()
+        limiter.release(2.0)  # Slots are held for 2 s on average
+        await limiter.acquire()
+        return await limiter.acquire()
+
+    assert asyncio.run(scenario()) == "deadline"
+
+
+def test_cancelled_waiter_never_leaks_a_handed_over_slot():
+    async def scenario():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=2, queue_timeout=1)
+        await limiter.acquire()
+        gone = asyncio.create_task(limiter.acquire())
+        next_in_line = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # The slot reaches `gone` just as its client disconnects
+        limiter.release(0.01)
+        gone.cancel()
+        (outcome,) = await asyncio.gather(gone, return_exceptions=True)
+        if outcome is None:
+            # The cancellation lost the race and `gone` was admitted; it releases as usual
+            limiter.release(0.01)
+        else:
+            assert isinstance(outcome, asyncio.CancelledError)
+        assert await next_in_line is None
+        limiter.release(0.01)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.active == 0 and limiter.queued == 0
+
+
+class _Request:
+    """Just what Policy.admit reads off a request"""
+
+    def __init__(self, host):
+        self.client = type("Client", (), {"host": host})()
+
+
+def _attempts(policy, host, email, n):
+    """Status of each of n attempts: 200 when admitted, else the shed status"""
+    async def scenario():
+        statuses = []
+        for _ in range(n):
+            try:
+                async with policy.admit(_Request(host), email):
+                    statuses.append(200)
+            except Shed as e:
+                statuses.append(e.status_code)
+        return statuses
+    return asyncio.run(scenario())
+
+
+def test_account_bucket_is_per_address_so_nobody_can_lock_a_victim_out(clock):
+    policy = Policy("/test", max_concurrent=1, max_queue=0, queue_timeout=1, email_rate=0.2, email_burst=5)
+    assert _attempts(policy, "6.6.6.6", "victim@example.com", 6) == [200] * 5 + [429]
+    # The attacker's address is throttled for the account; the owner's is not
+    assert _attempts(policy, "6.6.6.6", " Victim@Example.com", 1) == [429]
+    assert _attempts(policy, "10.0.0.1", "victim@example.com", 5) == [200] * 5
+    assert policy.shed == {"rate_email": 2}
+
+
+def test_ip_bucket_still_limits_one_address_across_accounts(clock):
+    policy = Policy("/test", max_concurrent=1, max_queue=0, queue_timeout=1,
+                    ip_rate=1, ip_burst=3, email_rate=0.2, email_burst=5)
+    statuses = [_attempts(policy, "6.6.6.6", f"user{i}@example.com", 1)[0] for i in range(4)]
+    assert statuses == [200, 200, 200, 429]
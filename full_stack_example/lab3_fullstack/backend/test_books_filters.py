@@ -0,0 +1,105 @@
+"""
+GET /books filters, text search and sort orders, alone and with keyset pages.
+Runs the app on the in-memory backend:
+    python -m pytest -q test_books_filters.py
+"""
+import json
+
+import pytest
+
+BOOKS = [
+    {"title": "Dune", "author": "Frank Herbert", "year": 1965, "genre": "sci-fi"},
+    {"title": "Emma", "author": "Jane Austen", "year": 1815, "genre": "novel"},
+    {"title": "Dune Messiah", "author": "Frank Herbert", "year": 1969, "genre": "sci-fi"},
+    {"title": "Foundation", "author": "Isaac Asimov", "year": 1951, "genre": "sci-fi"},
+    {"title": "Persuasion", "author": "Jane Austen", "year": 1817, "genre": "novel"},
+    {"title": "Children of Dune", "author": "Frank Herbert", "year": 1976, "genre": "sci-fi"},
+]
+
+
+@pytest.fixture(params=[False, True], ids=["models", "fast_json"])
+def app_settings(request):
+    """Through both the BookOut and the FAST_JSON row path"""
+    return {"FAST_JSON": request.param}
+
+
+@pytest.fixture
+def books(client):
+    for book in BOOKS:
+        assert client.post("/books", json=book).status_code == 201
+    return client
+
+
+def _titles(client, query):
+    response = client.get(f"/books?{query}")
+    assert response.status_code == 200, response.text
+    return [book["title"] for book in response.json()]
+
+
+def _walk(client, query):
+    """Titles page by page, following X-Next-After"""
+    pages, url = [], f"/books?{query}"
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200, response.text
+        pages.append([book["title"] for book in response.json()])
+        after = response.headers.get("x-next-after")
+        if after is None:
+            return pages
+        url = f"/books?{query}&after={after}"
+
+
+@pytest.mark.parametrize("query, titles", [
+    ("author=Jane%20Austen", ["Emma", "Persuasion"]),
+    ("genre=sci-fi", ["Dune", "Dune Messiah", "Foundation", "Children of Dune"]),
+    ("year_min=1951&year_max=1969", ["Dune", "Dune Messiah", "Foundation"]),
+    ("year_min=1970", ["Children of Dune"]),
+    ("year_max=1815", ["Emma"]),
+    ("author=Frank%20Herbert&year_min=1966", ["Dune Messiah", "Children of Dune"]),
+    ("genre=poetry", []),
+])
+def test_filters(books, query, titles):
+    assert _titles(books, query) == titles
+
+
+@pytest.mark.parametrize("sort, titles", [
+    ("title", ["Children of Dune", "Dune", "Dune Messiah", "Emma", "Foundation", "Persuasion"]),
+    ("-year", ["Children of Dune", "Dune Messiah", "Dune", "Foundation", "Persuasion", "Emma"]),
+    # Equal authors keep id (insertion) order
+    ("author", ["Dune", "Dune Messiah", "Children of Dune", "Foundation", "Emma", "Persuasion"]),
+])
+def test_sort_orders(books, sort, titles):
+    assert _titles(books, f"sort={sort}") == titles
+
+
+def test_text_search_matches_title_and_author_words(books):
+    assert _titles(books, "q=austen") == ["Emma", "Persuasion"]
+    assert _titles(books, "q=dune&genre=sci-fi&year_max=1970") == ["Dune", "Dune Messiah"]
+
+
+def test_relevance_puts_the_best_match_first(books):
+    # Dune Messiah matches both words, the other two only "dune"; ties keep id order
+    assert _titles(books, "q=dune%20messiah&sort=relevance") == ["Dune Messiah", "Dune", "Children of Dune"]
+
+
+@pytest.mark.parametrize("query", ["sort=relevance", "sort=pages", "sort=-relevance"])
+def test_unsupported_sorts_are_a_400(books, query):
+    assert books.get(f"/books?{query}").status_code == 400
+
+
+def test_filtered_pages_cover_every_match_once(books):
+    assert _walk(books, "genre=sci-fi&limit=3") == [["Dune", "Dune Messiah", "Foundation"], ["Children of Dune"]]
+    assert _walk(books, "author=Frank%20Herbert&year_min=1966&limit=1") == [
+        ["Dune Messiah"], ["Children of Dune"], [],
+    ]
+
+
+def test_text_search_pages_in_id_order(books):
+    assert _walk(books, "q=dune&limit=2") == [["Dune", "Dune Messiah"], ["Children of Dune"]]
+
+
+def test_ndjson_stream_applies_filters_and_relevance(books):
+    response = books.get("/books?q=dune%20messiah&sort=relevance", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == ["Dune Messiah", "Dune", "Children of Dune"]
+    assert books.get("/books?sort=relevance", headers={"Accept": "application/x-ndjson"}).status_code == 400
@@ -0,0 +1,69 @@
+"""
+GET /books keyset pagination: X-Next-After walks every book exactly once.
+Runs the app on the in-memory backend:
+    python -m pytest -q test_books_pagination.py
+"""
+import pytest
+
+
+@pytest.fixture(params=[False, True], ids=["models", "fast_json"])
+def app_settings(request):
+    """Through both the BookOut and the FAST_JSON row path"""
+    return {"FAST_JSON": request.param}
+
+
+def _create(client, n, **fields):
+    ids = []
+    for i in range(n):
+        book = {"title": f"Book {i}", "author": "Author", "year": 2000 + i, **fields}
+        response = client.post("/books", json=book)
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+    return ids
+
+
+def _walk(client, query):
+    """Ids of every page, following X-Next-After until it is absent"""
+    pages, url = [], f"/books?{query}"
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200, response.text
+        pages.append([book["id"] for book in response.json()])
+        after = response.headers.get("x-next-after")
+        if after is None:
+            return pages
+        url = f"/books?{query}&after={after}"
+
+
+def test_pages_cover_every_book_once_in_id_order(client):
+    ids = _create(client, 5)
+    pages = _walk(client, "limit=2")
+    assert pages == [ids[0:2], ids[2:4], ids[4:5]]
+
+
+def test_last_full_page_is_followed_by_an_empty_one(client):
+    ids = _create(client, 4)
+    assert _walk(client, "limit=2") == [ids[0:2], ids[2:4], []]
+
+
+def test_pagination_keeps_the_filter(client):
+    _create(client, 3, genre="sci-fi")
+    poetry = _create(client, 3, genre="poetry")
+    assert sum(_walk(client, "limit=2&genre=poetry"), []) == poetry
+
+
+def test_books_created_meanwhile_show_up_on_a_later_page(client):
+    ids = _create(client, 2)
+    first = client.get("/books?limit=2")
+    ids += _create(client, 1)
+    after = first.headers["x-next-after"]
+    assert [book["id"] for book in client.get(f"/books?limit=2&after={after}").json()] == ids[2:]
+
+
+def test_after_is_rejected_with_a_non_id_sort(client):
+    ids = _create(client, 1)
+    assert client.get(f"/books?after={ids[0]}&sort=title").status_code == 400
+
+
+def test_malformed_after_is_a_400(client):
+    assert client.get("/books?after=not-an-id").status_code == 400
@@ -0,0 +1,96 @@
+"""
+Write paths must cost one Mongo command each.
+Runs against a recording stand-in for the Motor collection, no server needed:
+    python -m pytest -q test_books_writes.py
+"""
+import asyncio
+
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from databases.cache import NullCache
+from databases.registry import registry
+from managers.books_manager import BooksManager
+from models.books_model import BookCreate, BookUpdate
+
+
+class _InsertResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class RecordingCollection:
+    """Just enough of AsyncIOMotorCollection to serve the write paths, recording every command"""
+
+    def __init__(self):
+        self.docs = {}
+        self.commands = []
+
+    async def insert_one(self, doc):
+        self.commands.append("insert_one")
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = dict(doc)
+        return _InsertResult(doc["_id"])
+
+    async def find_one(self, query, *args, **kwargs):
+        self.commands.append("find_one")
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, return_document=ReturnDocument.BEFORE):
+        self.commands.append("find_one_and_update")
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+        before = dict(doc)
+        doc.update(update["$set"])
+        return dict(doc) if return_document == ReturnDocument.AFTER else before
+
+    async def update_one(self, query, update, upsert=False):
+        # What a shared version counter bump would cost
+        self.commands.append("update_one")
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """A BooksManager whose every collection, versions included, is one recording collection"""
+    coll = RecordingCollection()
+    monkeypatch.setattr(registry, "client", lambda uri: None)
+    monkeypatch.setattr(registry, "collection", lambda uri, db_name, name: coll)
+    books = BooksManager("mongodb://unused", "db", "books", cache=NullCache())
+    asyncio.run(books.connect())
+    return books, coll
+
+
+def test_create_book_is_one_round_trip(manager):
+    books, coll = manager
+    version = books.version()
+    created = asyncio.run(books.create_book(BookCreate(title="Dune", author="Herbert", year=1965)))
+
+    assert coll.commands == ["insert_one"]
+    assert books.version() != version
+    assert created.title == "Dune"
+    assert ObjectId(created.id) in coll.docs
+
+
+def test_update_book_is_one_round_trip_and_returns_new_state(manager):
+    books, coll = manager
+    created = asyncio.run(books.create_book(BookCreate(title="Dune", author="Herbert", year=1965)))
+    coll.commands.clear()
+    version = books.version()
+
+    updated = asyncio.run(books.update_book(created.id, BookUpdate(year=1966)))
+
+    assert coll.commands == ["find_one_and_update"]
+    assert books.version() != version
+    assert updated.year == 1966
+    assert updated.id == created.id
+
+
+def test_update_missing_book_returns_none(manager):
+    books, coll = manager
+    version = books.version()
+    assert asyncio.run(books.update_book(str(ObjectId()), BookUpdate(year=1))) is None
+    assert coll.commands == ["find_one_and_update"]
+    assert books.version() == version
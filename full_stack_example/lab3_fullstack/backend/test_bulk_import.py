@@ -0,0 +1,164 @@
+"""
+Streamed parsing of POST /books/bulk bodies, whatever the chunk boundaries.
+    python -m pytest -q test_bulk_import.py
+"""
+import asyncio
+import uuid
+
+import pytest
+
+from databases.cache import NullCache
+from managers.books_manager import BooksManager
+from managers.bulk_import import RowError, iter_json_array, iter_ndjson
+
+
+async def _chunks(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def _parse(parser, body: str, size: int):
+    """(rows, error message or None)"""
+    async def collect():
+        rows = []
+        try:
+            async for row in parser(_chunks(body.encode(), size)):
+                rows.append(row)
+        except ValueError as e:
+            return rows, str(e)
+        return rows, None
+    return asyncio.run(collect())
+
+
+CHUNK_SIZES = [1, 2, 7, 1024]
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+@pytest.mark.parametrize("body, values", [
+    ("[]", []),
+    (" \n[ ]\n", []),
+    ('[{"title": "Dune"}, {"title": "Emma"}]', [{"title": "Dune"}, {"title": "Emma"}]),
+    ("[1, 23 ,456]", [1, 23, 456]),
+    ('["a,]b", {"nested": [1, {"x": "]"}]}]', ["a,]b", {"nested": [1, {"x": "]"}]}]),
+    ('[{"title": "Ça ira — 日本"}]', [{"title": "Ça ira — 日本"}]),
+])
+def test_well_formed_arrays_yield_every_element(body, values, size):
+    rows, error = _parse(iter_json_array, body, size)
+    assert error is None
+    assert rows == list(enumerate(values))
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+@pytest.mark.parametrize("body, parsed", [
+    ("[{}{}]", 1),
+    ("[{},,{}]", 1),
+    ("[{},]", 1),
+    ("[,{}]", 0),
+    ("[{}] trailing", 1),
+    ("[{}]]", 1),
+    ("[{}] [{}]", 1),
+    ("[{}", 1),
+    ("[{", 0),
+    ('{"title": "Dune"}', 0),
+    ("", 0),
+])
+def test_malformed_arrays_raise_after_the_good_prefix(body, parsed, size):
+    rows, error = _parse(iter_json_array, body, size)
+    assert error is not None
+    assert len(rows) == parsed
+
+
+class _Upload:
+    """A body of `head` followed by endless filler, counting the chunks read"""
+
+    def __init__(self, head: bytes, filler: bytes = b" " * 1024):
+        self.head = head
+        self.filler = filler
+        self.read = 0
+
+    async def __aiter__(self):
+        yield self.head
+        while True:
+            self.read += 1
+            yield self.filler
+
+
+def _first_error(parser, upload, **kwargs):
+    async def consume():
+        with pytest.raises(ValueError) as failed:
+            async for _ in parser(upload, **kwargs):
+                pass
+        return str(failed.value)
+    return asyncio.run(consume())
+
+
+@pytest.mark.parametrize("head", [
+    b'[{"title": "Dune"}, {"title": "Emma", oops',
+    b'[{"title": "Dune"}, {"title" "Emma"',
+    b'[{"title": "Dune"}, nope',
+])
+def test_malformed_element_fails_without_reading_the_rest(head):
+    upload = _Upload(head, b'"filler", ' * 100)
+    message = _first_error(iter_json_array, upload)
+    assert "row 1" in message
+    assert upload.read <= 1
+
+
+def test_errors_say_where_in_the_body_they_are():
+    _, error = _parse(iter_json_array, '[{}, {"a" 1}]', 3)
+    assert "row 1, character 10" in error
+
+
+@pytest.mark.parametrize("head, filler", [
+    (b'[{"title": "', b"a" * 100),
+    (b"[[1, 2, 3, ", b"1, " * 100),
+    (b'["x", {"deep": ', b'{"a": ' * 20),
+])
+def test_element_past_the_cap_fails_instead_of_buffering_the_upload(head, filler):
+    upload = _Upload(head, filler)
+    message = _first_error(iter_json_array, upload, max_row=1000)
+    assert "longer than 1000 characters" in message
+    assert upload.read <= 12
+
+
+def test_deep_nesting_is_an_error_not_a_crash():
+    deep = "[" * 100_000 + "]" * 100_000
+    _, error = _parse(iter_json_array, f"[{deep}]", 1 << 20)
+    assert "Row 0 at character 1 is nested too deeply" == error
+    rows, error = _parse(iter_ndjson, deep, 1 << 20)
+    assert error is None and isinstance(rows[0][1], RowError)
+
+
+def test_ndjson_line_past_the_cap_fails():
+    message = _first_error(iter_ndjson, _Upload(b'{"a": 1}\n{"title": "', b"a" * 100), max_row=1000)
+    assert "Row 1 is longer than 1000 characters" == message
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_element_up_to_the_cap_is_accepted(size):
+    body = '[' + ", ".join(['"' + "x" * 98 + '"'] * 3) + ']'
+    rows, error = _parse(lambda chunks: iter_json_array(chunks, max_row=100), body, size)
+    assert error is None and len(rows) == 3
+    _, error = _parse(lambda chunks: iter_json_array(chunks, max_row=99), body, size)
+    assert "Row 0 at character 1 is longer than 99 characters" == error
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_ndjson_bad_line_is_a_row_error(size):
+    rows, error = _parse(iter_ndjson, '{"a": 1}\n\nnot json\n{"b": 2}', size)
+    assert error is None
+    assert [row for row, _ in rows] == [0, 1, 2]
+    assert rows[0][1] == {"a": 1} and rows[2][1] == {"b": 2}
+    assert isinstance(rows[1][1], RowError)
+
+
+def test_bulk_create_reports_trailing_content_as_aborted():
+    async def scenario():
+        books = BooksManager(f"memory://{uuid.uuid4().hex}", "db", "books", cache=NullCache())
+        await books.connect()
+        body = b'[{"title": "Dune", "author": "Herbert", "year": 1965}] {"title": "Extra"}'
+        return await books.bulk_create(iter_json_array(_chunks(body, 8)))
+
+    result = asyncio.run(scenario())
+    assert result["inserted"] == 1
+    assert "aborted" in result
@@ -0,0 +1,119 @@
+"""
+Read caches never keep a document older than the last write that evicted it.
+Each test holds one call between its database command and its cache fill
+while a conflicting write lands. Runs on the in-memory backend:
+    python -m pytest -q test_cache_guards.py
+"""
+import asyncio
+import uuid
+
+import pytest
+
+from databases.cache import LRUCache
+from databases.invalidation import InvalidationBus
+from managers.books_manager import BooksManager
+from managers.profile_manager import ProfilesManager
+from models.books_model import BookCreate, BookUpdate
+from models.profile_model import ProfileCreate
+
+
+class Gate:
+    """Wraps an async method so its first call stops after the command returns, until opened"""
+
+    def __init__(self, method):
+        self._method = method
+        self.reached = asyncio.Event()
+        self.opened = asyncio.Event()
+        self._held = False
+
+    async def __call__(self, *args, **kwargs):
+        result = await self._method(*args, **kwargs)
+        if not self._held:
+            self._held = True
+            self.reached.set()
+            await self.opened.wait()
+        return result
+
+
+@pytest.fixture
+def books():
+    uri = f"memory://{uuid.uuid4().hex}"
+    return BooksManager(uri, "db", "books", cache=LRUCache(), bus=InvalidationBus())
+
+
+@pytest.fixture
+def profiles():
+    uri = f"memory://{uuid.uuid4().hex}"
+    return ProfilesManager(uri, "db", "profiles", cache=LRUCache(), bus=InvalidationBus())
+
+
+def _profile(goal: str) -> ProfileCreate:
+    return ProfileCreate(user_id="u1", name="Ann", experience="beginner", instrument="guitar",
+                         goal=goal, genres=["rock"], gear=[])
+
+
+def test_read_overtaken_by_an_update_is_not_cached(books):
+    async def scenario():
+        await books.connect()
+        book = await books.create_book(BookCreate(title="Dune", author="Herbert", year=1965))
+        books.cache.clear()
+        gate = books._repo._mongo.find_one = Gate(books._repo._mongo.find_one)
+        read = asyncio.create_task(books.get_book(book.id))
+        await gate.reached.wait()
+        await books.update_book(book.id, BookUpdate(year=1966))
+        gate.opened.set()
+        stale = await read
+        return stale, await books.get_book(book.id)
+
+    stale, fresh = asyncio.run(scenario())
+    assert stale.year == 1965
+    assert fresh.year == 1966
+
+
+def test_overlapping_updates_leave_the_newer_one_cached(books):
+    async def scenario():
+        await books.connect()
+        book = await books.create_book(BookCreate(title="Dune", author="Herbert", year=1965))
+        gate = books._repo._mongo.update_one = Gate(books._repo._mongo.update_one)
+        first = asyncio.create_task(books.update_book(book.id, BookUpdate(year=1)))
+        await gate.reached.wait()
+        await books.update_book(book.id, BookUpdate(year=2))
+        gate.opened.set()
+        await first
+        return books.cache.get(book.id)
+
+    cached = asyncio.run(scenario())
+    assert cached is None or cached.year == 2
+
+
+def test_read_overtaken_by_a_delete_is_not_cached(books):
+    async def scenario():
+        await books.connect()
+        book = await books.create_book(BookCreate(title="Dune", author="Herbert", year=1965))
+        books.cache.clear()
+        gate = books._repo._mongo.find_one = Gate(books._repo._mongo.find_one)
+        read = asyncio.create_task(books.get_book(book.id))
+        await gate.reached.wait()
+        assert await books.delete_book(book.id)
+        gate.opened.set()
+        await read
+        return await books.get_book(book.id)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_overlapping_profile_saves_leave_the_newer_one_cached(profiles):
+    async def scenario():
+        first_doc = await profiles.repo.save_profile(_profile("first").model_dump())
+        profile_id = str(first_doc["_id"])
+        gate = profiles.repo.save_profile = Gate(profiles.repo.save_profile)
+        first = asyncio.create_task(profiles.create_profile(_profile("older")))
+        await gate.reached.wait()
+        await profiles.create_profile(_profile("newer"))
+        gate.opened.set()
+        await first
+        return profiles.cache.get(profile_id), await profiles.get_profile(profile_id)
+
+    cached, current = asyncio.run(scenario())
+    assert cached is None or cached.goal == "newer"
+    assert current.goal == "newer"
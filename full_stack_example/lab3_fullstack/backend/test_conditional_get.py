@@ -0,0 +1,83 @@
+"""
+ETags and If-None-Match on /books and /profiles: 304 until something changes.
+Runs the app on the in-memory backend:
+    python -m pytest -q test_conditional_get.py
+"""
+import pytest
+
+
+@pytest.fixture
+def app_settings():
+    return {"AUTH_REQUIRED": False, "BOOKS_CACHE_MAX_AGE": 0}
+
+
+def _book(client, title="Dune"):
+    response = client.post("/books", json={"title": title, "author": "Herbert", "year": 1965})
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def _revalidate(client, url, etag, **headers):
+    return client.get(url, headers={"If-None-Match": etag, **headers})
+
+
+def test_unchanged_list_revalidates_to_304(client):
+    _book(client)
+    first = client.get("/books")
+    etag = first.headers["etag"]
+    again = _revalidate(client, "/books", etag)
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+
+
+@pytest.mark.parametrize("change", ["create", "update", "delete"])
+def test_every_write_changes_the_list_etag(client, change):
+    book_id = _book(client)
+    etag = client.get("/books").headers["etag"]
+    if change == "create":
+        _book(client, "Emma")
+    elif change == "update":
+        assert client.put(f"/books/{book_id}", json={"year": 1966}).status_code == 200
+    else:
+        assert client.delete(f"/books/{book_id}").status_code == 204
+    response = _revalidate(client, "/books", etag)
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_etag_depends_on_query_and_accept(client):
+    _book(client)
+    plain = client.get("/books").headers["etag"]
+    assert client.get("/books?limit=1").headers["etag"] != plain
+    assert client.get("/books", headers={"Accept": "application/msgpack"}).headers["etag"] != plain
+    assert _revalidate(client, "/books", plain, Accept="application/msgpack").status_code == 200
+
+
+def test_weak_and_listed_tags_match(client):
+    _book(client)
+    etag = client.get("/books").headers["etag"]
+    assert _revalidate(client, "/books", f"W/{etag}").status_code == 304
+    assert _revalidate(client, "/books", f'"other", {etag}').status_code == 304
+    assert _revalidate(client, "/books", "*").status_code == 304
+    assert _revalidate(client, "/books", '"other"').status_code == 200
+
+
+def test_single_book_revalidates_and_says_how_to_cache(client):
+    book_id = _book(client)
+    first = client.get(f"/books/{book_id}")
+    assert first.headers["cache-control"] == "public, no-cache"
+    not_modified = _revalidate(client, f"/books/{book_id}", first.headers["etag"])
+    assert not_modified.status_code == 304
+    assert not_modified.headers["cache-control"] == "public, no-cache"
+
+
+def test_profile_list_etag_changes_after_a_save(client):
+    etag = client.get("/profiles").headers["etag"]
+    assert _revalidate(client, "/profiles", etag).status_code == 304
+    profile = {"user_id": "u1", "name": "Ann", "experience": "beginner", "instrument": "guitar",
+               "goal": "fun", "genres": ["rock"], "gear": []}
+    assert client.post("/profiles", json=profile).status_code == 201
+    response = _revalidate(client, "/profiles", etag)
+    assert response.status_code == 200
+    assert [p["user_id"] for p in response.json()] == ["u1"]
@@ -0,0 +1,136 @@
+"""
+Content negotiation (Accept, Accept-Encoding) and streamed compression.
+    python -m pytest -q test_formats.py
+"""
+import gzip
+import json
+from datetime import datetime
+
+import msgpack
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+import compression
+import formats
+from compression import choose_encoding
+from formats import JSON, MSGPACK, NDJSON, negotiate
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("", JSON),
+    ("*/*", JSON),
+    ("application/json", JSON),
+    ("application/msgpack", MSGPACK),
+    ("application/x-msgpack", MSGPACK),
+    ("application/vnd.msgpack", MSGPACK),
+    ("application/x-ndjson", NDJSON),
+    ("text/html", JSON),
+    ("application/json;q=0.5, application/msgpack", MSGPACK),
+    ("application/msgpack;q=0.1, */*", JSON),
+    # An explicit type beats the same q reached through a wildcard
+    ("application/*, application/x-ndjson", NDJSON),
+    # The most specific range sets a format's q, even when it is lower
+    ("application/msgpack;q=0, */*", JSON),
+    ("application/json;q=0, application/msgpack;q=0", JSON),
+    ("application/msgpack;q=bogus, application/x-ndjson;q=0.2", NDJSON),
+    ("APPLICATION/MSGPACK", MSGPACK),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_negotiate_only_picks_offered_formats():
+    assert negotiate("application/x-ndjson", offered=(JSON, MSGPACK)) == JSON
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("br", "br"),
+    ("gzip, br", "br"),
+    ("gzip;q=1.0, br;q=0.5", "gzip"),
+    ("*", "br"),
+    ("*, br;q=0", "gzip"),
+    ("gzip;q=0, br;q=0", None),
+    ("deflate", None),
+])
+def test_choose_encoding(accept_encoding, expected, monkeypatch):
+    monkeypatch.setattr(compression, "BROTLI_AVAILABLE", True)
+    assert choose_encoding(accept_encoding) == expected
+
+
+def test_choose_encoding_without_brotli_falls_back_to_gzip(monkeypatch):
+    monkeypatch.setattr(compression, "BROTLI_AVAILABLE", False)
+    assert choose_encoding("br, gzip;q=0.5") == "gzip"
+    assert choose_encoding("br") is None
+
+
+def test_msgpack_response_encodes_ids_and_dates():
+    oid, when = ObjectId(), datetime(2024, 5, 1, 12, 30)
+    body = formats.MsgPackResponse([{"id": oid, "at": when, "n": 1}]).body
+    assert msgpack.unpackb(body) == [{"id": str(oid), "at": "2024-05-01T12:30:00", "n": 1}]
+
+
+ROWS = [{"title": f"Book {i}", "author": "Author"} for i in range(200)]
+
+app = FastAPI()
+app.add_middleware(compression.CompressionMiddleware)
+
+
+@app.get("/large")
+async def large():
+    return ROWS
+
+
+@app.get("/small")
+async def small():
+    return {"ok": True}
+
+
+@app.get("/stream")
+async def stream():
+    async def lines():
+        for row in ROWS:
+            yield json.dumps(row) + "\n"
+    return StreamingResponse(lines(), media_type=NDJSON, headers={"ETag": '"abc"'})
+
+
+@app.get("/encoded")
+async def encoded():
+    return PlainTextResponse(gzip.compress(b"x" * 5000), headers={"Content-Encoding": "gzip"})
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_large_body_is_compressed(client, encoding):
+    response = client.get("/large", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.json() == ROWS
+
+
+def test_small_body_is_left_alone(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"ok": True}
+
+
+def test_streamed_body_is_compressed_and_its_etag_turns_weak(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert [json.loads(line) for line in response.text.splitlines()] == ROWS
+
+
+def test_already_encoded_body_is_not_compressed_twice(client):
+    response = client.get("/encoded", headers={"Accept-Encoding": "gzip"})
+    assert response.content == b"x" * 5000
@@ -0,0 +1,164 @@
+"""
+ensure_indexes leaves stored data alone, managers.dedupe_profiles migrates
+stores written before user_id became unique, and explain_known_queries flags
+queries that no index serves.
+    python -m pytest -q test_indexes.py
+"""
+import asyncio
+
+import pytest
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from databases.indexes import ensure_indexes, explain_known_queries
+from databases.memory import MemoryClient
+from databases.registry import registry
+from databases.sqlite import SQLiteClient
+from managers import dedupe_profiles
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def client(request, tmp_path):
+    client = MemoryClient() if request.param == "memory" else SQLiteClient(str(tmp_path / "test.db"))
+    yield client
+    client.close()
+
+
+async def _legacy_profiles(profiles):
+    """What older releases left behind: a non-unique index and a profile per submission"""
+    await profiles.create_indexes([IndexModel([("user_id", ASCENDING)], name="user_id")])
+    for i in range(6):
+        await profiles.insert_one({"user_id": f"u{i % 2}", "goal": f"answer {i}"})
+
+
+def test_duplicate_profiles_are_reported_not_deleted(client):
+    async def scenario():
+        profiles = client["db"]["profiles"]
+        await _legacy_profiles(profiles)
+        report = await ensure_indexes({"profiles": profiles})
+        return report, await profiles.count_documents({})
+
+    report, count = asyncio.run(scenario())
+    assert report["profiles"]["dropped"] == ["user_id"]
+    assert "error" in report["profiles"]
+    assert count == 6
+
+
+async def _profiles(uri):
+    try:
+        return sorted([(doc["user_id"], doc["goal"]) async for doc in registry.collection(uri, "db", "profiles").find({})])
+    finally:
+        registry.close()
+
+
+def test_migration_dry_run_reports_without_deleting(sqlite_registry):
+    asyncio.run(_legacy_profiles(registry.collection(sqlite_registry, "db", "profiles")))
+    registry.close()
+    report = asyncio.run(dedupe_profiles.run(sqlite_registry, "db", dry_run=True))
+    assert (report["users"], report["superseded"]) == (2, 4)
+    assert [len(group["delete"]) for group in report["profiles"].values()] == [2, 2]
+    assert "deleted" not in report
+    assert len(asyncio.run(_profiles(sqlite_registry))) == 6
+
+
+def test_migration_keeps_the_newest_profile_and_builds_the_index(sqlite_registry):
+    asyncio.run(_legacy_profiles(registry.collection(sqlite_registry, "db", "profiles")))
+    registry.close()
+    report = asyncio.run(dedupe_profiles.run(sqlite_registry, "db", dry_run=False, batch_size=3))
+    assert report["deleted"] == 4
+    assert report["indexes"]["created"] == ["user_id_unique"]
+    assert asyncio.run(_profiles(sqlite_registry)) == [("u0", "answer 4"), ("u1", "answer 5")]
+    again = asyncio.run(dedupe_profiles.run(sqlite_registry, "db", dry_run=False))
+    assert again["deleted"] == 0 and "error" not in again["indexes"]
+
+
+def test_duplicate_emails_are_reported_not_deleted(client):
+    async def scenario():
+        users = client["db"]["users"]
+        await users.insert_one({"email": "a@example.com"})
+        await users.insert_one({"email": "a@example.com"})
+        report = await ensure_indexes({"users": users})
+        return report, await users.count_documents({})
+
+    report, count = asyncio.run(scenario())
+    assert "error" in report["users"]
+    assert count == 2
+
+
+class _ExplainCursor:
+    def __init__(self, plan):
+        self._plan = plan
+        self.sorted_by = None
+
+    def sort(self, key_or_list, direction=1):
+        self.sorted_by = key_or_list
+        return self
+
+    async def explain(self):
+        if isinstance(self._plan, Exception):
+            raise self._plan
+        return self._plan
+
+
+class _ExplainCollection:
+    """Answers explain with a canned plan per filter, as a server would for that query"""
+
+    def __init__(self, plans, default):
+        self._plans = plans
+        self._default = default
+        self.cursors = []
+
+    def find(self, filter=None, projection=None, **kwargs):
+        cursor = _ExplainCursor(self._plans.get(repr(filter), self._default))
+        self.cursors.append(cursor)
+        return cursor
+
+
+def _winning(plan):
+    return {"queryPlanner": {"winningPlan": plan}}
+
+
+IXSCAN = _winning({"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "email_unique"}})
+COLLSCAN = _winning({"stage": "COLLSCAN", "direction": "forward"})
+
+
+def _explain(collections):
+    return {(r["collection"], r["query"]): r for r in asyncio.run(explain_known_queries(collections))}
+
+
+def test_query_without_a_usable_index_is_flagged():
+    results = _explain({
+        "users": _ExplainCollection({}, IXSCAN),
+        "profiles": _ExplainCollection({}, COLLSCAN),
+    })
+    assert set(results) == {("users", "user by email"), ("profiles", "profile by user_id")}
+    assert results["users", "user by email"] == {
+        "collection": "users", "query": "user by email", "stages": ["FETCH", "IXSCAN"], "collscan": False,
+    }
+    assert results["profiles", "profile by user_id"]["collscan"] is True
+
+
+def test_collection_scans_are_found_anywhere_in_the_plan():
+    # An $or with one unindexed branch, and the slot-based engine's queryPlan nesting
+    or_branch = _winning({"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [
+        {"stage": "IXSCAN"}, {"stage": "COLLSCAN"},
+    ]}})
+    sbe = _winning({"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}})
+    books = _ExplainCollection({repr({"author": "probe"}): or_branch, repr({"genre": "probe"}): sbe}, IXSCAN)
+    results = _explain({"books": books})
+    assert results["books", "books by author"]["stages"] == ["SUBPLAN", "OR", "IXSCAN", "COLLSCAN"]
+    assert results["books", "books by author"]["collscan"] is True
+    assert results["books", "books by genre"]["collscan"] is True
+    assert results["books", "books by year range"]["collscan"] is False
+    # The keyset page is explained with its sort
+    assert [("_id", 1)] in [cursor.sorted_by for cursor in books.cursors]
+
+
+def test_unreadable_explain_output_is_reported_not_raised():
+    results = _explain({
+        "users": _ExplainCollection({}, {"ok": 1}),
+        "profiles": _ExplainCollection({}, OperationFailure("text index required")),
+    })
+    assert "collscan" not in results["users", "user by email"]
+    assert "error" in results["users", "user by email"]
+    assert results["profiles", "profile by user_id"]["error"] == "text index required"
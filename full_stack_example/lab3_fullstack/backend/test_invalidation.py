@@ -0,0 +1,190 @@
+"""
+Invalidation bus delivery, in process and between workers polling shared versions.
+Two VersionPollBus instances on one in-memory store play two workers:
+    python -m pytest -q test_invalidation.py
+"""
+import asyncio
+import uuid
+
+import pytest
+from bson import ObjectId
+
+import databases.versions
+from databases.invalidation import ChangeStreamBus, InvalidationBus, VersionPollBus
+from databases.registry import registry
+from databases.versions import VERSIONS_COLLECTION
+
+POLL = 0.02
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, key, doc):
+        self.calls.append((key, doc))
+
+
+async def _polled():
+    # A few poll intervals, so every worker has seen the latest versions
+    await asyncio.sleep(POLL * 5)
+
+
+def test_publish_reaches_every_subscriber_and_moves_the_version():
+    async def scenario():
+        bus, first, second = InvalidationBus(), Recorder(), Recorder()
+        bus.subscribe("db", "books", first)
+        bus.subscribe("db", "books", second)
+        bus.subscribe("db", "other", Recorder())
+        version = bus.version("db", "books")
+        await bus.publish("db", "books", "id1", {"_id": "id1"})
+        return bus, first, second, version
+
+    bus, first, second, version = asyncio.run(scenario())
+    assert first.calls == second.calls == [("id1", {"_id": "id1"})]
+    assert bus.version("db", "books") != version
+    assert bus.version("db", "other").endswith(".0")
+
+
+def test_touch_moves_the_version_without_evicting():
+    async def scenario():
+        bus, recorder = InvalidationBus(), Recorder()
+        bus.subscribe("db", "books", recorder)
+        version = bus.version("db", "books")
+        await bus.touch("db", "books")
+        return bus, recorder, version
+
+    bus, recorder, version = asyncio.run(scenario())
+    assert recorder.calls == []
+    assert bus.version("db", "books") != version
+
+
+def test_failing_subscriber_does_not_stop_the_others():
+    async def broken(key, doc):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        bus, recorder = InvalidationBus(), Recorder()
+        bus.subscribe("db", "books", broken)
+        bus.subscribe("db", "books", recorder)
+        await bus.publish("db", "books", "id1")
+        return bus, recorder
+
+    bus, recorder = asyncio.run(scenario())
+    assert recorder.calls == [("id1", None)]
+    assert bus.stats()["errors"] == 1
+
+
+def test_local_bus_versions_from_different_processes_never_match():
+    assert InvalidationBus().version("db", "books") != InvalidationBus().version("db", "books")
+
+
+async def _two_workers(uri):
+    writer, reader = VersionPollBus(uri, POLL), VersionPollBus(uri, POLL)
+    seen_by_writer, seen_by_reader = Recorder(), Recorder()
+    writer.subscribe("db", "books", seen_by_writer)
+    reader.subscribe("db", "books", seen_by_reader)
+    await writer.start()
+    await reader.start()
+    await _polled()
+    return writer, reader, seen_by_writer, seen_by_reader
+
+
+def test_poll_bus_replays_updates_and_deletes_with_their_documents():
+    uri = f"memory://{uuid.uuid4().hex}"
+
+    async def scenario():
+        books = registry.collection(uri, "db", "books")
+        kept, gone = ObjectId(), ObjectId()
+        await books.insert_one({"_id": kept, "title": "Dune"})
+        writer, reader, seen_by_writer, seen_by_reader = await _two_workers(uri)
+        await writer.publish("db", "books", str(kept), {"_id": kept, "title": "Dune"})
+        await writer.publish("db", "books", str(gone))
+        await _polled()
+        await writer.stop()
+        await reader.stop()
+        return kept, gone, seen_by_writer, seen_by_reader, reader
+
+    kept, gone, seen_by_writer, seen_by_reader, reader = asyncio.run(scenario())
+    assert seen_by_reader.calls == [(str(kept), {"_id": kept, "title": "Dune"}), (str(gone), None)]
+    # The writer delivered its own changes when it published them, and only then
+    assert [key for key, _ in seen_by_writer.calls] == [str(kept), str(gone)]
+    assert reader.stats()["resets"] == 0
+
+
+def test_poll_bus_inserts_move_the_version_without_evicting():
+    uri = f"memory://{uuid.uuid4().hex}"
+
+    async def scenario():
+        writer, reader, _, seen_by_reader = await _two_workers(uri)
+        version = reader.version("db", "books")
+        await writer.touch("db", "books")
+        await _polled()
+        await writer.stop()
+        await reader.stop()
+        return reader, seen_by_reader, version
+
+    reader, seen_by_reader, version = asyncio.run(scenario())
+    assert seen_by_reader.calls == []
+    assert reader.version("db", "books") != version
+
+
+def test_poll_bus_resets_when_it_fell_behind_the_log(monkeypatch):
+    monkeypatch.setattr(databases.versions, "VERSIONS_LOG_SIZE", 2)
+    uri = f"memory://{uuid.uuid4().hex}"
+
+    async def scenario():
+        writer, reader, _, seen_by_reader = await _two_workers(uri)
+        # More changes between two polls than the log keeps
+        for _ in range(5):
+            await writer.publish("db", "books", str(ObjectId()))
+        await _polled()
+        await writer.stop()
+        await reader.stop()
+        return seen_by_reader
+
+    assert asyncio.run(scenario()).calls == [(None, None)]
+
+
+@pytest.mark.parametrize("bus", [VersionPollBus, ChangeStreamBus])
+def test_workers_agree_on_the_version_so_etags_revalidate_anywhere(bus):
+    uri = f"memory://{uuid.uuid4().hex}"
+
+    async def scenario():
+        writer, reader = bus(uri, interval=POLL), VersionPollBus(uri, POLL)
+        for worker in (writer, reader):
+            worker.subscribe("db", "books", Recorder())
+            await worker.start()
+        await writer.touch("db", "books")
+        await _polled()
+        before = writer.version("db", "books"), reader.version("db", "books")
+        await writer.publish("db", "books", str(ObjectId()))
+        # The writer knows at once, the reader after its next poll
+        right_after = writer.version("db", "books")
+        await _polled()
+        after = writer.version("db", "books"), reader.version("db", "books")
+        for worker in (writer, reader):
+            await worker.stop()
+        return before, right_after, after
+
+    before, right_after, after = asyncio.run(scenario())
+    assert before[0] == before[1]
+    assert after[0] == after[1] == right_after
+    assert after[0] != before[0]
+
+
+def test_recreated_counter_never_repeats_a_version():
+    uri = f"memory://{uuid.uuid4().hex}"
+
+    async def scenario():
+        first = VersionPollBus(uri, POLL)
+        await first.touch("db", "books")
+        old = first.version("db", "books")
+        await registry.collection(uri, "db", VERSIONS_COLLECTION).delete_many({})
+        second = VersionPollBus(uri, POLL)
+        await second.touch("db", "books")
+        return old, second.version("db", "books")
+
+    old, new = asyncio.run(scenario())
+    assert old.endswith(":1") and new.endswith(":1")
+    assert old != new
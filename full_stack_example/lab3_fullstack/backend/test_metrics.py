@@ -0,0 +1,110 @@
+"""
+GET /metrics: the Prometheus text format, histogram buckets, callback gauges
+and the route-template labels MetricsMiddleware records.
+Runs the app on the in-memory backend:
+    python -m pytest -q test_metrics.py
+"""
+import re
+
+import pytest
+
+import metrics
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:\w+="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _scrape(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return response.text
+
+
+def _samples(text):
+    """(name, {label: value}, value) per sample line"""
+    out = []
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"not a sample line: {line!r}"
+        name, labels, value = match.groups()
+        out.append((name, dict(LABEL.findall(labels or "")), float(value)))
+    return out
+
+
+def _series(text, name, **labels):
+    return [(found, value) for metric, found, value in _samples(text)
+            if metric == name and all(found.get(k) == v for k, v in labels.items())]
+
+
+@pytest.fixture
+def histogram():
+    """A registered histogram, taken off the scrape again afterwards"""
+    hist = metrics.Histogram("test_latency_seconds", "Test latencies", ("op",), buckets=(0.1, 1.0))
+    yield hist
+    metrics._metrics.remove(hist)
+
+
+def test_every_metric_declares_help_and_type_before_its_samples(client):
+    text = _scrape(client)
+    assert text.endswith("\n")
+    declared = {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name = line.split(" ")[2]
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert kind in ("counter", "gauge", "histogram")
+            declared[name] = kind
+    for name, _, _ in _samples(text):
+        base = re.sub(r"_(bucket|sum|count)$", "", name)
+        assert name in declared or declared.get(base) == "histogram", name
+
+
+def test_requests_are_labelled_by_route_template(client):
+    book_id = client.post("/books", json={"title": "Dune", "author": "Herbert", "year": 1965}).json()["id"]
+    for _ in range(3):
+        assert client.get(f"/books/{book_id}").status_code == 200
+    assert client.get("/no/such/route").status_code == 404
+    text = _scrape(client)
+
+    count = _series(text, "http_request_duration_seconds_count", method="GET", route="/books/{book_id}", status="200")
+    assert count and count[0][1] >= 3
+    assert _series(text, "http_request_duration_seconds_count", route="unmatched", status="404")
+    # Raw ids never become label values
+    assert book_id not in text
+
+
+def test_histogram_buckets_are_cumulative_and_end_at_inf(client, histogram):
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "read")
+    text = _scrape(client)
+
+    buckets = [(labels["le"], value) for labels, value in _series(text, "test_latency_seconds_bucket", op="read")]
+    # le is inclusive, so 0.1 lands in the 0.1 bucket
+    assert buckets == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+    assert _series(text, "test_latency_seconds_count", op="read")[0][1] == 4
+    assert _series(text, "test_latency_seconds_sum", op="read")[0][1] == pytest.approx(3.65)
+
+
+def test_callback_gauges_are_read_at_scrape_time(client):
+    text = _scrape(client)
+    # The scrape itself is in flight while the gauge is read
+    assert _series(text, "http_requests_in_flight") == [({}, 1.0)]
+    phases = {labels["phase"] for labels, _ in _series(text, "startup_phase_seconds")}
+    assert {"import", "startup", "warm_up"} <= phases
+
+
+def test_a_failing_callback_gauge_is_left_out_of_the_scrape(client):
+    def broken():
+        raise RuntimeError("source not ready")
+
+    gauge = metrics.CallbackGauge("test_broken", "Never readable", (), broken)
+    try:
+        text = _scrape(client)
+    finally:
+        metrics._metrics.remove(gauge)
+    assert "# TYPE test_broken gauge" in text
+    assert not _series(text, "test_broken")
@@ -0,0 +1,78 @@
+"""
+Login and register while the bcrypt pool is full: a 503 with Retry-After,
+not a request queued behind minutes of hashing.
+Runs the app on the in-memory backend:
+    python -m pytest -q test_password_pool.py
+"""
+import asyncio
+import threading
+
+import pytest
+
+import main
+from managers.password_hasher import PasswordHasher, PasswordPoolSaturated
+
+ANN = {"email": "ann@example.com", "password": "correct horse", "name": "Ann"}
+
+
+@pytest.fixture
+def full_pool(client):
+    """Swaps in a one-slot pool and occupies the slot until the test ends or sets pool.release"""
+    original = main.users.passwords
+    pool = main.users.passwords = PasswordHasher(workers=1, max_pending=1)
+    release = pool.release = threading.Event()
+    pool.blocker = client.portal.start_task_soon(pool._submit, "hash", release.wait)
+    while pool.stats()["pending"] < 1:
+        release.wait(0.01)
+    yield pool
+    release.set()
+    pool.blocker.result(timeout=5)
+    main.users.passwords = original
+    pool.shutdown()
+
+
+@pytest.fixture
+def registered(client):
+    assert client.post("/api/register", json=ANN).status_code == 201
+    return client
+
+
+def _assert_saturated(response):
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert "saturated" in response.json()["detail"]
+
+
+def test_login_gets_503_while_the_pool_is_full(registered, full_pool):
+    _assert_saturated(registered.post("/api/login", json={"email": ANN["email"], "password": ANN["password"]}))
+    assert full_pool.stats()["rejected"] == 1
+
+
+def test_register_gets_503_while_the_pool_is_full(client, full_pool):
+    _assert_saturated(client.post("/api/register", json={**ANN, "email": "bob@example.com"}))
+    assert full_pool.stats()["rejected"] == 1
+
+
+def test_logins_succeed_again_once_the_pool_drains(registered, full_pool):
+    login = {"email": ANN["email"], "password": ANN["password"]}
+    _assert_saturated(registered.post("/api/login", json=login))
+    full_pool.release.set()
+    full_pool.blocker.result(timeout=5)
+    assert registered.post("/api/login", json=login).status_code == 200
+
+
+def test_hasher_refuses_past_max_pending():
+    async def scenario():
+        pool = PasswordHasher(workers=1, max_pending=2)
+        release = threading.Event()
+        jobs = [asyncio.create_task(pool._submit("hash", release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordPoolSaturated):
+            await pool.hash("x")
+        release.set()
+        await asyncio.gather(*jobs)
+        pool.shutdown()
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["pending"], stats["rejected"]) == (0, 1)
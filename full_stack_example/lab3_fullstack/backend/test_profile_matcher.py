@@ -0,0 +1,142 @@
+"""
+The similarity index behind GET /profiles/{user_id}/similar: encoding, ranking,
+vocabulary caps and removal, plus how ProfilesManager keeps it in step with the store.
+    python -m pytest -q test_profile_matcher.py
+"""
+import asyncio
+import math
+import uuid
+
+import pytest
+
+from databases.cache import NullCache
+from managers.profile_manager import ProfilesManager
+from managers.profile_matcher import ProfileMatcher, profile_features
+
+ANN = {"user_id": "ann", "instrument": "Guitar", "experience": "beginner", "goal": "Start a band",
+       "genres": ["rock", "jazz"], "gear": []}
+BOB = {"user_id": "bob", "instrument": "guitar ", "experience": "advanced", "goal": "play in a band",
+       "genres": ["Rock"], "gear": ["amp"]}
+CAT = {"user_id": "cat", "instrument": "piano", "experience": "beginner", "goal": "relax",
+       "genres": ["classical"], "gear": []}
+DAN = {"user_id": "dan", "instrument": "drums", "experience": "pro", "goal": "tour",
+       "genres": ["metal"], "gear": []}
+
+
+def _matcher(*profiles, **kwargs):
+    matcher = ProfileMatcher(initial_rows=2, initial_columns=8, **kwargs)
+    matcher.add_many(profiles)
+    return matcher
+
+
+def test_features_are_normalized_and_goals_split_into_words():
+    assert profile_features(ANN) == [
+        ("instrument", "guitar"), ("experience", "beginner"),
+        ("genres", "rock"), ("genres", "jazz"),
+        ("goal", "start"), ("goal", "band"),
+    ]
+    assert profile_features({"user_id": "x", "genres": ["Rock 'n' Roll ", "rock n roll", None]}) == [
+        ("genres", "rock n roll"),
+    ]
+
+
+def test_similar_ranks_best_first_and_leaves_out_the_user_themselves():
+    matcher = _matcher(ANN, BOB, CAT, DAN)
+    matches = matcher.similar("ann", k=3)
+    assert [p["user_id"] for p, _ in matches] == ["bob", "cat", "dan"]
+    assert [score for _, score in matches] == sorted((score for _, score in matches), reverse=True)
+    assert [p["user_id"] for p, _ in matcher.similar("ann", k=10)] == ["bob", "cat", "dan"]
+    assert matcher.similar("nobody") is None
+
+
+@pytest.mark.parametrize("metric, expected", [
+    # ann and bob have 6 features each (bob: guitar, advanced, rock, amp, play, band)
+    # and share guitar, rock and band
+    ("cosine", 3 / math.sqrt(6 * 6)),
+    ("jaccard", 3 / (6 + 6 - 3)),
+])
+def test_metrics(metric, expected):
+    scores = _matcher(ANN, BOB, DAN).scores("ann", metric)
+    assert scores[0] == pytest.approx(1.0)
+    assert scores[1] == pytest.approx(expected, rel=1e-6)
+    assert scores[2] == 0
+
+
+def test_unknown_metric_is_refused():
+    with pytest.raises(ValueError):
+        _matcher(ANN).scores("ann", "euclid")
+
+
+def test_adding_a_known_user_replaces_their_row():
+    matcher = _matcher(ANN, BOB)
+    matcher.add_many([{**ANN, "genres": ["metal"]}, {**ANN, "instrument": "drums", "goal": "tour", "genres": ["metal"]}])
+    assert len(matcher) == 2
+    assert matcher.similar("bob", k=1)[0][1] == 0
+    assert matcher.scores("ann")[0] == pytest.approx(1.0)
+
+
+def test_a_full_field_drops_only_its_own_new_values():
+    caps = {"instrument": 8, "experience": 8, "goal": 2, "genres": 8, "gear": 8}
+    goals = [{"user_id": f"g{i}", "goal": f"word{i}"} for i in range(5)]
+    matcher = _matcher(*goals, ANN, BOB, max_features=caps)
+    stats = matcher.stats()
+    # Counted per profile that brought one: word2-4, then ann's start and band, bob's play and band
+    assert stats["fields"]["goal"] == {"features": 2, "max_features": 2, "dropped_features": 7}
+    assert stats["fields"]["genres"]["dropped_features"] == 0
+    # Genres and instruments still encode after goals ran out of room
+    assert matcher.similar("ann", k=1)[0][0]["user_id"] == "bob"
+
+
+def test_matrix_is_bit_packed():
+    profiles = [{"user_id": f"u{i}", "gear": [f"gear{j}" for j in range(64)]} for i in range(1024)]
+    matcher = ProfileMatcher(initial_rows=1024)
+    matcher.add_many(profiles)
+    assert matcher.stats()["matrix_bytes"] == 1024 * 64 // 8
+
+
+def test_removed_profiles_stop_matching():
+    matcher = _matcher(ANN, BOB, CAT, DAN)
+    assert matcher.remove("bob")
+    assert not matcher.remove("bob")
+    assert "bob" not in matcher
+    assert [p["user_id"] for p, _ in matcher.similar("ann", k=3)] == ["cat", "dan"]
+    # The last row moved into bob's place and still scores as itself
+    assert matcher.scores("dan")[matcher.row("dan")] == pytest.approx(1.0)
+
+
+def _manager():
+    return ProfilesManager(f"memory://{uuid.uuid4().hex}", "db", "profiles", cache=NullCache())
+
+
+def _similar_ids(manager, user_id):
+    return [m.user_id for m in asyncio.run(manager.similar_profiles(user_id, 10)) or []]
+
+
+def test_deleted_profile_leaves_similar_results():
+    manager = _manager()
+
+    async def scenario():
+        for profile in (ANN, BOB, CAT):
+            await manager.collection.insert_one(dict(profile, name=profile["user_id"]))
+        await manager.load_matcher()
+        doc = await manager.collection.find_one({"user_id": "bob"})
+        await manager.collection.delete_one({"_id": doc["_id"]})
+        # As any bus delivers a deletion: the _id and no document
+        await manager.bus.publish("db", "profiles", str(doc["_id"]), None)
+
+    asyncio.run(scenario())
+    assert _similar_ids(manager, "ann") == ["cat"]
+
+
+def test_reload_drops_profiles_deleted_behind_the_workers_back():
+    manager = _manager()
+
+    async def scenario():
+        for profile in (ANN, BOB, CAT):
+            await manager.collection.insert_one(dict(profile, name=profile["user_id"]))
+        await manager.load_matcher()
+        await manager.collection.delete_many({"user_id": "cat"})
+        await manager.load_matcher()
+
+    asyncio.run(scenario())
+    assert _similar_ids(manager, "ann") == ["bob"]
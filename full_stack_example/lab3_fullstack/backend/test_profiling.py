@@ -0,0 +1,112 @@
+"""
+Per-request profiling: which requests ProfilingMiddleware samples, the
+X-Profile-Id header it adds and the .folded dump it writes.
+Runs on a small app of its own, no server or store needed:
+    python -m pytest -q test_profiling.py
+"""
+import os
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from profiling import ProfilingMiddleware, StackSampler
+
+TOKEN = "secret"
+
+
+def busy_handler_work(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def _app(directory, **kwargs):
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        # Blocks the loop, so the sampler sees this frame on the event-loop stack
+        busy_handler_work(0.05)
+        return {"done": True}
+
+    app.add_middleware(ProfilingMiddleware, token=TOKEN, directory=str(directory), interval_ms=1, **kwargs)
+    return app
+
+
+def _dumps(directory):
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def test_profiled_request_gets_an_id_and_a_folded_dump(tmp_path):
+    with TestClient(_app(tmp_path)) as client:
+        response = client.get("/work", headers={"X-Profile": TOKEN})
+    assert response.status_code == 200
+    dump_id = response.headers["x-profile-id"]
+    assert _dumps(tmp_path) == [f"{dump_id}.folded"]
+    assert profiling.dump_path(dump_id, str(tmp_path)) == str(tmp_path / f"{dump_id}.folded")
+
+    lines = (tmp_path / f"{dump_id}.folded").read_text().splitlines()
+    assert lines
+    for line in lines:
+        # Collapsed-stack format: root;outer;...;inner <count>
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        assert stack.split(";")[0]
+    assert any(line.startswith("event-loop;") and "busy_handler_work" in line for line in lines)
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Profile": "wrong"}])
+def test_requests_without_the_token_are_not_profiled(tmp_path, headers):
+    with TestClient(_app(tmp_path)) as client:
+        response = client.get("/work", headers=headers)
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert _dumps(tmp_path) == []
+
+
+def test_sample_rate_profiles_without_a_token(tmp_path):
+    with TestClient(_app(tmp_path, sample_rate=1.0)) as client:
+        response = client.get("/work")
+    assert _dumps(tmp_path) == [f"{response.headers['x-profile-id']}.folded"]
+
+
+def test_dump_ids_cannot_leave_the_profile_directory(tmp_path):
+    (tmp_path / "inner").mkdir()
+    (tmp_path / "outside.folded").write_text("x 1\n")
+    assert profiling.dump_path("../outside", str(tmp_path / "inner")) is None
+
+
+def test_sampler_is_joined_off_the_event_loop(tmp_path, monkeypatch):
+    joined_on = []
+    join = StackSampler.join
+
+    def recording_join(self):
+        joined_on.append(threading.get_ident())
+        join(self)
+
+    monkeypatch.setattr(StackSampler, "join", recording_join)
+    app = _app(tmp_path)
+    loop_threads = []
+
+    @app.get("/loop")
+    async def loop():
+        loop_threads.append(threading.get_ident())
+
+    with TestClient(app) as client:
+        client.get("/loop", headers={"X-Profile": TOKEN})
+    assert len(joined_on) == 1
+    assert joined_on[0] not in loop_threads
+
+
+def test_stopped_sampler_keeps_its_samples():
+    sampler = StackSampler(threading.get_ident(), interval=0.001)
+    sampler.start()
+    busy_handler_work(0.05)
+    sampler.stop()
+    sampler.join()
+    assert sampler.samples >= 1
+    assert any("busy_handler_work" in stack for stack in sampler.stacks)
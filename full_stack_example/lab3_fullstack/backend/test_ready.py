@@ -0,0 +1,104 @@
+"""
+/ready during and after the background warm-up: 503 until every step is
+done, 200 after, and a failing step retried and reported.
+Runs the app on the in-memory backend:
+    python -m pytest -q test_ready.py
+"""
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(main, "MONGO_URI", f"memory://{uuid.uuid4().hex}")
+    monkeypatch.setattr(main, "STARTUP_RETRY_DELAY", 0)
+    return main.app
+
+
+def _wait_for_warm_up(client):
+    for _ in range(100):
+        body = client.get("/ready").json()
+        if "warm_up" in body["timings_ms"]:
+            return body
+        time.sleep(0.02)
+    raise AssertionError("warm-up never finished")
+
+
+def test_ready_is_503_until_warm_up_finishes(app, monkeypatch):
+    release = threading.Event()
+    ensure_indexes = main._ensure_indexes
+
+    async def slow_indexes():
+        await asyncio.to_thread(release.wait, 5)
+        await ensure_indexes()
+
+    monkeypatch.setattr(main, "_ensure_indexes", slow_indexes)
+    with TestClient(app) as client:
+        waiting = client.get("/ready")
+        assert waiting.status_code == 503
+        assert waiting.json()["ready"] is False
+        assert "warm_up" not in waiting.json()["timings_ms"]
+        # Liveness does not wait for warm-up
+        assert client.get("/ping").status_code == 200
+
+        release.set()
+        body = _wait_for_warm_up(client)
+        ready = client.get("/ready")
+        assert ready.status_code == 200
+    assert body == {**body, "ready": True, "failed": []}
+    assert {"import", "startup", "mongo_pool", "indexes", "profile_matcher", "token_denylist"} <= set(body["timings_ms"])
+
+
+def _flaky(failures):
+    attempts = []
+
+    async def step():
+        attempts.append(time.perf_counter())
+        if len(attempts) <= failures:
+            raise RuntimeError("not yet")
+
+    return step, attempts
+
+
+def test_failing_step_is_retried(app, monkeypatch):
+    step, attempts = _flaky(failures=1)
+    monkeypatch.setattr(main, "_ensure_indexes", step)
+    with TestClient(app) as client:
+        body = _wait_for_warm_up(client)
+        assert client.get("/ready").status_code == 200
+    assert body["failed"] == []
+    assert len(attempts) == 2
+
+
+def test_step_failing_every_attempt_is_reported(app, monkeypatch):
+    monkeypatch.setattr(main, "STARTUP_ATTEMPTS", 3)
+    step, attempts = _flaky(failures=3)
+    monkeypatch.setattr(main, "_ensure_indexes", step)
+    with TestClient(app) as client:
+        body = _wait_for_warm_up(client)
+        assert client.get("/ready").status_code == 503
+    assert body["ready"] is False
+    assert body["failed"] == ["indexes"]
+    assert len(attempts) == 3
+    # The other steps still ran
+    assert {"mongo_pool", "profile_matcher", "token_denylist"} <= set(body["timings_ms"])
+
+
+def test_restarted_app_forgets_an_earlier_failed_warm_up(app, monkeypatch):
+    step, _ = _flaky(failures=10)
+    monkeypatch.setattr(main, "_ensure_indexes", step)
+    with TestClient(app) as client:
+        assert _wait_for_warm_up(client)["failed"] == ["indexes"]
+    monkeypatch.undo()
+    monkeypatch.setattr(main, "MONGO_URI", f"memory://{uuid.uuid4().hex}")
+    with TestClient(app) as client:
+        body = _wait_for_warm_up(client)
+        assert client.get("/ready").status_code == 200
+    assert body["failed"] == []
@@ -0,0 +1,129 @@
+"""
+The recommendation job's incremental reruns: what they pick to recompute,
+and that they store the same lists a --full run would.
+Runs against a temporary SQLite store, no server needed:
+    python -m pytest -q test_recommendation_job.py
+"""
+import asyncio
+import random
+
+import numpy as np
+import pytest
+
+from databases.registry import registry
+from managers import recommendation_job
+from managers.profile_matcher import ProfileMatcher
+from managers.recommendation_job import plan, thresholds
+
+K = 3
+INSTRUMENTS = ["guitar", "bass", "drums", "piano"]
+GENRES = ["rock", "jazz", "pop", "folk", "metal", "blues"]
+
+
+def _profile(user_id, rng):
+    return {"user_id": user_id, "name": user_id, "instrument": rng.choice(INSTRUMENTS),
+            "experience": rng.choice(["beginner", "advanced"]), "goal": rng.choice(["band", "fun", "teach"]),
+            "genres": rng.sample(GENRES, rng.randint(1, 3)), "gear": []}
+
+
+async def _apply(uri, insert=(), update=(), delete=()):
+    profiles = registry.collection(uri, "db", "profiles")
+    try:
+        for profile in insert:
+            await profiles.insert_one(dict(profile))
+        for profile in update:
+            await profiles.update_one({"user_id": profile["user_id"]}, {"$set": profile})
+        for user_id in delete:
+            await profiles.delete_one({"user_id": user_id})
+    finally:
+        registry.close()
+
+
+async def _stored(uri):
+    recommendations = registry.collection(uri, "db", "recommendations")
+    try:
+        return {doc["user_id"]: [(i["user_id"], i["score"]) for i in doc["items"]]
+                async for doc in recommendations.find({})}
+    finally:
+        registry.close()
+
+
+def _run(uri, full=False, workers=1):
+    return asyncio.run(recommendation_job.run(uri, "db", K, "cosine", workers, full, batch_size=7))
+
+
+def _comparable(lists):
+    """
+    Per user, the scores in order and who scores above the last entry.
+    Who fills a tie for last place is arbitrary, so it is left out.
+    """
+    out = {}
+    for user_id, items in lists.items():
+        scores = [score for _, score in items]
+        out[user_id] = (scores, {other for other, score in items if len(items) < K or score > scores[-1]})
+    return out
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_incremental_rerun_matches_a_full_run(sqlite_registry, workers):
+    uri = sqlite_registry
+    rng = random.Random(7)
+    users = [f"u{i:02d}" for i in range(40)]
+    asyncio.run(_apply(uri, insert=[_profile(u, rng) for u in users]))
+    first = _run(uri, workers=workers)
+    assert first["recomputed"] == 40
+
+    changed = [_profile(u, rng) for u in users[:4]]
+    added = [_profile(f"new{i}", rng) for i in range(3)]
+    asyncio.run(_apply(uri, insert=added, update=changed, delete=users[-3:]))
+    second = _run(uri, workers=workers)
+    incremental = asyncio.run(_stored(uri))
+
+    assert second["removed"] == 3
+    assert second["changed"] == 7
+    assert 7 <= second["recomputed"] < 40
+    assert set(incremental) == set(users[:-3]) | {p["user_id"] for p in added}
+    assert all(u not in dict(items) for items in incremental.values() for u in users[-3:])
+
+    full = _run(uri, full=True, workers=workers)
+    assert full["recomputed"] == 40
+    assert _comparable(incremental) == _comparable(asyncio.run(_stored(uri)))
+
+
+def test_rerun_without_changes_recomputes_nobody(sqlite_registry):
+    rng = random.Random(3)
+    asyncio.run(_apply(sqlite_registry, insert=[_profile(f"u{i}", rng) for i in range(10)]))
+    _run(sqlite_registry)
+    again = _run(sqlite_registry)
+    assert (again["changed"], again["stale"], again["recomputed"], again["writes"]) == (0, 0, 0, 0)
+
+
+def _previous(fingerprint, *items):
+    return {"fingerprint": fingerprint, "items": [{"user_id": u, "score": s} for u, s in items]}
+
+
+def test_plan_sorts_users_into_changed_stale_and_removed():
+    fingerprints = {"a": "a1", "b": "b2", "c": "c1", "d": "d1", "new": "n1"}
+    previous = {
+        "a": _previous("a1", ("c", 0.5)),             # unchanged, list untouched
+        "b": _previous("b1", ("a", 0.5)),             # own fingerprint moved
+        "c": _previous("c1", ("b", 0.9)),             # lists a changed profile
+        "d": _previous("d1", ("gone", 0.9)),          # lists a deleted profile
+        "gone": _previous("g1", ("a", 0.1)),
+    }
+    assert plan(fingerprints, previous, full=False) == ({"b", "new"}, {"c", "d"}, {"gone"})
+    assert plan(fingerprints, previous, full=True) == (set(fingerprints), set(), {"gone"})
+
+
+def test_thresholds_come_from_the_last_entry_of_full_lists():
+    matcher = ProfileMatcher()
+    matcher.add_many([{"user_id": u} for u in ("full", "short", "none")])
+    previous = {
+        "full": _previous("x", ("a", 0.9), ("b", 0.4)),
+        "short": _previous("x", ("a", 0.9)),
+    }
+    limits = thresholds(matcher, previous, k=2, full=False)
+    by_user = dict(zip(matcher.user_ids(), limits.tolist()))
+    # Beat 0.4 to enter a full list, anything enters a short one; users without a list are recomputed anyway
+    assert by_user == pytest.approx({"full": 0.4, "short": -np.inf, "none": np.inf})
+    assert np.isinf(thresholds(matcher, previous, k=2, full=True)).all()
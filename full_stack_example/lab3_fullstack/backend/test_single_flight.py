@@ -0,0 +1,113 @@
+"""
+Identical concurrent reads share one query; writes detach the in-flight ones.
+    python -m pytest -q test_single_flight.py
+"""
+import asyncio
+
+import pytest
+
+from databases.single_flight import SingleFlight
+
+
+class Query:
+    """A read that blocks until released, counting how often it was issued"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        n = self.calls
+        await self.release.wait()
+        return [{"n": n}]
+
+
+async def _started(*tasks):
+    # Let every task run up to its first await
+    await asyncio.sleep(0)
+    return tasks
+
+
+def test_concurrent_calls_share_one_query_and_get_their_own_copy():
+    async def scenario():
+        flights, query = SingleFlight("t"), Query()
+        query.release = asyncio.Event()
+        tasks = await _started(*(asyncio.create_task(flights.do("k", query, copy=list)) for _ in range(5)))
+        query.release.set()
+        results = await asyncio.gather(*tasks)
+        return flights, query, results
+
+    flights, query, results = asyncio.run(scenario())
+    assert query.calls == 1
+    assert all(r == [{"n": 1}] for r in results)
+    results[0].append("mutated")
+    assert results[1] == [{"n": 1}]
+    assert flights.stats()["queries"] == 1
+    assert flights.stats()["deduplicated"] == 4
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_different_keys_do_not_share():
+    async def scenario():
+        flights, query = SingleFlight("t"), Query()
+        query.release = asyncio.Event()
+        tasks = await _started(asyncio.create_task(flights.do("a", query)), asyncio.create_task(flights.do("b", query)))
+        query.release.set()
+        await asyncio.gather(*tasks)
+        return query
+
+    assert asyncio.run(scenario()).calls == 2
+
+
+def test_forget_makes_later_callers_start_a_new_query():
+    async def scenario():
+        flights, query = SingleFlight("t"), Query()
+        query.release = asyncio.Event()
+        (before,) = await _started(asyncio.create_task(flights.do("k", query)))
+        # A write lands here
+        flights.forget()
+        (after,) = await _started(asyncio.create_task(flights.do("k", query)))
+        query.release.set()
+        return query, await before, await after
+
+    query, before, after = asyncio.run(scenario())
+    assert query.calls == 2
+    assert before == [{"n": 1}]
+    assert after == [{"n": 2}]
+
+
+def test_error_reaches_every_caller_and_is_not_kept():
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        flights = SingleFlight("t")
+        results = await asyncio.gather(*(flights.do("k", failing) for _ in range(3)), return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await flights.do("k", failing)
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_query_for_others():
+    async def scenario():
+        flights, query = SingleFlight("t"), Query()
+        query.release = asyncio.Event()
+        leader, follower = await _started(asyncio.create_task(flights.do("k", query)),
+                                          asyncio.create_task(flights.do("k", query)))
+        leader.cancel()
+        query.release.set()
+        return query, await follower, leader
+
+    query, result, leader = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert result == [{"n": 1}]
+    assert query.calls == 1
@@ -0,0 +1,187 @@
+"""
+The embedded SQLite storage backend answers the app's queries the way MongoDB does.
+Each test gets its own database file:
+    python -m pytest -q test_sqlite_backend.py
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from databases.sqlite import SQLiteClient
+
+BOOKS = [
+    {"title": "Dune", "author": "Frank Herbert", "year": 1965, "genre": "sci-fi", "tags": ["desert", "classic"]},
+    {"title": "Dune Messiah", "author": "Frank Herbert", "year": 1969, "genre": "sci-fi", "tags": ["desert"]},
+    {"title": "Emma", "author": "Jane Austen", "year": 1815, "genre": "novel", "tags": ["classic"]},
+    {"title": "Untitled", "author": "Anon", "year": "unknown", "genre": "novel"},
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "test.db")
+
+
+def _run(path, scenario):
+    """Run scenario(collection) against a fresh client on `path`"""
+    async def main():
+        client = SQLiteClient(path)
+        try:
+            return await scenario(client["db"]["books"])
+        finally:
+            client.close()
+    return asyncio.run(main())
+
+
+async def _seeded(books):
+    await books.create_indexes([IndexModel([("author", ASCENDING)], name="author"),
+                                IndexModel([("title", TEXT), ("author", TEXT)], name="title_author_text")])
+    await books.insert_many([dict(b) for b in BOOKS])
+    return books
+
+
+async def _titles(cursor):
+    return [doc["title"] async for doc in cursor]
+
+
+def test_documents_round_trip_with_their_types(path):
+    oid, when = ObjectId(), datetime(2024, 5, 1, 12, 30)
+
+    async def scenario(books):
+        await books.insert_one({"_id": oid, "title": "Dune", "added": when, "ref": ObjectId("0" * 24)})
+        return await books.find_one({"_id": oid})
+
+    assert _run(path, scenario) == {"_id": oid, "title": "Dune", "added": when, "ref": ObjectId("0" * 24)}
+
+
+@pytest.mark.parametrize("query, titles", [
+    ({"author": "Frank Herbert"}, ["Dune", "Dune Messiah"]),
+    ({"genre": {"$in": ["novel"]}}, ["Emma", "Untitled"]),
+    # Range operators only match values of the argument's type, as in MongoDB
+    ({"year": {"$gte": 1900, "$lte": 1966}}, ["Dune"]),
+    ({"year": {"$lt": 1900}}, ["Emma"]),
+    ({"tags": "classic"}, ["Dune", "Emma"]),
+    ({"author": "Frank Herbert", "year": {"$gt": 1965}}, ["Dune Messiah"]),
+    ({"missing": "x"}, []),
+])
+def test_filters(path, query, titles):
+    async def scenario(books):
+        await _seeded(books)
+        return await _titles(books.find(query).sort("_id", 1))
+
+    assert _run(path, scenario) == titles
+
+
+def test_sort_skip_limit_and_projection(path):
+    async def scenario(books):
+        await _seeded(books)
+        page = await books.find({"genre": "sci-fi"}, {"title": 1}).sort([("year", -1), ("_id", 1)]).limit(1).to_list()
+        skipped = await _titles(books.find({}).sort("title", 1).skip(1).limit(2))
+        return page, skipped
+
+    page, skipped = _run(path, scenario)
+    assert [set(doc) for doc in page] == [{"_id", "title"}]
+    assert page[0]["title"] == "Dune Messiah"
+    assert skipped == ["Dune Messiah", "Emma"]
+
+
+def test_text_search_ranks_by_score(path):
+    async def scenario(books):
+        await _seeded(books)
+        cursor = books.find({"$text": {"$search": "dune herbert"}}, {"score": {"$meta": "textScore"}})
+        return await cursor.sort([("score", {"$meta": "textScore"}), ("_id", 1)]).to_list()
+
+    docs = _run(path, scenario)
+    assert [d["title"] for d in docs] == ["Dune", "Dune Messiah"]
+    assert docs[0]["score"] > 0
+
+
+def test_indexed_query_is_not_a_collection_scan(path):
+    async def scenario(books):
+        await _seeded(books)
+        indexed = await books.find({"author": "Anon"}).explain()
+        scanned = await books.find({"genre": "novel"}).explain()
+        return indexed["queryPlanner"]["winningPlan"]["stage"], scanned["queryPlanner"]["winningPlan"]["stage"]
+
+    assert _run(path, scenario) == ("IXSCAN", "COLLSCAN")
+
+
+def test_unique_index_rejects_duplicates_and_can_be_dropped(path):
+    unique = [IndexModel([("title", ASCENDING)], unique=True, name="title_unique")]
+
+    async def scenario(books):
+        await books.create_indexes(unique)
+        await books.insert_one({"title": "Dune"})
+        with pytest.raises(DuplicateKeyError):
+            await books.insert_one({"title": "Dune"})
+        await books.drop_index("title_unique")
+        await books.insert_one({"title": "Dune"})
+        # Building it over duplicates fails like MongoDB's createIndexes
+        with pytest.raises(DuplicateKeyError) as failed:
+            await books.create_indexes(unique)
+        return failed.value.code, await books.count_documents({"title": "Dune"})
+
+    assert _run(path, scenario) == (11000, 2)
+
+
+def test_updates_and_upserts(path):
+    async def scenario(books):
+        oid = (await books.insert_one({"title": "Dune", "year": 1965})).inserted_id
+        after = await books.find_one_and_update({"_id": oid}, {"$set": {"year": 1966}, "$inc": {"prints": 1}},
+                                                return_document=ReturnDocument.AFTER)
+        await books.update_one({"_id": "counter"}, {"$inc": {"v": 1}, "$push": {"log": {"$each": [1, 2, 3], "$slice": -2}}},
+                               upsert=True)
+        await books.update_one({"_id": "counter"}, {"$inc": {"v": 1}, "$push": {"log": {"$each": [4], "$slice": -2}}},
+                               upsert=True)
+        missing = await books.find_one_and_update({"_id": ObjectId()}, {"$set": {"year": 1}})
+        return after, await books.find_one({"_id": "counter"}), missing
+
+    after, counter, missing = _run(path, scenario)
+    assert (after["year"], after["prints"]) == (1966, 1)
+    assert counter == {"_id": "counter", "v": 2, "log": [3, 4]}
+    assert missing is None
+
+
+def test_unordered_bulk_write_reports_failures_by_index_and_keeps_the_rest(path):
+    async def scenario(books):
+        await books.create_indexes([IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique")])
+        await books.insert_one({"user_id": "taken"})
+        ops = [UpdateOne({"user_id": "a"}, {"$set": {"n": 1}}, upsert=True),
+               InsertOne({"user_id": "taken"}),
+               UpdateOne({"user_id": "taken"}, {"$set": {"n": 2}}, upsert=True)]
+        with pytest.raises(BulkWriteError) as failed:
+            await books.bulk_write(ops, ordered=False)
+        stored = {doc["user_id"]: doc.get("n") async for doc in books.find({})}
+        return failed.value.details, stored
+
+    details, stored = _run(path, scenario)
+    assert [e["index"] for e in details["writeErrors"]] == [1]
+    assert details["nUpserted"] == 1 and details["nModified"] == 1
+    assert stored == {"taken": 2, "a": 1}
+
+
+def test_delete_many(path):
+    async def scenario(books):
+        await _seeded(books)
+        deleted = await books.delete_many({"genre": {"$in": ["novel"]}})
+        return deleted.deleted_count, await _titles(books.find({}).sort("_id", 1))
+
+    assert _run(path, scenario) == (2, ["Dune", "Dune Messiah"])
+
+
+def test_workers_sharing_the_file_see_each_others_writes(path):
+    async def scenario(books):
+        other = SQLiteClient(path)
+        try:
+            await books.insert_one({"title": "Dune"})
+            seen = await other["db"]["books"].find_one({"title": "Dune"})
+            await other["db"]["books"].update_one({"title": "Dune"}, {"$set": {"year": 1965}})
+            return seen is not None, (await books.find_one({"title": "Dune"}))["year"]
+        finally:
+            other.close()
+
+    assert _run(path, scenario) == (True, 1965)
@@ -0,0 +1,70 @@
+"""
+A token revoked on one worker is denied on every worker, including ones started later.
+Two UserManagers with their own polling buses on one in-memory store play two workers:
+    python -m pytest -q test_token_denylist.py
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+from databases.invalidation import InvalidationBus, VersionPollBus
+from managers.token_cache import TokenDenylist, token_id
+from managers.user_manager import UserManager
+from models.user_model import UserOut
+
+POLL = 0.02
+
+
+def test_denylist_forgets_tokens_once_they_expire():
+    denylist = TokenDenylist()
+    denylist.revoke(token_id("old"), time.time() - 1)
+    denylist.revoke(token_id("live"), time.time() + 60)
+    assert denylist.is_revoked("live")
+    assert not denylist.is_revoked("old")
+    assert len(denylist) == 1
+
+
+def test_revocation_reaches_other_workers_and_later_ones():
+    uri = f"memory://{uuid.uuid4().hex}"
+
+    async def scenario():
+        buses = [VersionPollBus(uri, POLL), VersionPollBus(uri, POLL)]
+        here, there = (UserManager(uri, "db", "users", bus=bus) for bus in buses)
+        for bus in buses:
+            await bus.start()
+        await asyncio.sleep(POLL * 5)
+        token, other = here.create_token("0" * 24, "a@example.com"), here.create_token("1" * 24, "b@example.com")
+        # The other worker has already verified the token and would answer it from its cache
+        now = datetime.utcnow()
+        user = UserOut(id="0" * 24, email="a@example.com", name="A", created_at=now, updated_at=now)
+        there.token_cache.put(token, user, time.time() + 60)
+        await here.revoke_token(token)
+        revoked_here = here.denylist.is_revoked(token)
+        await asyncio.sleep(POLL * 5)
+        with pytest.raises(ValueError, match="revoked"):
+            await there.user_from_token(token)
+        for bus in buses:
+            await bus.stop()
+        later = UserManager(uri, "db", "users", bus=InvalidationBus())
+        await later.load_denylist()
+        return revoked_here, there, later, token, other
+
+    revoked_here, there, later, token, other = asyncio.run(scenario())
+    assert revoked_here
+    assert there.denylist.is_revoked(token)
+    assert later.denylist.is_revoked(token)
+    assert not later.denylist.is_revoked(other)
+
+
+def test_revoked_token_is_refused():
+    async def scenario():
+        users = UserManager(f"memory://{uuid.uuid4().hex}", "db", "users")
+        token = users.create_token("0" * 24, "a@example.com")
+        await users.revoke_token(token)
+        with pytest.raises(ValueError, match="revoked"):
+            await users.user_from_token(token)
+
+    asyncio.run(scenario())
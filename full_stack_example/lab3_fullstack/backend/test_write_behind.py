@@ -0,0 +1,152 @@
+"""
+Group commit: one batch write for many callers, each answered with its own result.
+Runs against the in-memory backend, no server needed:
+    python -m pytest -q test_write_behind.py
+"""
+import asyncio
+import uuid
+
+from pymongo.errors import WriteError
+
+from databases.cache import NullCache
+from databases.invalidation import VersionPollBus
+from databases.registry import registry
+from databases.versions import VERSIONS_COLLECTION
+from databases.write_behind import GroupCommit
+from managers.books_manager import BooksManager
+from models.books_model import BookCreate
+
+
+class BatchWriter:
+    """Records every batch and answers each item, or fails the ones listed in `fail`"""
+
+    def __init__(self, fail=()):
+        self.batches = []
+        self.fail = set(fail)
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(0)
+        return [WriteError(f"bad {item}") if item in self.fail else f"stored {item}" for item in items]
+
+
+def _commit(writer, window=0.01, max_batch=100, key=None):
+    return GroupCommit("t", writer, window, max_batch, key)
+
+
+def test_writes_within_the_window_share_one_batch():
+    async def scenario():
+        writer = BatchWriter()
+        group = _commit(writer)
+        results = await asyncio.gather(*(group.submit(i) for i in range(5)))
+        return writer, group, results
+
+    writer, group, results = asyncio.run(scenario())
+    assert writer.batches == [[0, 1, 2, 3, 4]]
+    assert results == [f"stored {i}" for i in range(5)]
+    assert group.stats()["batches"] == 1
+
+
+def test_full_batch_is_written_without_waiting_for_the_window():
+    async def scenario():
+        writer = BatchWriter()
+        group = _commit(writer, window=60, max_batch=2)
+        results = await asyncio.wait_for(asyncio.gather(group.submit("a"), group.submit("b")), 1)
+        return writer, results
+
+    writer, results = asyncio.run(scenario())
+    assert writer.batches == [["a", "b"]]
+    assert results == ["stored a", "stored b"]
+
+
+def test_each_caller_gets_only_its_own_error():
+    async def scenario():
+        group = _commit(BatchWriter(fail={"b"}))
+        return await asyncio.gather(*(group.submit(i) for i in "abc"), return_exceptions=True)
+
+    a, b, c = asyncio.run(scenario())
+    assert a == "stored a" and c == "stored c"
+    assert isinstance(b, WriteError)
+
+
+def test_failed_batch_fails_every_caller():
+    async def broken(items):
+        raise RuntimeError("connection lost")
+
+    async def scenario():
+        group = _commit(broken)
+        return group, await asyncio.gather(*(group.submit(i) for i in range(3)), return_exceptions=True)
+
+    group, results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert group.stats()["failed"] == 3
+
+
+def test_missing_results_fail_their_callers_instead_of_hanging():
+    async def short(items):
+        return [f"stored {item}" for item in items[:-1]]
+
+    async def scenario():
+        group = _commit(short)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(group.submit(i) for i in "abc"), return_exceptions=True), 1)
+        return group, results
+
+    group, (a, b, c) = asyncio.run(scenario())
+    assert (a, b) == ("stored a", "stored b")
+    assert isinstance(c, RuntimeError)
+    assert group.stats()["failed"] == 1
+
+
+def test_same_key_writes_land_in_separate_batches_in_order():
+    async def scenario():
+        writer = BatchWriter()
+        group = _commit(writer, key=lambda item: item.split("-")[0])
+        await asyncio.gather(group.submit("u1-first"), group.submit("u2"), group.submit("u1-second"))
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert writer.batches == [["u1-first", "u2"], ["u1-second"]]
+
+
+def test_close_writes_what_is_still_waiting():
+    async def scenario():
+        writer = BatchWriter()
+        group = _commit(writer, window=60)
+        pending = asyncio.ensure_future(group.submit("late"))
+        await asyncio.sleep(0)
+        await group.close()
+        return writer, await pending
+
+    writer, result = asyncio.run(scenario())
+    assert writer.batches == [["late"]]
+    assert result == "stored late"
+
+
+class _FailingVersions:
+    async def find_one_and_update(self, *args, **kwargs):
+        raise RuntimeError("versions unavailable")
+
+
+def test_version_bump_failure_does_not_fail_stored_creates(monkeypatch):
+    """The books are stored; a lost version bump only delays other workers"""
+    monkeypatch.setenv("BOOKS_WRITE_BEHIND_MS", "5")
+    uri = f"memory://{uuid.uuid4().hex}"
+    collection = registry.collection
+    monkeypatch.setattr(registry, "collection", lambda u, db, name: _FailingVersions()
+                        if name == VERSIONS_COLLECTION else collection(u, db, name))
+
+    async def scenario():
+        books = BooksManager(uri, "db", "books", cache=NullCache(), bus=VersionPollBus(uri))
+        await books.connect()
+        new = [BookCreate(title=f"t{i}", author="a", year=2000) for i in range(3)]
+        created = await asyncio.gather(*(books.create_book(book) for book in new))
+        stored = [doc async for doc in books.collection.find({})]
+        await books.close()
+        return books, created, stored
+
+    books, created, stored = asyncio.run(scenario())
+    assert [b.title for b in created] == ["t0", "t1", "t2"]
+    assert len(stored) == 3
+    assert books.writes.stats()["failed"] == 0
+    assert books.bus.stats()["errors"] == 1
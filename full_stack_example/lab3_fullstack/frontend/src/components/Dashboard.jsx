@@ -8,6 +8,9 @@ const API_BASE = (
   "/api"
 ).replace(/\/+$/, "");
 
+// Books per GET /books request; the server caps it at BOOKS_PAGE_MAX
+const PAGE_SIZE = 1000;
+
 export default function Dashboard() {
   const navigate = useNavigate();
   const location = useLocation();
@@ -30,17 +33,24 @@ export default function Dashboard() {
 
   const show = (v) => (v === 0 || v ? String(v) : "—");
 
-  // Load list once
+  // Load list once, following X-Next-After until the last page
   useEffect(() => {
     let cancelled = false;
     (async () => {
       try {
         setListLoading(true);
         setListError("");
-        const res = await fetch(`${API_BASE}/books`);
-        if (!res.ok) throw new Error(`List fetch failed: ${res.status}`);
-        const data = await res.json();
-        if (!cancelled) setBooks(data);
+        const loaded = [];
+        let after = null;
+        do {
+          const query = new URLSearchParams({ limit: String(PAGE_SIZE) });
+          if (after) query.set("after", after);
+          const res = await fetch(`${API_BASE}/books?${query}`);
+          if (!res.ok) throw new Error(`List fetch failed: ${res.status}`);
+          loaded.push(...(await res.json()));
+          if (!cancelled) setBooks([...loaded]);
+          after = res.headers.get("X-Next-After");
+        } while (after && !cancelled);
       } catch (err) {
         if (!cancelled) setListError(err?.message || "Failed to load books.");
       } finally {